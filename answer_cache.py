@@ -0,0 +1,302 @@
+"""
+A cache of Gemini tutoring answers.
+
+Students keep asking the same few questions ("how do I calculate UIB for year 3?") about tables of the same few
+shapes, so answers are cached by what they depend on rather than by table: the normalized question, the blank
+cell's column, where its year falls and its deferment phase (see table_structure()), the word problem template,
+the lecture material passages and the prompt level. The numbers of the table an answer was written for are
+replaced by placeholders relative to the blank cell (answer_template()), and fill_answer() puts in the numbers of
+the table it is served for; answers quoting an amount that is not in their table are not cached.
+
+Entries expire after a TTL and the least recently used ones are evicted beyond a maximum size. The cache is written
+through to a local SQLite file (ANSWER_CACHE_PATH, or answer_cache.db) so it survives restarts, and it is shared by
+the gunicorn worker processes: a worker reads an answer it does not hold in memory from the file, so an answer
+generated by one worker is served by all. The file is opened (in WAL mode, like jobs.JobStore) and loaded on first
+use, so importing the app (e.g. for benchmarks) does not touch it.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import tracing
+from prompt_builder import COLUMNS, TABLE_ROWS
+
+log = logging.getLogger(__name__)
+
+CACHE_PATH = os.environ.get(
+    "ANSWER_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "answer_cache.db")
+)
+
+ANSWER_CACHE = tracing.counter("ie201_answer_cache_requests_total", "Answer cache lookups by result.", ("result",))
+SAVED_SECONDS = tracing.counter(
+    "ie201_answer_cache_saved_seconds_total", "Gemini latency saved by answer cache hits (as measured on the miss)."
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    key TEXT PRIMARY KEY,
+    answer TEXT NOT NULL,
+    latency REAL NOT NULL,
+    created REAL NOT NULL
+)
+"""
+
+
+def normalize_question(question):
+    """Lower-case the question and drop punctuation and extra whitespace."""
+    return " ".join(re.sub(r"[^\w\s]", " ", question.lower()).split())
+
+
+# A number, with its thousands separators and decimals
+NUMBER = re.compile(r"(?<![\w.])(\d{1,3}(?:,\d{3})+|\d+)(\.\d+)?(?!\w)")
+# Text just before a year number ("Year 3", "years 2 and 3")
+YEAR_BEFORE = re.compile(r"\byears?\s*(?:\d+\s*(?:,|and|or|to|through|-|–)\s*)*$", re.IGNORECASE)
+YEARS_AFTER = re.compile(r"\s*years?\b", re.IGNORECASE)
+PERCENT_AFTER = re.compile(r"\s*%")
+# ⟦name__<c if the number has thousands separators><decimals>⟧, e.g. ⟦UB_m1__c2⟧ for the UB of the year before
+# the blank cell's, written like 1,234.56
+PLACEHOLDER = re.compile(r"⟦(\w+?)__(c?)(\d+)⟧")
+
+
+def table_structure(table):
+    """
+    What an answer about a LoanTable depends on besides its numbers: the blank column, where the blank year falls
+    (first, middle or last year, and whether the prompt's first rows show it) and its deferment phase.
+    """
+    year, deferment_years = table.blank_year, table.deferment_years
+    position = "first" if year == 1 else "last" if year == len(table) else "middle"
+    if year <= deferment_years:
+        phase = "deferment"
+    elif year == deferment_years + 1:
+        phase = "first payment"
+    else:
+        phase = "repayment"
+    return [table.blank_column, position, year <= TABLE_ROWS, phase]
+
+
+def _loan_values(table):
+    return {
+        "P": table.initial_balance,
+        "A": table.loan_payment,
+        "i": table.interest_rate,  # Percent
+        "r": table.interest_rate / 100,
+        "n": len(table),
+        "d": table.deferment_years,
+        "nd": len(table) - table.deferment_years,
+    }
+
+
+def _matches(candidate, value, decimals):
+    """Whether value is candidate written with the given number of decimals."""
+    return abs(candidate - value) <= 0.5 * 10 ** -decimals + 1e-9
+
+
+def _relative(name, offset):
+    return f"{name}_{'m' if offset < 0 else 'p'}{abs(offset)}"
+
+
+def _placeholder_name(text, match, table, values):
+    """The placeholder name for a number in text, "" to keep it as it is, or None for an amount not in the table."""
+    whole, fraction = match.groups()
+    value = float(whole.replace(",", "") + (fraction or ""))
+    decimals = len(fraction) - 1 if fraction else 0
+    if YEAR_BEFORE.search(text[max(0, match.start() - 40):match.start()]):
+        if fraction is None and 1 <= value <= len(table):
+            return _relative("Y", int(value) - table.blank_year)
+        return ""
+    after = text[match.end():match.end() + 8]
+    if PERCENT_AFTER.match(after):
+        return "i" if _matches(values["i"], value, decimals) else ""
+    if fraction is None and YEARS_AFTER.match(after):
+        names = [name for name in ("n", "d", "nd") if values[name] == value]
+        # A count that is none of the loan's periods is kept; one that is several of them cannot be told apart
+        return "" if not names else names[0] if len(names) == 1 else None
+    if fraction is None and "," not in whole and value < 100:
+        return ""  # A small count (steps, decimal places)
+    if value < 1 and _matches(values["r"], value, decimals):
+        return "r"
+    for name in ("P", "A"):
+        if _matches(values[name], value, decimals):
+            return name
+    # Cells of the years nearest the blank cell's first (equal cells, e.g. UBA and the next year's UB, are
+    # equal in every table of the same structure)
+    for year in sorted(range(1, len(table) + 1), key=lambda year: abs(year - table.blank_year)):
+        for column in COLUMNS:
+            if _matches(table.value(year, column, reveal=True), value, decimals):
+                return _relative(column, year - table.blank_year)
+    return None
+
+
+def answer_template(text, table):
+    """
+    Replace the numbers of a LoanTable in text (cells, loan details, years, periods) with placeholders.
+    :return: The template, or None if text quotes an amount that is not one of the table's numbers.
+    """
+    values = _loan_values(table)
+    parts, end = [], 0
+    for match in NUMBER.finditer(text):
+        name = _placeholder_name(text, match, table, values)
+        if name is None:
+            return None
+        if name:
+            whole, fraction = match.groups()
+            decimals = len(fraction) - 1 if fraction else 0
+            parts += [text[end:match.start()], f"⟦{name}__{'c' if ',' in whole else ''}{decimals}⟧"]
+            end = match.end()
+    parts.append(text[end:])
+    return "".join(parts)
+
+
+def fill_answer(template, table):
+    """Put the numbers of a LoanTable into a template from answer_template(); None if it lacks a year used."""
+    values = _loan_values(table)
+
+    def number(match):
+        name, comma, decimals = match.groups()
+        if name in values:
+            value = values[name]
+        else:
+            column, offset = name.rsplit("_", 1)
+            year = table.blank_year + (-1 if offset[0] == "m" else 1) * int(offset[1:])
+            if not 1 <= year <= len(table):
+                raise LookupError(name)
+            value = year if column == "Y" else table.value(year, column, reveal=True)
+        return format(value, f"{comma and ','}.{decimals}f")
+
+    try:
+        return PLACEHOLDER.sub(number, template)
+    except LookupError:
+        return None
+
+
+def answer_key(question, table, story, passages=(), prompt_level=1):
+    """
+    The cache key of a question about a LoanTable, the same for every table of the same structure.
+    :param story: The word problem; only its wording counts (the template, for stories from story_templates).
+    :param passages: The lecture material passages added to the prompt.
+    """
+    payload = json.dumps([
+        normalize_question(answer_template(question, table) or question),
+        table_structure(table),
+        answer_template(story, table) or story,
+        [[source, passage] for _, source, passage in passages],
+        prompt_level,
+    ])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    def __init__(self, path=CACHE_PATH, max_entries=1000, ttl=7 * 24 * 3600):
+        """
+        :param path: SQLite file to persist answers in, or None to keep them in memory only.
+        :param max_entries: Maximum number of answers kept.
+        :param ttl: Seconds an answer stays valid.
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (answer, latency, created), least recently used first
+        self._lock = threading.Lock()
+        self._db = None
+        self._opened = False
+        tracing.gauge("ie201_answer_cache_entries", "Answers held in the answer cache.", lambda: len(self))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached answer, or None."""
+        with self._lock:
+            self._open()
+            entry = self._entries.get(key)
+            if entry is None:
+                # Another worker process may have cached it since this one loaded the file
+                entry = self._read(key)
+            if entry is not None and entry[2] < time.time() - self.ttl:
+                self._delete([key])
+                entry = None
+            if entry is None:
+                ANSWER_CACHE.inc("miss")
+                return None
+            self._entries.move_to_end(key)
+        ANSWER_CACHE.inc("hit")
+        SAVED_SECONDS.inc(amount=entry[1])
+        return entry[0]
+
+    def put(self, key, answer, latency):
+        """Cache an answer that took latency seconds to generate."""
+        entry = (answer, latency, time.time())
+        with self._lock:
+            self._open()
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            if self._db is not None:
+                try:
+                    with self._db:
+                        self._db.execute("INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?)", (key, *entry))
+                except sqlite3.Error as e:
+                    log.warning("Could not persist cached answer: %s", e)
+            self._evict()
+
+    def _open(self):
+        """Open the SQLite file and load its answers, once (called with the lock held)."""
+        if self._opened:
+            return
+        self._opened = True
+        if not self.path:
+            return
+        try:
+            self._db = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(SCHEMA)
+            self._load()
+        except sqlite3.Error as e:
+            log.warning("Answer cache %s unavailable, keeping answers in memory only: %s", self.path, e)
+            self._db = None
+
+    def _load(self):
+        cutoff = time.time() - self.ttl
+        with self._db:
+            self._db.execute("DELETE FROM answers WHERE created < ?", (cutoff,))
+        rows = self._db.execute(
+            "SELECT key, answer, latency, created FROM answers ORDER BY created DESC LIMIT ?", (self.max_entries,)
+        ).fetchall()
+        for key, answer, latency, created in reversed(rows):
+            self._entries[key] = (answer, latency, created)
+
+    def _read(self, key):
+        """The entry for key in the SQLite file, now also held in memory, or None (called with the lock held)."""
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute("SELECT answer, latency, created FROM answers WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error as e:
+            log.warning("Could not read cached answer: %s", e)
+            return None
+        if row is None:
+            return None
+        self._entries[key] = entry = tuple(row)
+        self._evict()
+        return entry
+
+    def _evict(self):
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            evicted.append(self._entries.popitem(last=False)[0])
+        self._delete(evicted)
+
+    def _delete(self, keys):
+        for key in keys:
+            self._entries.pop(key, None)
+        if keys and self._db is not None:
+            try:
+                with self._db:
+                    self._db.executemany("DELETE FROM answers WHERE key = ?", [(key,) for key in keys])
+            except sqlite3.Error as e:
+                log.warning("Could not delete cached answers: %s", e)
@@ -0,0 +1,399 @@
+"""
+Microbenchmarks for the problem generators, chart renderers and prompt builders.
+
+Each benchmark is calibrated to run for about --min-time seconds per sample; the median time per
+call over --samples samples is reported. Results are written as JSON so runs can be compared across
+versions, and --compare reports any benchmark that got slower than the baseline by more than
+--threshold. Timings depend on the machine, so no baseline is committed: save one with --save-baseline on
+the machine that runs the comparison first. A cold import of run.py takes about 650-900 ms on a laptop
+or CI runner, so its budget below leaves room for a slower machine.
+
+Usage:
+    python benchmarks.py                                  # run all, write benchmark_results/latest.json
+    python benchmarks.py --save-baseline                  # also save as benchmark_results/baseline.json
+    python benchmarks.py --compare benchmark_results/baseline.json   # needs a saved baseline
+    python benchmarks.py -k chart                         # only benchmarks whose name contains "chart"
+    python benchmarks.py -k import --max-import-ms 1500   # guard the cold-start import time of run.py
+    python benchmarks.py --memory 500                     # fail if 500 renders of each chart grow memory
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_results")
+
+BENCHMARKS = {}
+# Cold-start import benchmarks: name -> module imported in a fresh interpreter with -X importtime
+IMPORT_BENCHMARKS = {"import_run": "run"}
+
+
+def benchmark(name):
+    """Register a benchmark. The decorated function does any setup and returns the callable to time."""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+# -------------------------
+# Benchmarks
+# -------------------------
+@benchmark("generate_table")
+def bench_generate_table():
+    from table_generator import generate_table
+    return generate_table
+
+
+@benchmark("generate_tables_1000")
+def bench_generate_tables():
+    from table_generator import generate_tables
+    return lambda: generate_tables(1000)
+
+
+@benchmark("problem_get_type")
+def bench_get_type():
+    from gen_q import Problem
+    percentages = {"Irregular": 0.5, "Uniform": 0.8, "Gradient": 0.3}
+    return lambda: Problem().get_type(percentages)
+
+
+@benchmark("problem_get_problem")
+def bench_get_problem():
+    from gen_q import Problem
+
+    def run():
+        problem = Problem()
+        problem.type = "Gradient"
+        problem.get_problem()
+    return run
+
+
+@benchmark("generate_cash_flow_chart")
+def bench_cash_flow_chart():
+    from gen_q import Problem
+    from charts import generate_cash_flow_chart
+    problem = Problem()
+    problem.type = "Irregular"
+    problem.get_problem(seed=1)
+    return lambda: generate_cash_flow_chart(problem.cash_flows, problem.type, problem.i, problem.n, problem.sol)
+
+
+@benchmark("generate_number_line")
+def bench_number_line():
+    from charts import generate_number_line
+    return lambda: generate_number_line(12, 7, "*")
+
+
+@benchmark("render_cash_flow_svg")
+def bench_cash_flow_svg():
+    from gen_q import Problem
+    from svg_charts import render_cash_flow_svg
+    problem = Problem()
+    problem.type = "Irregular"
+    problem.get_problem(seed=1)
+    return lambda: render_cash_flow_svg(problem.cash_flows, problem.type, problem.i, problem.n)
+
+
+@benchmark("render_number_line_svg")
+def bench_number_line_svg():
+    from svg_charts import render_number_line_svg
+    return lambda: render_number_line_svg(12, 7, 84)
+
+
+@benchmark("fetch_story_from_json")
+def bench_fetch_story():
+    from problem_id import load_loan_table, new_loan_problem_id
+    from story_templates import fetch_story_from_json, story_fields
+    fields = story_fields(load_loan_table(new_loan_problem_id(seed=1)))
+    return lambda: fetch_story_from_json(**fields)
+
+
+@benchmark("build_tutor_prompt")
+def bench_tutor_prompt():
+    from problem_id import load_loan_table, new_loan_problem_id
+    from prompt_builder import tutor_prompt
+    table = load_loan_table(new_loan_problem_id(seed=1))
+    story = "A local startup secures a business loan of $10,000.00 at an annual interest rate of 7.00%."
+    question = f"How do I calculate the {table.blank_column} for Year {table.blank_year}?"
+    return lambda: tutor_prompt(table, story, question)
+
+
+# -------------------------
+# Runner
+# -------------------------
+def time_benchmark(func, samples, min_time):
+    """Return per-call times (seconds) for each sample, pyperf style: calibrate loops, then sample."""
+    func()  # Warm up (imports, caches)
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    times = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        times.append((time.perf_counter() - start) / loops)
+    return loops, times
+
+
+def measure_import_time(module, samples):
+    """
+    Import a module in fresh interpreters with -X importtime.
+    :return: (cumulative import times in seconds, the slowest imports of the last run as (name, seconds))
+    """
+    times, imports = [], []
+    for _ in range(samples):
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+        imports = []
+        for line in completed.stderr.splitlines():
+            # "import time: self [us] | cumulative | imported package"
+            if not line.startswith("import time:") or "imported package" in line:
+                continue
+            _, cumulative, name = line[len("import time:"):].split("|")
+            imports.append((name.rstrip(), int(cumulative) / 1e6))
+        times.append(next(seconds for name, seconds in imports if name.strip() == module))
+    # Direct imports of the module are indented one level (two spaces) below it
+    direct = [(name.strip(), seconds) for name, seconds in imports if len(name) - len(name.lstrip()) == 3]
+    return times, sorted(direct, key=lambda item: item[1], reverse=True)[:8]
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmarks(names, samples, min_time):
+    results = {}
+    for name in names:
+        if name in IMPORT_BENCHMARKS:
+            times, slowest = measure_import_time(IMPORT_BENCHMARKS[name], samples)
+            results[name] = {
+                "loops": 1,
+                "samples": times,
+                "median": statistics.median(times),
+                "mean": statistics.mean(times),
+                "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+                "slowest_imports": slowest,
+            }
+            print(f"{name:<28} {format_time(results[name]['median']):>12}  "
+                  f"(± {format_time(results[name]['stdev'])}, {samples} cold starts)")
+            for module, seconds in slowest:
+                print(f"    {module:<32} {format_time(seconds):>12}")
+            continue
+
+        # Generators and route helpers print debug output; keep it out of the report
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            func = BENCHMARKS[name]()
+            loops, times = time_benchmark(func, samples, min_time)
+        results[name] = {
+            "loops": loops,
+            "samples": times,
+            "median": statistics.median(times),
+            "mean": statistics.mean(times),
+            "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        }
+        print(f"{name:<28} {format_time(results[name]['median']):>12}  "
+              f"(± {format_time(results[name]['stdev'])}, {loops} loops x {samples} samples)")
+    return {
+        "metadata": {
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+        },
+        "benchmarks": results,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print the change against a baseline run; returns the names of benchmarks that regressed."""
+    regressions = []
+    print(f"\nComparison against baseline from {baseline['metadata'].get('date')} "
+          f"({baseline['metadata'].get('git_revision')}):")
+    for name, result in results["benchmarks"].items():
+        base = baseline["benchmarks"].get(name)
+        if base is None:
+            print(f"{name:<28} (new)")
+            continue
+        change = result["median"] / base["median"] - 1
+        status = ""
+        if change > threshold:
+            status = "REGRESSION"
+            regressions.append(name)
+        elif change < -threshold:
+            status = "faster"
+        print(f"{name:<28} {format_time(base['median']):>12} -> {format_time(result['median']):>12}  "
+              f"{change:+7.1%}  {status}")
+    return regressions
+
+
+def format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=4)
+
+
+def _rss_bytes():
+    """Resident set size of this process (the peak RSS where /proc is not available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def measure_render_memory(renders, warmup=50, traced_renders=50):
+    """
+    Render a cash flow chart and a number line renders times each and return how much live Python objects
+    (allocated memory blocks) and the RSS (in bytes) grew from the end of a warm-up to the end of the run.
+
+    Then render traced_renders more of each under tracemalloc, started after the run, and return the bytes
+    still allocated by them (traced_growth): an exact count of what the renders leak, but tracemalloc slows
+    rendering about 5x, so it only covers a short run.
+    """
+    from gen_q import Problem
+    from charts import number_line_result, render_cash_flow_png, render_number_line_png
+    problems = []
+    for seed in range(20):
+        problem = Problem()
+        problem.type = ("Irregular", "Uniform", "Gradient")[seed % 3]
+        problem.get_problem(seed=seed)
+        problems.append(problem)
+
+    def render(k):
+        problem = problems[k % len(problems)]
+        render_cash_flow_png(problem.cash_flows, problem.type, problem.i, problem.n)
+        num1, num2 = k % 13, k % 7 + 1
+        render_number_line_png(num1, num2, number_line_result(num1, num2, "+-*/"[k % 4]))
+
+    for k in range(warmup):
+        render(k)
+    gc.collect()
+    blocks_before, rss_before = sys.getallocatedblocks(), _rss_bytes()
+    for k in range(renders):
+        render(k)
+    gc.collect()
+    blocks_after, rss_after = sys.getallocatedblocks(), _rss_bytes()
+
+    tracemalloc.start()
+    try:
+        for k in range(traced_renders):
+            render(k)
+        gc.collect()
+        traced_growth, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "renders": renders,
+        "block_growth": blocks_after - blocks_before,
+        "rss_growth": rss_after - rss_before,
+        "traced_renders": traced_renders,
+        "traced_growth": traced_growth,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the IE201 microbenchmarks.")
+    parser.add_argument("-k", dest="filter", default="", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--samples", type=int, default=10, help="Samples per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.1, help="Minimum seconds per sample")
+    parser.add_argument("--output", default=os.path.join(RESULTS_DIR, "latest.json"), help="Where to write results")
+    parser.add_argument("--save-baseline", action="store_true", help="Also save the results as the baseline")
+    parser.add_argument("--compare", metavar="BASELINE", help="Baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown reported as a regression")
+    parser.add_argument("--max-import-ms", type=float, help="Fail if a cold-start import takes longer than this")
+    parser.add_argument("--memory", type=int, metavar="RENDERS",
+                        help="Instead of timing, render each chart this many times and check memory stays flat")
+    parser.add_argument("--traced-renders", type=int, default=50,
+                        help="Renders of each chart measured with tracemalloc after the --memory run")
+    parser.add_argument("--max-growth-mb", type=float, default=1,
+                        help="Fail if the traced renders leave more than this allocated")
+    parser.add_argument("--max-block-growth", type=int, default=5000,
+                        help="Fail if the number of allocated memory blocks grows by more than this over the --memory run")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=16,
+                        help="Fail if the RSS grows by more than this over the --memory run")
+    args = parser.parse_args(argv)
+
+    if args.memory:
+        growth = measure_render_memory(args.memory, traced_renders=args.traced_renders)
+        print(f"{growth['renders']} renders of each chart: {growth['block_growth']:+d} allocated blocks, "
+              f"RSS grew {growth['rss_growth'] / 2 ** 20:.1f} MB; {growth['traced_renders']} traced renders left "
+              f"{growth['traced_growth'] / 2 ** 20:.2f} MB allocated")
+        over = []
+        if growth["traced_growth"] > args.max_growth_mb * 2 ** 20:
+            over.append(f"traced growth over {args.max_growth_mb} MB")
+        if growth["block_growth"] > args.max_block_growth:
+            over.append(f"block growth over {args.max_block_growth}")
+        if growth["rss_growth"] > args.max_rss_growth_mb * 2 ** 20:
+            over.append(f"RSS growth over {args.max_rss_growth_mb} MB")
+        if over:
+            print(f"Memory grew over the budget ({', '.join(over)}): a chart renderer is leaking")
+            return 1
+        return 0
+
+    if args.compare and not os.path.exists(args.compare):
+        print(f"No baseline at {args.compare}: save one on this machine with --save-baseline first")
+        return 2
+
+    names = [name for name in list(BENCHMARKS) + list(IMPORT_BENCHMARKS) if args.filter in name]
+    results = run_benchmarks(names, args.samples, args.min_time)
+    write_json(args.output, results)
+    print(f"\nResults written to {args.output}")
+    if args.save_baseline:
+        baseline_path = os.path.join(RESULTS_DIR, "baseline.json")
+        write_json(baseline_path, results)
+        print(f"Baseline saved to {baseline_path}")
+
+    status = 0
+    if args.max_import_ms is not None:
+        for name in IMPORT_BENCHMARKS:
+            if name in results["benchmarks"] and results["benchmarks"][name]["median"] * 1000 > args.max_import_ms:
+                print(f"\n{name} took {format_time(results['benchmarks'][name]['median'])}, "
+                      f"over the {args.max_import_ms:.0f} ms budget")
+                status = 1
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}: "
+                  f"{', '.join(regressions)}")
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+Integer-cent fixed-point arithmetic.
+
+Money is held as integer cents and interest rates as integer basis points (1% = 100 bp), so every
+schedule value is computed exactly. All functions accept Python ints or NumPy int64 arrays.
+
+Rounding rule: a result that is not a whole number of cents is rounded to the nearest cent, with
+exact halves rounded away from zero (the way students round by hand: 1590.225 -> 1590.23).
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+
+BP_PER_UNIT = 10000  # basis points in a rate of 1.0 (100%)
+
+
+def div_round(numerator, denominator):
+    """numerator / denominator rounded to the nearest integer, halves away from zero (denominator > 0)."""
+    magnitude = (2 * abs(numerator) + denominator) // (2 * denominator)
+    if isinstance(numerator, np.ndarray):
+        return np.where(numerator < 0, -magnitude, magnitude)
+    return -magnitude if numerator < 0 else magnitude
+
+
+def to_cents(value):
+    """Convert a dollar amount (number or numeric string, e.g. from a form) to integer cents."""
+    if isinstance(value, np.ndarray):
+        # Half-cent ties round away from zero, as ROUND_HALF_UP does below (np.rint would round them to even)
+        scaled = np.abs(value) * 100
+        cents = (np.sign(value) * np.floor(scaled + 0.5)).astype(np.int64)
+        # Float error can move a tie to either side (1.005 * 100 is 100.4999...): round the amounts near one
+        # from their decimal form, exactly as the scalar path does
+        for index in np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6):
+            cents.flat[index] = to_cents(value.flat[index].item())
+        return cents
+    return int(Decimal(str(value).strip()).scaleb(2).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    """Convert integer cents back to dollars (float, or a float array)."""
+    return cents / 100
+
+
+def rate_to_bp(rate):
+    """Convert a rate given as a fraction (0.07) to integer basis points (700)."""
+    return int(round(rate * BP_PER_UNIT))
+
+
+def interest_cents(balance_cents, rate_bp):
+    """Interest on a balance for one period, rounded to the cent."""
+    return div_round(balance_cents * rate_bp, BP_PER_UNIT)
+
+
+def payment_cents(principal_cents, rate_bp, deferment_years, repayment_years):
+    """
+    Annual payment (A) that repays the capitalized balance principal * (1 + i) ** deferment_years over
+    repayment_years, i.e. principal * (F/P, i, deferment) * (A/P, i, repayment), computed as an exact
+    fraction and rounded to the cent. Scalars only (the exact intermediate values exceed int64).
+    """
+    if repayment_years <= 0:
+        return 0
+    if rate_bp == 0:
+        return div_round(principal_cents, repayment_years)
+    growth = BP_PER_UNIT + rate_bp
+    numerator = principal_cents * growth ** deferment_years * rate_bp * growth ** repayment_years
+    denominator = (BP_PER_UNIT ** (deferment_years + 1)
+                   * (growth ** repayment_years - BP_PER_UNIT ** repayment_years))
+    return div_round(numerator, denominator)
+
+
+def payment_cents_array(principal_cents, rate_bp, deferment_years, repayment_years):
+    """
+    payment_cents() over equal-length arrays of non-negative loan parameters; returns an int64 array.
+
+    The payment is computed in float64, which is off by far less than a cent, so rounding the estimate
+    gives the exact result except when it lies within rounding error of a half cent. Only those
+    near-ties are recomputed exactly with payment_cents().
+    """
+    principal = np.asarray(principal_cents, dtype=np.int64)
+    rate = np.asarray(rate_bp, dtype=np.int64)
+    deferment = np.asarray(deferment_years, dtype=np.int64)
+    repayment = np.asarray(repayment_years, dtype=np.int64)
+
+    i = rate / BP_PER_UNIT
+    with np.errstate(divide="ignore", invalid="ignore"):
+        growth = (1 + i) ** repayment
+        estimate = np.where(
+            rate == 0,
+            principal / repayment,
+            principal * (1 + i) ** deferment * i * growth / (growth - 1),
+        )
+    estimate = np.where(repayment > 0, estimate, 0.0)
+    payments = np.floor(estimate + 0.5).astype(np.int64)
+
+    near_tie = np.abs(estimate - np.floor(estimate) - 0.5) <= 1e-9 * np.maximum(estimate, 1.0)
+    for k in np.flatnonzero(near_tie):
+        payments[k] = payment_cents(int(principal[k]), int(rate[k]), int(deferment[k]), int(repayment[k]))
+    return payments
@@ -0,0 +1,157 @@
+"""
+Rendered cash flow charts, cached by content.
+
+A chart is identified by a hash of what it draws (cash flows, problem type, interest rate and periods), which is
+also its ETag, so browsers can cache it forever. Rendered charts are kept in a size-bounded LRU; the (much smaller)
+parameters are kept for longer so an evicted chart can be re-rendered when it is requested again, and for as long
+as its render is pending.
+
+The cache is per process. Chart URLs (/chart/<problem ID>.<format>, see run.py) name the seed-addressable problem
+rather than the key, so whichever worker gets the request rebuilds the parameters and registers them first.
+
+With a render pool, prefetch() starts rendering a chart in the background as soon as its page is built, and
+get() waits (up to the pool's timeout) for that render when the chart's URL is requested.
+"""
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+import tracing
+from render_pool import RenderQueueFull
+
+log = logging.getLogger(__name__)
+
+CHART_CACHE_HITS = tracing.counter("ie201_chart_cache_hits_total", "Chart requests served from the render cache.")
+CHART_CACHE_MISSES = tracing.counter("ie201_chart_cache_misses_total", "Charts rendered on a cache miss.")
+
+# How many more chart parameters than rendered charts are remembered
+PARAMS_PER_CHART = 8
+
+
+def chart_key(cash_flows, problem_type, interest_rate, periods, image_format="png"):
+    """A stable key for the chart of a cash flow problem."""
+    payload = json.dumps(
+        [
+            sorted((int(period), flow) for period, flow in cash_flows.items()),
+            problem_type,
+            interest_rate,
+            periods,
+            image_format,
+        ],
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:20]
+
+
+class ChartCache:
+    def __init__(self, render, max_entries=512, image_format="png", pool=None):
+        """
+        :param render: Callable (cash_flows, problem_type, interest_rate, periods) -> image bytes.
+        :param max_entries: Maximum number of rendered charts kept in memory.
+        :param image_format: "png" or "svg", the format render produces (part of the key).
+        :param pool: Optional RenderPool to render in; without one, charts are rendered in the calling thread.
+        """
+        self.render = render
+        self.max_entries = max_entries
+        self.image_format = image_format
+        self.pool = pool
+        self._charts = OrderedDict()
+        self._params = OrderedDict()
+        self._pending = {}  # key -> (Future, params) of the renders running in the pool
+        self._lock = threading.Lock()
+        tracing.gauge("ie201_chart_cache_entries", "Rendered charts held in the chart cache.", lambda: len(self))
+
+    def __len__(self):
+        return len(self._charts)
+
+    def register(self, cash_flows, problem_type, interest_rate, periods):
+        """Remember how to draw a chart and return its key (nothing is rendered yet)."""
+        key = chart_key(cash_flows, problem_type, interest_rate, periods, self.image_format)
+        with self._lock:
+            self._params[key] = (dict(cash_flows), problem_type, interest_rate, periods)
+            self._params.move_to_end(key)
+            while len(self._params) > self.max_entries * PARAMS_PER_CHART:
+                self._params.popitem(last=False)
+        return key
+
+    def put(self, key, image):
+        """Store an already rendered chart (e.g. one from the problem bank)."""
+        with self._lock:
+            self._store(key, image)
+
+    def prefetch(self, key):
+        """Start rendering a registered chart in the render pool, unless it is cached or already rendering."""
+        with self._lock:
+            if key in self._charts or key in self._pending:
+                return
+            params = self._params.get(key)
+        if params is not None:
+            self._submit(key, params)
+
+    def get(self, key):
+        """
+        Return the chart's image bytes, rendering it on a miss, or None for an unknown key.
+
+        Raises concurrent.futures.TimeoutError if the render pool does not deliver in time.
+        """
+        with self._lock:
+            image = self._charts.get(key)
+            if image is not None:
+                self._charts.move_to_end(key)
+                CHART_CACHE_HITS.inc()
+                return image
+            params = self._params.get(key)
+            pending = self._pending.get(key)
+        if pending is None and params is None:
+            return None
+
+        if pending is None:
+            future = self._submit(key, params)
+        else:
+            # The params may have been evicted since; the pending render keeps its own
+            future, params = pending
+        if future is not None:
+            try:
+                return future.result(self.pool.timeout)
+            except BrokenProcessPool:
+                log.warning("Render pool failed; rendering chart %s in this thread", key)
+
+        # No pool, the pool is full or it failed: render in this thread
+        CHART_CACHE_MISSES.inc()
+        image = self.render(*params)
+        with self._lock:
+            self._store(key, image)
+        return image
+
+    def _submit(self, key, params):
+        """Queue a render in the pool and return its Future, or None if it has to be rendered inline."""
+        if self.pool is None:
+            return None
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is not None:
+                return pending[0]
+            try:
+                future = self.pool.submit(self.render, *params)
+            except RenderQueueFull:
+                return None
+            self._pending[key] = (future, params)
+        CHART_CACHE_MISSES.inc()
+        future.add_done_callback(partial(self._finish, key))
+        return future
+
+    def _finish(self, key, future):
+        with self._lock:
+            self._pending.pop(key, None)
+            if not future.cancelled() and future.exception() is None:
+                self._store(key, future.result())
+
+    def _store(self, key, image):
+        self._charts[key] = image
+        self._charts.move_to_end(key)
+        while len(self._charts) > self.max_entries:
+            self._charts.popitem(last=False)
@@ -0,0 +1,140 @@
+from contextlib import contextmanager
+from io import BytesIO
+import base64
+import threading
+
+_Figure = None
+_local = threading.local()
+
+
+def _figure_class():
+    """
+    Import matplotlib's Figure on first use; it is too heavy to load at worker start-up.
+
+    Charts are drawn on standalone Figure objects rather than through pyplot, so there is no global figure
+    state: rendering is thread-safe and a figure is freed as soon as it goes out of scope.
+    """
+    global _Figure
+    if _Figure is None:
+        from matplotlib.figure import Figure
+        _Figure = Figure
+    return _Figure
+
+
+@contextmanager
+def figure_context(figsize):
+    """
+    A blank Figure of the given size, reused by every chart of that size drawn in this thread.
+
+    Reusing the figure (and its Agg canvas) avoids building a new one per chart, and clearing it on exit, even
+    when drawing fails, guarantees a chart never leaves artists behind: memory stays flat however many charts a
+    worker renders.
+    """
+    figures = getattr(_local, "figures", None)
+    if figures is None:
+        figures = _local.figures = {}
+    fig = figures.get(figsize)
+    if fig is None:
+        fig = figures[figsize] = _figure_class()(figsize=figsize)
+    try:
+        yield fig
+    finally:
+        fig.clear()
+
+
+def generate_cash_flow_chart(cash_flows, problem_type, interest_rate, periods, solution):
+    """The cash flow diagram as a base64-encoded PNG (for inlining in a page or storing in the problem bank)."""
+    return base64.b64encode(render_cash_flow_png(cash_flows, problem_type, interest_rate, periods)).decode("utf-8")
+
+
+def render_cash_flow_png(cash_flows, problem_type, interest_rate, periods):
+    """The cash flow diagram as PNG bytes."""
+    with figure_context((10, 4)) as fig:
+        ax = fig.subplots()
+
+        # Plot cash flows as vertical bars
+        periods = list(cash_flows.keys())
+        flows = list(cash_flows.values())
+        ax.bar(periods, flows, width=0.3, color="blue", zorder=3)
+
+        # Dynamically set the Y-axis limit based on the highest cash flow
+        max_flow = max(flows) if flows else 0  # Safeguard against empty cash flows
+        ax.set_ylim(0, max_flow * 1.4)  # Add a buffer of 40% above the highest bar
+
+        # Add labels for each cash flow
+        for i, flow in enumerate(flows):
+            ax.text(
+                i,  # X position (center of each bar)
+                flow + (max_flow * 0.05),  # Slightly above each cash flow bar
+                f"${flow:,}",  # Format with comma separator
+                ha="center", va="bottom", fontsize=9  # Text styling
+            )
+
+        # Chart details
+        ax.set_title(f"Cash Flow Diagram (i={interest_rate * 100:.2f}%)", fontsize=14, pad=20)
+        ax.set_xlabel("Periods (n)", fontsize=12)
+        ax.set_ylabel("Cash Flow Amount", fontsize=12)
+        ax.axhline(0, color="black", linewidth=1.3)
+        ax.grid(True, linestyle="--", alpha=0.7)
+
+        # Convert plot to PNG
+        buf = BytesIO()
+        fig.savefig(buf, format="png", bbox_inches="tight")
+        png = buf.getvalue()
+        buf.close()
+    return png
+
+
+def number_line_result(num1, num2, operation):
+    result = None
+    if operation == "+":
+        result = num1 + num2
+    elif operation == "-":
+        result = num1 - num2
+    elif operation == "*":
+        result = num1 * num2
+    elif operation == "/":
+        result = round(num1 / num2, 2)
+    return result
+
+
+def generate_number_line(num1, num2, operation):
+    """The number line for an arithmetic problem as a base64-encoded PNG."""
+    result = number_line_result(num1, num2, operation)
+    return base64.b64encode(render_number_line_png(num1, num2, result)).decode("utf-8")
+
+
+def render_number_line_png(num1, num2, result):
+    """A number line marking num1, num2 and the result, as PNG bytes."""
+    with figure_context((6, 2)) as fig:
+        ax = fig.subplots()
+        ax.hlines(0, -10, max(num1, num2, result) + 5, color='black')
+        ax.scatter([num1, num2, result], [0, 0, 0], color=['blue', 'orange', 'green'], zorder=3)
+        ax.text(num1, 0.2, f"{num1}", fontsize=10, ha='center')
+        ax.text(num2, 0.2, f"{num2}", fontsize=10, ha='center')
+        ax.text(result, 0.2, f"{result}", fontsize=10, ha='center')
+        ax.set_ylim(-1, 1)
+        ax.get_yaxis().set_visible(False)
+        ax.get_xaxis().tick_bottom()
+
+        buf = BytesIO()
+        fig.savefig(buf, format="png")
+        png = buf.getvalue()
+        buf.close()
+    return png
+
+
+def get_backend(name):
+    """
+    The renderers of a chart backend.
+
+    :param name: "matplotlib" (PNG) or "svg" (SVG written directly, see svg_charts.py)
+    :return: (render_cash_flow(cash_flows, problem_type, interest_rate, periods),
+              render_number_line(num1, num2, result), image format)
+    """
+    if name == "matplotlib":
+        return render_cash_flow_png, render_number_line_png, "png"
+    if name == "svg":
+        import svg_charts
+        return svg_charts.render_cash_flow_svg, svg_charts.render_number_line_svg, "svg"
+    raise ValueError(f"Unknown chart backend: {name}")
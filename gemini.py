@@ -1,9 +1,6 @@
-from google import genai
-import os
+from genai_story_generator import get_client
 
-client = genai.Client(
-    api_key=os.environ["GOOGLE_API_KEY"]
-)
+client = get_client()
 
 response = client.models.generate_content(
     model="gemini-3-flash-preview",
@@ -1,86 +1,71 @@
-from google import genai
-from google.genai import types
-import os
-import time
-from pathlib import Path
+import argparse
 
-client = genai.Client(api_key=os.environ["GOOGLE_API_KEY"])
+from genai_story_generator import MODEL, generate_story, get_client
+from materials_index import MATERIALS_DIR, load_or_build, material_files
+from prompt_builder import materials_markdown
 
-# -------------------------
-# 1) Create a File Search store (persistent index container)
-# -------------------------
-file_search_store = client.file_search_stores.create(
-    config={"display_name": "ie201-lecture-materials"}
-)
-print("Created store:", file_search_store.name)
+parser = argparse.ArgumentParser(description="Ask the IE201 tutor a question grounded in the lecture materials.")
+parser.add_argument("question", nargs="*", help="The question (default: the ten principles of engineering economy)")
+parser.add_argument("--hosted", action="store_true",
+                    help="Retrieve with Gemini File Search (synced by sync_materials.py) instead of the local index")
+args = parser.parse_args()
 
-# -------------------------
-# 2) Upload lecture materials into the store (indexing happens here)
-#    Put your PDFs/txts in a folder like ./ie201_materials/
-# -------------------------
-materials_dir = Path("ie201_materials")
-files_to_upload = [
-    p for p in materials_dir.glob("*")
-    if p.suffix.lower() in {".pdf", ".txt", ".md"}
-]
-
-if not files_to_upload:
+# Put your PDFs/txts in a folder like ./ie201_materials/
+if not material_files():
     raise RuntimeError(
-        f"No files found in {materials_dir.resolve()}. "
+        f"No files found in {MATERIALS_DIR}. "
         "Add PDFs/TXTs/MDs and rerun."
     )
 
-for path in files_to_upload:
-    print("Uploading:", path.name)
-
-    operation = client.file_search_stores.upload_to_file_search_store(
-        file=str(path),
-        file_search_store_name=file_search_store.name,
-        config={
-            # This name shows up in citations
-            "display_name": path.name,
-
-            # Optional: tune chunking (uncomment if you want smaller chunks)
-            # "chunking_config": {
-            #     "white_space_config": {
-            #         "max_tokens_per_chunk": 300,
-            #         "max_overlap_tokens": 40
-            #     }
-            # },
-        },
-    )
-
-    # Wait for indexing to finish
-    while not operation.done:
-        time.sleep(5)
-        operation = client.operations.get(operation)
-
-print("All files indexed into:", file_search_store.name)
-
-# -------------------------
-# 3) Ask questions with File Search enabled
-# -------------------------
 system_style = """
 You are an IE201 (Engineering Economics) tutor.
-Use File Search to ground your answers in the indexed lecture materials.
+Ground your answers in the lecture materials.
 If the materials don't contain the needed info, say so and then answer generally.
 When possible, show steps and clearly state assumptions (timing, sign convention, i, n).
 """
 
-question = "What are the ten principles of engineering economy."
+question = " ".join(args.question) or "What are the ten principles of engineering economy."
+
+if args.hosted:
+    # -------------------------
+    # 1) Sync the materials to the File Search store (only new or changed files are uploaded)
+    # -------------------------
+    from google.genai import types
+    from sync_materials import sync
 
-response = client.models.generate_content(
-    model="gemini-3-flash-preview",
-    contents=f"{system_style}\n\nStudent question: {question}",
-    config=types.GenerateContentConfig(
-        tools=[
-            types.Tool(
-                file_search=types.FileSearch(
-                    file_search_store_names=[file_search_store.name]
+    client = get_client()
+    store_name, stats = sync(client)
+    print(f"File Search store {store_name}: {stats['uploaded']} uploaded, {stats['unchanged']} unchanged")
+
+    # -------------------------
+    # 2) Ask with File Search enabled
+    # -------------------------
+    response = client.models.generate_content(
+        model=MODEL,
+        contents=f"{system_style}\n\nStudent question: {question}",
+        config=types.GenerateContentConfig(
+            tools=[
+                types.Tool(
+                    file_search=types.FileSearch(
+                        file_search_store_names=[store_name]
+                    )
                 )
-            )
-        ]
-    ),
-)
+            ]
+        ),
+    )
+    print(response.text)
+else:
+    # -------------------------
+    # 1) Load the local index of the materials (built on first run, rebuilt when the files change)
+    # -------------------------
+    index = load_or_build()
+    print(f"Indexed passages: {len(index)}")
 
-print(response.text)
+    # -------------------------
+    # 2) Ask with the best matching passages (only the generate call is remote)
+    # -------------------------
+    passages = index.search(question, k=5)
+    print(generate_story(
+        f"Lecture material excerpts:\n\n{materials_markdown(passages)}\n\nStudent question: {question}",
+        system=system_style,
+    ))
@@ -5,8 +5,10 @@ import json
 import os
 
 # Import the table generator function
-from table_generator import generate_table
+from table_generator import generate_tables
+from loan_table import LoanTable
 from genai_story_generator import generate_story
+from prompt_builder import tutor_prompt
 
 ### CONFIGURE OPENAI API KEY ###
 
@@ -15,53 +17,35 @@ API_KEY = os.getenv("OPENAI_API_KEY")
 if not API_KEY:
     raise Exception("OPENAI_API_KEY environment variable is missing. Please set it before running the script.")
 
-client = OpenAI(api_key=API_KEY)  # Replace hardcoded key
-client = OpenAI(api_key=API_KEY)  # uses API key from code or env, same as before
+# OPENAI_BASE_URL points the client somewhere else, e.g. at mock_llm_server.py
+client = OpenAI(api_key=API_KEY, base_url=os.getenv("OPENAI_BASE_URL"))
 
 # Function to generate 50 test cases with user questions and prompts based on PromptLevel
 def generate_test_cases(num_cases=50, prompt_level=1, approved_examples=[]):
     """
     Generate test cases with dummy user inputs, tables, and prompts.
     :param num_cases: Number of test cases to generate.
-    :param prompt_level: The level of detail for the prompt (1 = detailed, 0 = simple).
+    :param prompt_level: The level of detail for the prompt (1 = detailed, 2 = problem data only, 0 = simple).
     :return: A list of test cases, each containing table, story, question, prompt, and response.
     """
     test_cases = []
 
-    example_str = "\n".join([f"{i + 1}. {example}" for i, example in enumerate(approved_examples)])
+    # Generate all tables up front in one vectorized batch
+    generated_tables = generate_tables(num_cases)
 
     for i in range(num_cases):
         # Generate table, missing cell, and story
-        table, missing_cell, deferment_years = generate_table()
+        table = LoanTable.from_batch(generated_tables, i)
+        missing_cell = table.missing_cell
+        deferment_years = table.deferment_years
 
 
         # Generate dummy user question
         question = f"How do I calculate the {missing_cell['Column']} for Year {missing_cell['Year']}?"
 
-        # Generate detailed or simple prompt
-        principal_amount = table[0].get("UB", "Unknown")
-        interest_rate = (
-            (table[0].get("Int", 0) / principal_amount * 100) if principal_amount else "Unknown"
-        )
-        total_loan_period = len(table)
-        annual_payment = next((row.get("Ad", 0) for row in table if row.get("Ad", 0) > 0), "Unknown")
-
-        # Build table section in Markdown
-        table_prompt = ""
-        for row in table[:5]:  # Display only first 5 rows for prompt
-            table_prompt += (
-                f"| {row['Year']} | "
-                f"{'BLANK' if row['UB'] is None else row['UB']} | "
-                f"{'BLANK' if row['Int'] is None else row['Int']} | "
-                f"{'BLANK' if row['UIB'] is None else row['UIB']} | "
-                f"{row['AO']} | {row['Ad']} | "
-                f"{'BLANK' if row['IPmt'] is None else row['IPmt']} | "
-                f"{'BLANK' if row['PPmt'] is None else row['PPmt']} | "
-                f"{row['UIA']} | {row['UBA']} |\n"
-            )
-        initial_balance = table[0].get("UB", 0)
-        interest_rate = (table[0]["Int"] / initial_balance * 100) if initial_balance else 0
-        loan_payment = next((row.get("Ad", 0) for row in table if row.get("Ad", 0) > 0), 0)
+        initial_balance = table.initial_balance
+        interest_rate = table.interest_rate
+        loan_payment = table.loan_payment
         num_years = len(table)
 
         story_prompt = (
@@ -88,98 +72,28 @@ def generate_test_cases(num_cases=50, prompt_level=1, approved_examples=[]):
             "\n- Your response will be evaluated for compliance with these rules."
         )
 
-        story = generate_story(story_prompt)
-
-        # Construct prompt based on PromptLevel
-
-        if prompt_level == 1:
-            prompt = f"""
-            You are a chatbot embedded within an interactive educational tool designed to help undergraduate students in a financial engineering course (Engineering Economy). 
-
-            **Scenario Context:**
-            This tool is used to teach students about loan repayment concepts, including Unpaid Balance (UB), Interest Payment (Int), Principal Payment (PPmt), and other finance-related topics. 
-            Always ensure the vocabulary and terminology in your responses exactly match the wording used in the provided story question below.
-
-            **Rules for Answering Questions:**
-            - Do not fully calculate the solution for any blank. Instead, guide the student by providing:
-                - The correct formula or equations.
-                - Definitions of variables as they relate to the table and story prompt.
-                - General financial principles and reasoning.
-                - Example calculations from other rows in the table to demonstrate general methods applicable to their blank value.
-                - Hints to help the user figure out the problem for themselves.
-            - Do NOT reveal the solution to any blank cell directly in your response.
-            - The response must not include terminology or phrasing for describing financial engineering concepts outside the provided set of approved examples. Be strict and harsh about this. An example of this would be using the term 'amortization', which does not appear in the approved examples.
-            - The approved examples are:
-            {example_str}
-
-            **Word Problem Context**:
-            {story}
-
-            **Relevant Loan Details:**
-            - Principal Loan Amount: {principal_amount} USD
-            - Annual Interest Rate: {interest_rate}%
-            - Total Loan Period: {total_loan_period} years
-            - Deferment Period: {deferment_years} years
-            - Loan Repayment Amount Per Year (after deferment): {annual_payment} USD
-
-            **Loan Table (Partial View)**:
-            Below is the loan table generated for this question. Use this table to provide context for your answer. If a value is missing, it is represented as `BLANK`.
-
-            | Year | UB (Unpaid Balance) | Int (Interest Payment) | UIB (Unpaid Interest Before Payment) | AO (Amount Owed) | Ad (Loan Payment) | IPmt (Interest Payment) | PPmt (Principal Payment) | UIA (Unpaid Interest After Payment) | UBA (Unpaid Balance After Payment) |
-            |------|---------------------|------------------------|---------------------------------------|------------------|-------------------|--------------------------|---------------------------|--------------------------------------|------------------------------------|
-            {table_prompt}
-
-            **Student Question**:
-            "{question}"
-
-            **Specific Blank Context**:
-            The student is tasked with calculating the value for the `{missing_cell.get('Column', 'Unknown')}` in year `{missing_cell.get('Year', 'Unknown')}`.
-
-            **Instructions for Answering**:
-            - Your role is to guide students in understanding the concepts, not to provide full numerical answers to their specific problem.
-            - Try to provide concrete tips, insights, or partial steps to help the student learn how to solve the problem on their own.
-            - Avoid introducing new terminology or format conventions. Stick to the vocabulary and phrasing used in the word problem.
-            - If applicable, use other rows from the table as examples to demonstrate principles or calculations.
-            """
-        elif prompt_level == 2:
-            prompt = f"""
-                        **Word Problem Context**:
-                        {story}
-
-                        **Relevant Loan Details:**
-                        - Principal Loan Amount: {principal_amount} USD
-                        - Annual Interest Rate: {interest_rate}%
-                        - Total Loan Period: {total_loan_period} years
-                        - Deferment Period: {deferment_years} years
-                        - Loan Repayment Amount Per Year (after deferment): {annual_payment} USD
-
-                        **Loan Table (Partial View)**:
-                        Below is the loan table generated for this question. Use this table to provide context for your answer. If a value is missing, it is represented as `BLANK`.
-
-                        | Year | UB (Unpaid Balance) | Int (Interest Payment) | UIB (Unpaid Interest Before Payment) | AO (Amount Owed) | Ad (Loan Payment) | IPmt (Interest Payment) | PPmt (Principal Payment) | UIA (Unpaid Interest After Payment) | UBA (Unpaid Balance After Payment) |
-                        |------|---------------------|------------------------|---------------------------------------|------------------|-------------------|--------------------------|---------------------------|--------------------------------------|------------------------------------|
-                        {table_prompt}
-
-                        **Student Question**:
-                        "{question}"
-
-                        
-                        """
-
-
-        else:
-            # Simple Prompt for PromptLevel = 0
-            prompt = f"The student has asked the following question:\n\n{question}\nPlease provide a concise and clear response to help the student understand the concept."
+        try:
+            story = generate_story(story_prompt)
+        except Exception as e:
+            print(f"Skipping test case {i + 1}: story generation failed ({e})")
+            continue
+
+        # Construct prompt based on PromptLevel (the approved examples go into the static system prefix)
+        prompt = tutor_prompt(table, story, question, prompt_level, approved_examples)
 
         # Generate a fake Gemini response for testing purposes
-        gemini_response = generate_story(prompt)
+        try:
+            gemini_response = generate_story(prompt.suffix, system=prompt.system)
+        except Exception as e:
+            print(f"Skipping test case {i + 1}: Gemini failed to answer ({e})")
+            continue
 
         # Append to test cases
         test_cases.append({
-            "table": table,
+            "table": table.to_dicts(),
             "story": story,
             "question": question,
-            "prompt": prompt,
+            "prompt": prompt.text,
             "response": gemini_response,
         })
 
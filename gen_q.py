@@ -1,5 +1,12 @@
+import logging
 import random
-import numpy
+
+import valuation
+
+log = logging.getLogger(__name__)
+
+# Bump whenever a change alters the problem produced for a given seed (see problem_id.py)
+GENERATOR_VERSION = 2
 
 def basic_func():
     return random.randint(1,100)
@@ -51,66 +58,56 @@ class Problem:
             # Add small constant (e.g., 0.01) to avoid zero probabilities
             weight = 1.0 - response_percentages.get(t, 0.0) + 0.2
             weights.append(weight)
-            print("WEIGHTS", weights)
+        log.debug("WEIGHTS %s", weights)
 
         # Randomly select a type based on the calculated weights
         self.type = random.choices(self.type_list, weights=weights, k=1)[0]
         return self.type
 
-    def get_problem(self):
+    def get_problem(self, seed=None):
+        # A seed makes the problem reproducible (for the current type)
+        rng = random.Random(seed) if seed is not None else random
 
+        P_or_F = rng.randint(1,2)
+        self.P = P_or_F == 1  # True: find the present worth P; False: find the future worth F at period n
 
-        self.sol = 0
-        P_or_F = random.randint(1,2)
-        if P_or_F == 1:
-            self.P = True
-        else:
-            self.P = True
-
+        self.n = rng.randint(5,10)
+        self.i = rng.randint(4,10) / 100
 
-        self.n = random.randint(5,10)
-        self.i = random.randint(4,10) / 100
+        if self.type == 'Irregular':
+            self.n = rng.randint(4, 6)
 
         self.cash_flows = {}
         for period in range(0, self.n + 1):
             self.cash_flows[period] = 0
 
-
+        # Build the cash flows, then value them with the closed-form factors in valuation.py
+        future = not self.P
         if self.type == 'Irregular':
-            self.n = random.randint(4, 6)
             for period in range(1, self.n + 1):
-                self.cash_flows[period] = random.randint(0, 10)*100
-            for period in range(0, self.n + 1):
-                if self.P:
-                    self.sol += self.cash_flows[period]*((1+self.i)**(-period))
-                else:
-                    self.sol += self.cash_flows[period] * ((1 + self.i) ** (period))
+                self.cash_flows[period] = rng.randint(0, 10)*100
+            self.sol = float(valuation.irregular_value(valuation.cash_flows_to_array(self.cash_flows), self.i,
+                                                       self.n, future))
         elif self.type == 'Uniform':
-            self.A = random.randint(0, 10) * 100
+            self.A = rng.randint(0, 10) * 100
             for period in range(1, self.n + 1):
                 self.cash_flows[period] = self.A
-            for period in range(1, self.n + 1):
-                if self.P:
-                    self.sol += self.cash_flows[period]*((1+self.i)**(-period))
-                else:
-                    self.sol += self.cash_flows[period] * ((1 + self.i) ** (period))
-
+            self.sol = float(valuation.uniform_value(self.A, self.i, self.n, future))
         elif self.type == 'Gradient':
-            self.G = random.randint(1, 5) * 100
-            self.cash_flows[0] = 0
+            self.G = rng.randint(1, 5) * 100
             for period in range(1, self.n + 1):
                 self.cash_flows[period] = (period - 1)*self.G
-            for period in range(0, self.n + 1):
-                if self.P:
-                    self.sol += self.cash_flows[period]*((1+self.i)**(-period))
-                else:
-                    self.sol += self.cash_flows[period] * ((1 + self.i) ** (period))
+            self.sol = float(valuation.gradient_value(self.G, self.i, self.n, future))
+        else:
+            self.sol = 0
+
 
 
+if __name__ == "__main__":
+    print(basic_func())
+    problem = Problem()
+    print(problem.get_type([]))
+    print(problem.get_problem())
+    print("CF", problem.cash_flows, problem.n, problem.i, problem.P, problem.A, problem.G)
+    print("SOL", problem.sol)
 
-print(basic_func())
-problem = Problem()
-print(problem.get_type([]))
-print(problem.get_problem())
-print("CF", problem.cash_flows, problem.n, problem.i, problem.P, problem.A, problem.G)
-print("SOL", problem.sol)
@@ -1,29 +1,232 @@
-from google import genai
+import hashlib
+import logging
 import os
+import threading
+import time
 
-# Initialize the GenAI client
-client = genai.Client(
-    api_key=os.environ["GOOGLE_API_KEY"]  # Ensure your API key is set as an environment variable
+import tracing
+from prompt_builder import estimate_tokens
+from resilience import CircuitBreaker, ResilientCaller
+from tracing import log_sampled
+
+log = logging.getLogger(__name__)
+
+MODEL = "gemini-3-flash-preview"
+
+# Seconds a Gemini call may take over all its retries; single requests time out after the same time
+DEADLINE = float(os.environ.get("GEMINI_DEADLINE", "20"))
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+TOKENS = tracing.counter(
+    "ie201_gemini_tokens_total", "Gemini tokens by kind (cached prompt, uncached prompt, output).", ("kind",)
 )
 
-def generate_story(prompt):
-    """Generate a story using the Gemini API with fallback for overload errors."""
-    try:
-        print(f"Sending Prompt to Gemini: {prompt}")  # Debugging: Confirm the prompt being sent
-        response = client.models.generate_content(
-            model="gemini-3-flash-preview",
-            contents=prompt,
-        )
-        print(f"Gemini response received: {response.text}")  # Debugging: Print API response
-        return response.text.strip()  # Return story content, trim whitespaces
-    except Exception as e:
-        # Handle specific API errors and exceptions
-        if isinstance(e, genai.errors.APIError) and e.code == 503:
-            print("Gemini API is currently overloaded. Falling back.")
-            return (
-                "The story generation system is currently overloaded and experiencing high traffic. "
-                "Please try again later."
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Create the GenAI client on first use (importing google-genai is slow, and it needs GOOGLE_API_KEY).
+
+    Set GEMINI_BASE_URL to send the requests somewhere else, e.g. to mock_llm_server.py.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from google import genai
+                from google.genai import types
+
+                base_url = os.environ.get("GEMINI_BASE_URL")
+                _client = genai.Client(
+                    api_key=os.environ["GOOGLE_API_KEY"],  # Ensure your API key is set as an environment variable
+                    http_options=types.HttpOptions(base_url=base_url, timeout=int(DEADLINE * 1000)),
+                )
+    return _client
+
+
+def is_retryable(e):
+    """Whether a failed Gemini request is worth repeating (overload, server and network errors)."""
+    import httpx
+    from google.genai import errors
+
+    if isinstance(e, errors.APIError):
+        return e.code in RETRYABLE_STATUS
+    return isinstance(e, (httpx.TransportError, ConnectionError, TimeoutError))
+
+
+# One caller per kind of call, as each hedges on the latencies of its own kind (the whole response for
+# generate_story, the first chunk for generate_story_stream); both share the circuit breaker
+breaker = CircuitBreaker(
+    int(os.environ.get("GEMINI_BREAKER_FAILURES", "5")), float(os.environ.get("GEMINI_BREAKER_RESET", "30"))
+)
+caller = ResilientCaller(
+    "gemini",
+    deadline=DEADLINE,
+    retries=int(os.environ.get("GEMINI_RETRIES", "2")),
+    hedge_delay=float(os.environ.get("GEMINI_HEDGE_DELAY", "10")),
+    breaker=breaker,
+    retryable=is_retryable,
+)
+stream_caller = ResilientCaller(
+    "gemini_stream",
+    deadline=DEADLINE,
+    retries=int(os.environ.get("GEMINI_RETRIES", "2")),
+    hedge_delay=float(os.environ.get("GEMINI_HEDGE_DELAY", "10")),
+    breaker=breaker,
+    retryable=is_retryable,
+)
+
+
+class ContextCache:
+    """
+    Gemini cached contents for static system prefixes (see prompt_builder.py), so calls that share a prefix are
+    billed for and wait on only their new tokens. A prefix is cached on first use and cached again shortly before
+    it expires. Prefixes under min_tokens (Gemini's minimum size for a cached content) are always sent with the
+    call and left to Gemini's implicit prefix caching. When Gemini refuses to cache one, the prefix is sent with
+    each call instead for retry_after seconds.
+    """
+
+    def __init__(self, ttl=3600, retry_after=600, min_tokens=1024):
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.min_tokens = min_tokens
+        self._names = {}  # prefix hash -> (cached content name, monotonic time to stop using it)
+        self._failed = {}  # prefix hash -> monotonic time of the failed attempt
+        self._creating = set()  # prefix hashes whose cached content is being created
+        self._lock = threading.Lock()
+
+    def name(self, system):
+        """The cached content name for a prefix, or None to send the prefix itself."""
+        if estimate_tokens(system) < self.min_tokens:
+            return None
+        key = hashlib.sha256(system.encode("utf-8")).hexdigest()
+        now = time.monotonic()
+        with self._lock:
+            name, expires = self._names.get(key, (None, 0))
+            if name and now < expires:
+                return name
+            if now - self._failed.get(key, -self.retry_after) < self.retry_after:
+                return None
+            if key in self._creating:
+                # Another request is creating it: send the prefix this time rather than wait
+                return None
+            self._creating.add(key)
+
+        # Create it outside the lock, so calls with other prefixes (or cached ones) never wait on this one
+        from google.genai import types
+        try:
+            cached = get_client().caches.create(
+                model=MODEL,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=system, ttl=f"{self.ttl}s", display_name=f"ie201-prefix-{key[:12]}"
+                ),
             )
-        else:
-            print(f"An unexpected error occurred while generating the story: {e}")
-            return "An error occurred while generating the story. Please contact support."
\ No newline at end of file
+        except Exception as e:
+            log.warning("Not caching the prompt prefix, sending it with each call: %s", e)
+            with self._lock:
+                self._failed[key] = now
+                self._creating.discard(key)
+            return None
+        with self._lock:
+            # Stop using it a minute early, so no call is sent with a cache that expires in flight
+            self._names[key] = (cached.name, now + max(self.ttl - 60, self.ttl / 2))
+            self._creating.discard(key)
+        return cached.name
+
+    def invalidate(self, system):
+        with self._lock:
+            self._names.pop(hashlib.sha256(system.encode("utf-8")).hexdigest(), None)
+
+
+context_cache = ContextCache(
+    ttl=int(os.environ.get("GEMINI_CONTEXT_CACHE_TTL", "3600")),
+    min_tokens=int(os.environ.get("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "1024")),
+)
+
+
+def generate_story(prompt, system=None, deadline=None):
+    """
+    Generate a story (or any answer) with the Gemini API.
+
+    :param system: Static system prefix shared by many calls (see prompt_builder.py), sent from the context cache.
+    :param deadline: Seconds the call may take over all retries (default GEMINI_DEADLINE).
+    :raises CircuitOpen: Straight away while Gemini is failing; callers fall back to the story templates.
+    :raises DeadlineExceeded: If Gemini did not answer in time.
+    :raises Exception: The API error, if the retries ran out or it is not retryable.
+    """
+    log_sampled(log, "Sending Prompt to Gemini: %s", prompt)  # Debugging: Confirm the prompt being sent
+    response = caller.call(_generate, prompt, system, deadline=deadline)
+    _count_tokens(response.usage_metadata)
+    log_sampled(log, "Gemini response received: %s", response.text)  # Debugging: Print API response
+    return response.text.strip()  # Return story content, trim whitespaces
+
+
+def generate_story_stream(prompt, system=None, deadline=None):
+    """
+    Like generate_story, but yield the response in chunks as Gemini generates it.
+
+    The deadline, retries and hedging apply until the first chunk arrives; a failure after that is raised.
+    """
+    log_sampled(log, "Streaming Prompt to Gemini: %s", prompt)
+    chunks, first = stream_caller.call(_start_stream, prompt, system, deadline=deadline, discard=_close_stream)
+    try:
+        usage = first.usage_metadata
+        yield first.text
+        for chunk in chunks:
+            usage = chunk.usage_metadata or usage
+            if chunk.text:
+                yield chunk.text
+        _count_tokens(usage)
+    finally:
+        _close_stream((chunks, first))
+
+
+def _with_system(request, prompt, system):
+    """Make a request, with the system prefix from the context cache (or inline) when there is one."""
+    from google.genai import errors, types
+
+    if not system:
+        return request(model=MODEL, contents=prompt)
+    name = context_cache.name(system)
+    if name:
+        try:
+            return request(model=MODEL, contents=prompt, config=types.GenerateContentConfig(cached_content=name))
+        except errors.ClientError as e:
+            if e.code not in (400, 403, 404):
+                raise
+            # The cached content expired or was deleted early; send the prefix with this call
+            log.warning("Cached prompt prefix %s unusable: %s", name, e)
+            context_cache.invalidate(system)
+    return request(model=MODEL, contents=prompt, config=types.GenerateContentConfig(system_instruction=system))
+
+
+def _generate(prompt, system):
+    return _with_system(get_client().models.generate_content, prompt, system)
+
+
+def _start_stream(prompt, system):
+    """Open a stream and wait for its first text chunk; returns (the rest of the stream, that chunk)."""
+    chunks = iter(_with_system(get_client().models.generate_content_stream, prompt, system))
+    for chunk in chunks:
+        if chunk.text:
+            return chunks, chunk
+    raise ValueError("Gemini returned an empty response")
+
+
+def _close_stream(stream):
+    """Close a stream opened by _start_stream(), and with it its HTTP connection (e.g. one that lost a hedge)."""
+    chunks, _ = stream
+    close = getattr(chunks, "close", None)
+    if close is not None:
+        close()
+
+
+def _count_tokens(usage):
+    if usage is None:
+        return
+    cached = usage.cached_content_token_count or 0
+    TOKENS.inc("cached", amount=cached)
+    TOKENS.inc("prompt", amount=(usage.prompt_token_count or 0) - cached)
+    TOKENS.inc("output", amount=usage.candidates_token_count or 0)
@@ -0,0 +1,313 @@
+"""
+Background jobs for slow calls, so they do not tie up request workers.
+
+A job runs in a bounded thread pool and is identified by a random job ID, which the page keeps and polls for the
+result. A streaming job also publishes its partial output as it goes, which the page can follow (see
+JobOutput). Finished jobs are kept for a while so their result can still be collected, then discarded.
+
+gunicorn runs several worker processes, and a poll may reach a different worker than the one running the job.
+So every job's status, partial output and result are also written to a JobStore, a SQLite file shared by the
+workers (JOB_STORE_PATH, or jobs.db): a worker answers for its own jobs from memory and for the others' from
+the store.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import tracing
+
+log = logging.getLogger(__name__)
+
+JOBS = tracing.counter("ie201_jobs_total", "Background jobs by outcome.", ("status",))
+
+STORE_PATH = os.environ.get("JOB_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs.db"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    result TEXT,
+    output TEXT NOT NULL DEFAULT '',
+    updated REAL NOT NULL
+)
+"""
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobStore:
+    """
+    Status ("pending", "done" or "error"), partial output and JSON result of every job, in a SQLite file shared
+    by the worker processes. The file is opened on first use, i.e. after gunicorn has forked the worker.
+    """
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _execute(self, sql, parameters=()):
+        """Run one statement (in its own transaction) and return its rows, or None if the store is unavailable."""
+        with self._lock:
+            try:
+                if self._db is None:
+                    self._db = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+                    self._db.execute("PRAGMA journal_mode=WAL")
+                    self._db.execute(SCHEMA)
+                with self._db:
+                    return self._db.execute(sql, parameters).fetchall()
+            except sqlite3.Error as e:
+                log.warning("Job store %s unavailable: %s", self.path, e)
+                return None
+
+    def create(self, job_id):
+        self._execute("INSERT OR REPLACE INTO jobs (id, status, updated) VALUES (?, 'pending', ?)",
+                      (job_id, time.time()))
+
+    def append(self, job_id, chunk):
+        self._execute("UPDATE jobs SET output = output || ?, updated = ? WHERE id = ?", (chunk, time.time(), job_id))
+
+    def finish(self, job_id, status, result=None):
+        self._execute("UPDATE jobs SET status = ?, result = ?, updated = ? WHERE id = ?",
+                      (status, json.dumps(result), time.time(), job_id))
+
+    def get(self, job_id):
+        """:return: (status, result, output, seconds since the job last changed), or None for an unknown job."""
+        rows = self._execute("SELECT status, result, output, updated FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        status, result, output, updated = rows[0]
+        return status, json.loads(result) if result else None, output, time.time() - updated
+
+    def discard(self, older_than):
+        """Delete the jobs that have not changed for older_than seconds."""
+        self._execute("DELETE FROM jobs WHERE updated < ?", (time.time() - older_than,))
+
+
+class JobOutput:
+    """Partial output (text chunks) that a streaming job appends to while it runs."""
+
+    def __init__(self, publish=None, publish_chunks=16, publish_interval=0.1):
+        """
+        :param publish: Optional callable also given the output (e.g. to write it to the JobStore), in batches of
+                        the chunks appended since the last one, once there are publish_chunks of them or
+                        publish_interval seconds have passed (and the rest on close()).
+        """
+        self.chunks = []
+        self.closed = False
+        self.publish_chunks = publish_chunks
+        self.publish_interval = publish_interval
+        self._publish = publish
+        self._unpublished = []
+        self._published = time.monotonic()
+        self._publish_lock = threading.Lock()
+        self._changed = threading.Condition()
+
+    def append(self, chunk):
+        with self._changed:
+            self.chunks.append(chunk)
+            self._changed.notify_all()
+        if self._publish is not None:
+            self._flush(chunk)
+
+    def _flush(self, chunk=None):
+        """Publish the unpublished chunks (with chunk) if a batch is due, or all of them without a chunk."""
+        with self._publish_lock:
+            if chunk is not None:
+                self._unpublished.append(chunk)
+                if (len(self._unpublished) < self.publish_chunks
+                        and time.monotonic() - self._published < self.publish_interval):
+                    return
+            if self._unpublished:
+                self._publish("".join(self._unpublished))
+            self._unpublished = []
+            self._published = time.monotonic()
+
+    def close(self):
+        if self._publish is not None:
+            self._flush()
+        with self._changed:
+            self.closed = True
+            self._changed.notify_all()
+
+    def follow(self, timeout=None):
+        """Yield every chunk, from the first, as it arrives until the job finishes (or timeout seconds pass idle)."""
+        index = 0
+        while True:
+            with self._changed:
+                if index == len(self.chunks) and not self.closed:
+                    self._changed.wait(timeout)
+                new_chunks = self.chunks[index:]
+                finished = self.closed or not new_chunks
+            index += len(new_chunks)
+            yield from new_chunks
+            if finished and index == len(self.chunks):
+                return
+
+
+class JobQueue:
+    def __init__(self, max_workers=4, max_queued=32, keep_seconds=600, store=None, stale_seconds=300,
+                 poll_interval=0.25, store_cleanup_interval=60):
+        """
+        :param max_workers: Jobs run at the same time.
+        :param max_queued: Maximum number of jobs queued or running; submit() raises JobQueueFull beyond it.
+        :param keep_seconds: How long a finished job's result is kept.
+        :param store: Optional JobStore shared with the other worker processes.
+        :param stale_seconds: A stored job still pending after this many seconds without a change is reported as
+                              failed (its worker has most likely been restarted).
+        :param poll_interval: Seconds between reads of the store while following another worker's job.
+        :param store_cleanup_interval: Minimum seconds between deletions of the expired jobs from the store.
+        """
+        self.max_queued = max_queued
+        self.keep_seconds = keep_seconds
+        self.stale_seconds = stale_seconds
+        self.poll_interval = poll_interval
+        self.store_cleanup_interval = store_cleanup_interval
+        self._store = store
+        self._store_cleaned = time.monotonic()
+        self._reserved = 0  # Jobs accepted by submit() but not yet started
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        tracing.gauge("ie201_job_queue_depth", "Background jobs queued or running.", self.depth)
+
+    def depth(self):
+        with self._lock:
+            return sum(1 for future, _, _ in self._jobs.values() if not future.done())
+
+    def submit(self, fn, *args, streaming=False):
+        """
+        Run fn(*args) in the background and return the job ID.
+
+        :param streaming: Also pass fn an output=JobOutput() keyword argument to publish partial output to.
+        """
+        with self._lock:
+            self._discard_expired()
+            if sum(1 for future, _, _ in self._jobs.values() if not future.done()) + self._reserved >= self.max_queued:
+                JOBS.inc("rejected")
+                raise JobQueueFull(f"{self.max_queued} jobs already queued")
+            self._reserved += 1
+        job_id = uuid.uuid4().hex
+        output = None
+        if streaming:
+            output = JobOutput(lambda text: self._store.append(job_id, text) if self._store else None)
+        try:
+            # The store is written outside the lock, so a slow or busy jobs.db never holds up the other requests
+            if self._store is not None:
+                self._store.create(job_id)
+                self._clean_store()
+            future = self._executor.submit(_run, fn, args, output)
+        except BaseException:
+            with self._lock:
+                self._reserved -= 1
+            raise
+        with self._lock:
+            self._reserved -= 1
+            self._jobs[job_id] = (future, time.monotonic(), output)
+        future.add_done_callback(lambda future: self._finish(job_id, future))
+        return job_id
+
+    def follow(self, job_id, timeout=None):
+        """
+        Iterator over the partial output of a streaming job as it arrives (see JobOutput.follow), or None for an
+        unknown job. The job may be running in another worker process, whose output is read from the store.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job[2].follow(timeout) if job[2] is not None else None
+        if self._store is None or self._store.get(job_id) is None:
+            return None
+        return self._follow_stored(job_id, timeout)
+
+    def _follow_stored(self, job_id, timeout):
+        sent, idle = 0, 0.0
+        while True:
+            job = self._store.get(job_id)
+            if job is None:
+                return
+            status, _, output, _ = job
+            if len(output) > sent:
+                yield output[sent:]
+                sent, idle = len(output), 0.0
+            if status != "pending" or (timeout and idle >= timeout):
+                return
+            time.sleep(self.poll_interval)
+            idle += self.poll_interval
+
+    def status(self, job_id, timeout=None):
+        """
+        :param timeout: Wait up to this many seconds for the job to finish.
+        :return: {"status": "pending"}, {"status": "done", "result": ...}, {"status": "error"}
+                 or {"status": "unknown"} for an expired or unknown job ID
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return self._stored_status(job_id, timeout)
+        future, _, _ = job
+        if timeout:
+            wait([future], timeout)
+        if not future.done():
+            return {"status": "pending"}
+        if future.exception() is not None:
+            return {"status": "error"}
+        return {"status": "done", "result": future.result()}
+
+    def _stored_status(self, job_id, timeout=None):
+        """The status of a job run by another worker process, from the store."""
+        deadline = time.monotonic() + (timeout or 0)
+        while True:
+            job = self._store.get(job_id) if self._store is not None else None
+            if job is None:
+                return {"status": "unknown"}
+            status, result, _, idle = job
+            if status == "done":
+                return {"status": "done", "result": result}
+            if status == "error" or idle > self.stale_seconds:
+                return {"status": "error"}
+            if time.monotonic() >= deadline:
+                return {"status": "pending"}
+            time.sleep(self.poll_interval)
+
+    def _finish(self, job_id, future):
+        if future.exception() is not None:
+            log.error("Background job failed", exc_info=future.exception())
+            JOBS.inc("error")
+            if self._store is not None:
+                self._store.finish(job_id, "error")
+        else:
+            JOBS.inc("done")
+            if self._store is not None:
+                self._store.finish(job_id, "done", future.result())
+
+    def _discard_expired(self):
+        cutoff = time.monotonic() - self.keep_seconds
+        expired = [job_id for job_id, (future, started, _) in self._jobs.items() if future.done() and started < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _clean_store(self):
+        """Delete the expired jobs of every worker from the store, at most every store_cleanup_interval seconds."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._store_cleaned < self.store_cleanup_interval:
+                return
+            self._store_cleaned = now
+        self._store.discard(self.keep_seconds + self.stale_seconds)
+
+
+def _run(fn, args, output):
+    if output is None:
+        return fn(*args)
+    try:
+        return fn(*args, output=output)
+    finally:
+        output.close()
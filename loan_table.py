@@ -0,0 +1,190 @@
+import base64
+import hashlib
+import struct
+import sys
+from array import array
+
+from cents import from_cents, to_cents
+from table_generator import BLANKABLE_COLUMNS, COLUMNS
+
+# Packed format: header (version, num_years, deferment_years, blank_year, blank column index)
+# followed by num_years * 9 little-endian int32 cent values, row by row
+PACK_VERSION = 1
+_HEADER = struct.Struct("<5B")
+
+
+class LoanRow:
+    """Read-only view of one year of a LoanTable; supports row["UB"], row.get() and row.Year."""
+
+    __slots__ = ("_table", "_index")
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    @property
+    def Year(self):
+        return self._index + 1
+
+    def __getitem__(self, column):
+        if column == "Year":
+            return self.Year
+        return self._table.value(self.Year, column)
+
+    def get(self, column, default=None):
+        try:
+            return self[column]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        row = {"Year": self.Year}
+        for column in COLUMNS:
+            row[column] = self[column]
+        return row
+
+
+class LoanTable:
+    """
+    Compact loan table: all cells are kept as integer cents in a single array, with the
+    blank cell's correct value stored in place and hidden when rows are read.
+    """
+
+    __slots__ = ("num_years", "deferment_years", "blank_year", "blank_column", "_cents")
+
+    def __init__(self, num_years, deferment_years, blank_year, blank_column, cents):
+        self.num_years = num_years
+        self.deferment_years = deferment_years
+        self.blank_year = blank_year
+        self.blank_column = blank_column
+        self._cents = cents
+
+    @classmethod
+    def from_rows(cls, table, missing_cell, deferment_years):
+        """Build a LoanTable from the (table, missing_cell, deferment_years) returned by generate_table()."""
+        cents = array("i")
+        for row in table:
+            for column in COLUMNS:
+                value = row[column]
+                if row["Year"] == missing_cell["Year"] and column == missing_cell["Column"]:
+                    value = missing_cell["CorrectValue"]
+                cents.append(to_cents(value))
+        return cls(len(table), deferment_years, missing_cell["Year"], missing_cell["Column"], cents)
+
+    @classmethod
+    def from_batch(cls, batch, k):
+        """Build a LoanTable for loan k of a generate_tables() batch."""
+        num_years = int(batch["num_years"][k])
+        cents = array("i")
+        for index in range(num_years):
+            for column in COLUMNS:
+                cents.append(int(batch["cents"][column][k, index]))
+        return cls(
+            num_years,
+            int(batch["deferment_years"][k]),
+            int(batch["blank_year"][k]),
+            BLANKABLE_COLUMNS[int(batch["blank_column"][k])],
+            cents,
+        )
+
+    def value_cents(self, year, column):
+        """Return the exact value of a cell (including the blank cell) in integer cents."""
+        return self._cents[(year - 1) * len(COLUMNS) + COLUMNS.index(column)]
+
+    def value(self, year, column, reveal=False):
+        """Return the value of a cell in dollars, or None for the blank cell unless reveal is set."""
+        if not reveal and year == self.blank_year and column == self.blank_column:
+            return None
+        return from_cents(self.value_cents(year, column))
+
+    @property
+    def missing_cell(self):
+        return {
+            "Year": self.blank_year,
+            "Column": self.blank_column,
+            "CorrectValue": self.value(self.blank_year, self.blank_column, reveal=True),
+        }
+
+    @property
+    def initial_balance(self):
+        return self.value(1, "UB", reveal=True)
+
+    @property
+    def interest_rate(self):
+        """Annual interest rate in percent, recovered from the first row."""
+        initial_balance = self.initial_balance
+        return (self.value(1, "Int", reveal=True) / initial_balance * 100) if initial_balance else 0
+
+    @property
+    def loan_payment(self):
+        return next((payment for payment in (self.value(year, "Ad", reveal=True)
+                                             for year in range(1, self.num_years + 1)) if payment > 0), 0)
+
+    def __len__(self):
+        return self.num_years
+
+    def __iter__(self):
+        for index in range(self.num_years):
+            yield LoanRow(self, index)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [LoanRow(self, i) for i in range(self.num_years)[index]]
+        if index < 0:
+            index += self.num_years
+        if not 0 <= index < self.num_years:
+            raise IndexError("LoanTable index out of range")
+        return LoanRow(self, index)
+
+    def to_dicts(self):
+        """Return the table in the generate_table() list-of-dicts format (blank cell as None)."""
+        return [row.to_dict() for row in self]
+
+    def pack(self):
+        header = _HEADER.pack(
+            PACK_VERSION,
+            self.num_years,
+            self.deferment_years,
+            self.blank_year,
+            BLANKABLE_COLUMNS.index(self.blank_column),
+        )
+        cents = array("i", self._cents)
+        if sys.byteorder != "little":
+            cents.byteswap()
+        return header + cents.tobytes()
+
+    @classmethod
+    def unpack(cls, data):
+        if len(data) < _HEADER.size:
+            raise ValueError("Packed LoanTable is truncated")
+        version, num_years, deferment_years, blank_year, blank_index = _HEADER.unpack_from(data)
+        if version != PACK_VERSION:
+            raise ValueError(f"Unsupported LoanTable pack version: {version}")
+        cents = array("i")
+        cents.frombytes(data[_HEADER.size:])
+        if sys.byteorder != "little":
+            cents.byteswap()
+        if len(cents) != num_years * len(COLUMNS):
+            raise ValueError("Packed LoanTable has the wrong number of cells")
+        return cls(num_years, deferment_years, blank_year, BLANKABLE_COLUMNS[blank_index], cents)
+
+    def dumps(self):
+        """Serialize to a short base85 string (suitable for the Flask session cookie)."""
+        return base64.b85encode(self.pack()).decode("ascii")
+
+    @classmethod
+    def loads(cls, text):
+        return cls.unpack(base64.b85decode(text))
+
+    def fingerprint(self):
+        """A short hash identifying the table's values and blank cell."""
+        return hashlib.sha256(self.pack()).hexdigest()[:16]
+
+    def __eq__(self, other):
+        if not isinstance(other, LoanTable):
+            return NotImplemented
+        return self.pack() == other.pack()
+
+    def __repr__(self):
+        return (f"LoanTable(num_years={self.num_years}, deferment_years={self.deferment_years}, "
+                f"blank=({self.blank_year}, {self.blank_column!r}))")
@@ -0,0 +1,295 @@
+"""
+A local BM25 retrieval index over the lecture materials in ie201_materials/.
+
+The materials (.txt, .md, and .pdf when pypdf is installed) are split into overlapping passages of about
+PASSAGE_WORDS words and indexed once into a NumPy file (materials_index.npz). The index holds, for every term,
+the passages containing it and their precomputed BM25 weights, so a query only adds up a few array slices and
+answers in well under a millisecond per term. The index is rebuilt when the files in the materials directory
+change; the app does this in a background thread (see get_index()), so deploys should build it beforehand
+with --build to have passages from the first request on. Only the Gemini generate call stays remote: the top
+passages are put into the tutoring prompt.
+
+Usage:
+    python materials_index.py --build
+    python materials_index.py "how is the unpaid interest after payment computed"
+"""
+import argparse
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MATERIALS_DIR = os.environ.get("MATERIALS_DIR", os.path.join(BASE_DIR, "ie201_materials"))
+INDEX_PATH = os.environ.get("MATERIALS_INDEX_PATH", os.path.join(BASE_DIR, "materials_index.npz"))
+SUFFIXES = {".pdf", ".txt", ".md"}
+
+PASSAGE_WORDS = 200
+OVERLAP_WORDS = 40
+INDEX_VERSION = 1
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+
+STOPWORDS = frozenset(
+    "a an and are as at be by do does for from how i if in is it its of on or that the this to was what when "
+    "where which who why will with you your".split()
+)
+
+
+def tokenize(text):
+    return [word for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in STOPWORDS]
+
+
+def read_material(path):
+    """The text of a material file, or None if it cannot be read (e.g. a PDF without pypdf installed)."""
+    if path.suffix.lower() != ".pdf":
+        return path.read_text(encoding="utf-8", errors="replace")
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        log.warning("Skipping %s: install pypdf to index PDFs", path.name)
+        return None
+    return "\n".join(page.extract_text() or "" for page in PdfReader(str(path)).pages)
+
+
+def material_files(materials_dir=MATERIALS_DIR):
+    directory = Path(materials_dir)
+    if not directory.is_dir():
+        return []
+    return sorted(p for p in directory.glob("*") if p.suffix.lower() in SUFFIXES and p.is_file())
+
+
+def materials_fingerprint(files):
+    """Changes whenever a file is added, removed or modified."""
+    digest = hashlib.sha256(str(INDEX_VERSION).encode())
+    for path in files:
+        stat = path.stat()
+        digest.update(f"{path.name}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def split_passages(text, words=PASSAGE_WORDS, overlap=OVERLAP_WORDS):
+    """Split text into passages of about the given number of words, overlapping by overlap words."""
+    tokens = text.split()
+    step = max(words - overlap, 1)
+    return [" ".join(tokens[k:k + words]) for k in range(0, max(len(tokens) - overlap, 1), step) if tokens[k:k + words]]
+
+
+class MaterialsIndex:
+    def __init__(self, terms, indptr, passage_ids, weights, passages, sources, fingerprint=""):
+        """
+        Postings in compressed sparse column form: the passages containing terms[t] are
+        passage_ids[indptr[t]:indptr[t + 1]], with their BM25 weights for the term in weights.
+        """
+        self.term_ids = {term: t for t, term in enumerate(terms)}
+        self.terms = terms
+        self.indptr = indptr
+        self.passage_ids = passage_ids
+        self.weights = weights
+        self.passages = passages
+        self.sources = sources
+        self.fingerprint = fingerprint
+
+    def __len__(self):
+        return len(self.passages)
+
+    @classmethod
+    def build(cls, materials_dir=MATERIALS_DIR):
+        files = material_files(materials_dir)
+        passages, sources = [], []
+        for path in files:
+            text = read_material(path)
+            if text:
+                for passage in split_passages(text):
+                    passages.append(passage)
+                    sources.append(path.name)
+
+        # Term frequencies of every (term, passage) pair
+        vocabulary = {}
+        term_ids, doc_ids, counts = [], [], []
+        lengths = np.zeros(len(passages), dtype=np.float32)
+        for d, passage in enumerate(passages):
+            tokens = tokenize(passage)
+            lengths[d] = len(tokens)
+            frequencies = {}
+            for token in tokens:
+                frequencies[token] = frequencies.get(token, 0) + 1
+            for token, count in frequencies.items():
+                term_ids.append(vocabulary.setdefault(token, len(vocabulary)))
+                doc_ids.append(d)
+                counts.append(count)
+        term_ids = np.array(term_ids, dtype=np.int32)
+        doc_ids = np.array(doc_ids, dtype=np.int32)
+        tf = np.array(counts, dtype=np.float32)
+
+        # Group the pairs by term and precompute the BM25 weight of each
+        order = np.argsort(term_ids, kind="stable")
+        term_ids, doc_ids, tf = term_ids[order], doc_ids[order], tf[order]
+        document_frequency = np.bincount(term_ids, minlength=len(vocabulary)).astype(np.float32)
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(document_frequency, out=indptr[1:])
+        n = len(passages)
+        idf = np.log1p((n - document_frequency + 0.5) / (document_frequency + 0.5))
+        average_length = lengths.mean() if n else 1.0
+        norm = K1 * (1 - B + B * lengths[doc_ids] / average_length)
+        weights = (idf[term_ids] * tf * (K1 + 1) / (tf + norm)).astype(np.float32)
+
+        terms = sorted(vocabulary, key=vocabulary.get)
+        return cls(terms, indptr, doc_ids, weights, passages, sources, materials_fingerprint(files))
+
+    def save(self, path=INDEX_PATH):
+        def packed(strings):
+            data = [s.encode("utf-8") for s in strings]
+            offsets = np.zeros(len(data) + 1, dtype=np.int64)
+            np.cumsum([len(d) for d in data], out=offsets[1:])
+            return np.frombuffer(b"".join(data), dtype=np.uint8), offsets
+
+        terms, term_offsets = packed(self.terms)
+        passages, passage_offsets = packed(self.passages)
+        sources, source_offsets = packed(self.sources)
+        # A temporary file of its own, as several workers may save a rebuilt index at the same time
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".materials_index-",
+                                        suffix=".npz")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(
+                    f, version=np.array(INDEX_VERSION), fingerprint=np.array(self.fingerprint),
+                    terms=terms, term_offsets=term_offsets, indptr=self.indptr, passage_ids=self.passage_ids,
+                    weights=self.weights, passages=passages, passage_offsets=passage_offsets,
+                    sources=sources, source_offsets=source_offsets,
+                )
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        """:raises ValueError: If the file is not an index of this version."""
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != INDEX_VERSION:
+                raise ValueError(f"{path} is an index of another version")
+
+            def unpacked(name, offsets_name):
+                blob, offsets = data[name].tobytes(), data[offsets_name]
+                return [blob[offsets[k]:offsets[k + 1]].decode("utf-8") for k in range(len(offsets) - 1)]
+
+            return cls(
+                unpacked("terms", "term_offsets"), data["indptr"], data["passage_ids"], data["weights"],
+                unpacked("passages", "passage_offsets"), unpacked("sources", "source_offsets"),
+                str(data["fingerprint"]),
+            )
+
+    def search(self, query, k=3):
+        """The k passages that best match the query: [(score, source file, passage)], best first."""
+        if not self.passages:
+            return []
+        scores = np.zeros(len(self.passages), dtype=np.float32)
+        for term in set(tokenize(query)):
+            t = self.term_ids.get(term)
+            if t is not None:
+                start, end = self.indptr[t], self.indptr[t + 1]
+                scores[self.passage_ids[start:end]] += self.weights[start:end]
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[d]), self.sources[d], self.passages[d]) for d in top if scores[d] > 0]
+
+
+def load_or_build(materials_dir=MATERIALS_DIR, path=INDEX_PATH):
+    """The saved index, rebuilt (and saved) first if the materials changed since it was built."""
+    fingerprint = materials_fingerprint(material_files(materials_dir))
+    try:
+        index = MaterialsIndex.load(path)
+        if index.fingerprint == fingerprint:
+            return index
+    except (OSError, ValueError, KeyError) as e:
+        log.info("Building the materials index (%s)", e)
+    index = MaterialsIndex.build(materials_dir)
+    try:
+        index.save(path)
+    except OSError as e:
+        log.warning("Could not save the materials index to %s: %s", path, e)
+    log.info("Indexed %d passages from %s", len(index), materials_dir)
+    return index
+
+
+_index = None
+_index_checked = None
+_refreshing = False
+_index_lock = threading.Lock()
+
+
+def get_index(check_interval=60.0):
+    """
+    The materials index, or None while there is none yet. The saved index is loaded on first use; checking
+    for changed materials (every check_interval seconds) and rebuilding happen in a background thread, and
+    the current index keeps being served until the new one is ready.
+    """
+    global _index, _index_checked, _refreshing
+    now = time.monotonic()
+    with _index_lock:
+        if _index_checked is None:
+            _index_checked = now - check_interval
+            try:
+                _index = MaterialsIndex.load()
+            except (OSError, ValueError, KeyError) as e:
+                log.info("No saved materials index yet (%s)", e)
+        if not _refreshing and now - _index_checked >= check_interval:
+            _refreshing = True
+            threading.Thread(target=_refresh_index, name="materials-index", daemon=True).start()
+        return _index
+
+
+def _refresh_index():
+    global _index, _index_checked, _refreshing
+    index = None
+    try:
+        current = _index
+        if current is None or current.fingerprint != materials_fingerprint(material_files()):
+            index = load_or_build()
+    except Exception:
+        log.exception("Could not refresh the materials index")
+    with _index_lock:
+        if index is not None:
+            _index = index
+        _index_checked = time.monotonic()
+        _refreshing = False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the local lecture materials index.")
+    parser.add_argument("query", nargs="?", help="Print the passages that best match this query")
+    parser.add_argument("--build", action="store_true", help="Rebuild the index even if the materials are unchanged")
+    parser.add_argument("-k", type=int, default=3, help="Passages to return")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.build:
+        started = time.perf_counter()
+        index = MaterialsIndex.build()
+        index.save()
+        print(f"Indexed {len(index)} passages ({len(index.terms)} terms) from {MATERIALS_DIR} "
+              f"in {time.perf_counter() - started:.2f}s")
+    else:
+        index = load_or_build()
+    if args.query:
+        started = time.perf_counter()
+        results = index.search(args.query, args.k)
+        print(f"{len(results)} passages in {(time.perf_counter() - started) * 1000:.2f} ms")
+        for score, source, passage in results:
+            print(f"\n[{source}] score {score:.2f}\n{passage}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""
+A local stand-in for the Gemini and OpenAI APIs, for load and latency testing without network access or cost.
+
+Speaks the subset of the HTTP APIs the app uses:
+    POST /v1beta/models/{model}:generateContent            (google-genai generate_content)
+    POST /v1beta/models/{model}:streamGenerateContent      (google-genai generate_content_stream, ?alt=sse)
+    POST /v1beta/cachedContents                            (google-genai caches.create, system instructions)
+    POST /v1/responses                                     (OpenAI responses.create, non-streaming)
+
+Answers are canned or templated and deterministic: the same prompt always gets the same answer (word problems
+are filled in from formatted_scenario_strings.json, tutoring answers name the blank column, evaluations get a
+score). Latency is drawn from a configurable distribution, and a share of requests can be failed with 503.
+
+Point the clients at it with
+    GEMINI_BASE_URL=http://127.0.0.1:8089 OPENAI_BASE_URL=http://127.0.0.1:8089/v1
+
+Usage:
+    python mock_llm_server.py --port 8089 --latency lognormal:0.8,0.5 --error-rate 0.05
+"""
+import argparse
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from story_templates import STORY_JSON_FILE, compile_template, render_template
+from table_generator import COLUMN_FORMULAS
+
+log = logging.getLogger(__name__)
+
+GEMINI_PATH = re.compile(r"^/v1(?:beta|alpha)?/models/(?P<model>[^/:]+):(?P<method>generateContent|streamGenerateContent)$")
+STORY_NUMBERS = re.compile(
+    r"borrows \$(?P<initial_balance>[\d,.]+) at an annual interest rate of (?P<interest_rate>[\d.]+)%\. "
+    r"Payments are deferred for (?P<deferment_years>\d+) years.*?annual payments of \$(?P<loan_payment>[\d,.]+) "
+    r"over (?:the next )?(?P<repayment_years>\d+) years",
+    re.S,
+)
+BLANK_CELL = re.compile(r"value for the `(?P<column>\w+)` in year `(?P<year>\d+)`")
+
+FEEDBACK = [
+    "The response guides the student with the relevant formula without revealing the blank value.",
+    "Clear explanation that stays within the approved terminology; an example row would help.",
+    "Helpful hints, but the wording drifts slightly from the vocabulary of the word problem.",
+]
+
+
+def parse_latency(spec):
+    """
+    Parse a latency distribution into a function of a random.Random returning seconds.
+
+    fixed:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA (a bare number is fixed).
+    """
+    kind, _, args = spec.partition(":")
+    if not args:
+        kind, args = "fixed", spec
+    values = [float(v) for v in args.split(",")]
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(*values)
+    if kind == "lognormal" and len(values) == 2:
+        median, sigma = values
+        return lambda rng: rng.lognormvariate(0.0, sigma) * median
+    raise argparse.ArgumentTypeError(f"Bad latency distribution {spec!r}")
+
+
+def load_templates(path=STORY_JSON_FILE):
+    with open(path, "r") as f:
+        texts = json.load(f)
+    templates = []
+    for text in texts:
+        try:
+            templates.append((text, compile_template(text)))
+        except (ValueError, TypeError, AttributeError):
+            pass
+    return templates
+
+
+def prompt_seed(prompt):
+    return int.from_bytes(hashlib.sha256(prompt.encode("utf-8")).digest()[:8], "big")
+
+
+class MockLLM:
+    """Turns prompts into deterministic answers and decides how long, and whether, to take to answer them."""
+
+    def __init__(self, latency="fixed:0.5", error_rate=0.0, chunk_words=8, chunk_interval=0.05, seed=None,
+                 templates_path=STORY_JSON_FILE):
+        """
+        :param latency: Distribution of the time to the first chunk (see parse_latency).
+        :param error_rate: Share of requests answered with 503 UNAVAILABLE.
+        :param chunk_words: Words per streamed chunk.
+        :param chunk_interval: Seconds between streamed chunks (a non-streaming answer takes as long in total).
+        :param seed: Seed of the latency and error draws (the answers are always seeded by the prompt).
+        """
+        self.latency = parse_latency(latency) if isinstance(latency, str) else latency
+        self.error_rate = error_rate
+        self.chunk_words = chunk_words
+        self.chunk_interval = chunk_interval
+        self.templates = load_templates(templates_path)
+        self.cached_contents = {}  # cached content name -> system instruction
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def answer(self, prompt):
+        rng = random.Random(prompt_seed(prompt))
+        if "Score (1-10)" in prompt:
+            return f"- Score (1-10): {rng.randint(5, 9)}\n- Feedback: {rng.choice(FEEDBACK)}"
+        if "Write a short word problem" in prompt:
+            text, parts = rng.choice(self.templates)
+            numbers = STORY_NUMBERS.search(prompt)
+            # Placeholders are kept when the prompt asks for a template (see scenario_builder.py)
+            return render_template(parts, numbers.groupdict()) if numbers else text
+        blank = BLANK_CELL.search(prompt)
+        column = blank.group("column") if blank else rng.choice(sorted(COLUMN_FORMULAS))
+        year = f" for year {blank.group('year')}" if blank else ""
+        return (
+            f"To find **{column}**{year}, start from the definitions used in the table.\n\n"
+            f"- {COLUMN_FORMULAS.get(column, 'Work from the values in the previous row of the table.')}\n"
+            f"- Check your method on a row where the value is already filled in.\n\n"
+            f"Work through the calculation step by step, and compare your result with the neighbouring rows."
+        )
+
+    def chunks(self, text):
+        words = text.split(" ")
+        return [
+            " ".join(words[k:k + self.chunk_words]) + (" " if k + self.chunk_words < len(words) else "")
+            for k in range(0, len(words), self.chunk_words)
+        ]
+
+    def draw(self):
+        """(seconds to the first chunk, whether to fail the request)."""
+        with self._lock:
+            return max(self.latency(self._rng), 0.0), self._rng.random() < self.error_rate
+
+
+def usage(prompt, text):
+    prompt_tokens = len(prompt.split())
+    output_tokens = len(text.split())
+    return prompt_tokens, output_tokens
+
+
+def gemini_response(model, text, prompt, finished=True, cached=""):
+    prompt_tokens, output_tokens = usage(prompt, text)
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+    if finished:
+        candidate["finishReason"] = "STOP"
+    response = {
+        "candidates": [candidate],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": output_tokens,
+            "totalTokenCount": prompt_tokens + output_tokens,
+        },
+        "modelVersion": model,
+    }
+    if cached:
+        response["usageMetadata"]["cachedContentTokenCount"] = len(cached.split())
+    return response
+
+
+def openai_response(model, text, prompt):
+    prompt_tokens, output_tokens = usage(prompt, text)
+    return {
+        "id": f"resp_{uuid.uuid4().hex}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "status": "completed",
+        "model": model,
+        "output": [{
+            "type": "message",
+            "id": f"msg_{uuid.uuid4().hex}",
+            "status": "completed",
+            "role": "assistant",
+            "content": [{"type": "output_text", "text": text, "annotations": []}],
+        }],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {
+            "input_tokens": prompt_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": prompt_tokens + output_tokens,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens_details": {"reasoning_tokens": 0},
+        },
+    }
+
+
+def content_text(contents):
+    return "\n".join(part.get("text", "") for content in contents for part in content.get("parts", []))
+
+
+def openai_prompt(body):
+    items = body.get("input", "")
+    if isinstance(items, str):
+        return items
+    texts = []
+    for item in items:
+        content = item.get("content", "")
+        if isinstance(content, str):
+            texts.append(content)
+        else:
+            texts.extend(part.get("text", "") for part in content)
+    return "\n".join(texts)
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    llm = None  # MockLLM, set by make_server
+
+    def handle_one_request(self):
+        try:
+            super().handle_one_request()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up waiting (a deadline or a hedged request that lost the race)
+            self.close_connection = True
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except ValueError:
+            return self.send_json(400, {"error": {"code": 400, "message": "Invalid JSON", "status": "INVALID_ARGUMENT"}})
+
+        gemini = GEMINI_PATH.match(url.path)
+        cached = ""
+        if url.path == "/v1beta/cachedContents":
+            return self.create_cached_content(body)
+        elif gemini:
+            if body.get("cachedContent"):
+                cached = self.llm.cached_contents.get(body["cachedContent"])
+                if cached is None:
+                    return self.send_json(404, {"error": {
+                        "code": 404, "message": "CachedContent not found", "status": "NOT_FOUND",
+                    }})
+            system = cached or content_text([body.get("systemInstruction", {})])
+            contents = content_text(body.get("contents", []))
+            prompt = f"{system}\n\n{contents}" if system else contents
+        elif url.path == "/v1/responses":
+            if body.get("stream"):
+                return self.send_json(400, {"error": {"message": "Streaming responses are not supported"}})
+            prompt = openai_prompt(body)
+        else:
+            return self.send_json(404, {"error": {"code": 404, "message": f"Unknown path {url.path}", "status": "NOT_FOUND"}})
+
+        text = self.llm.answer(prompt)
+        chunks = self.llm.chunks(text)
+        latency, fail = self.llm.draw()
+        time.sleep(latency)
+        if fail:
+            return self.send_json(503, {"error": {
+                "code": 503, "message": "The model is overloaded. Please try again later.", "status": "UNAVAILABLE",
+            }})
+
+        if gemini and gemini.group("method") == "streamGenerateContent":
+            return self.stream_gemini(gemini.group("model"), chunks, prompt, cached)
+        time.sleep(self.llm.chunk_interval * (len(chunks) - 1))
+        if gemini:
+            return self.send_json(200, gemini_response(gemini.group("model"), text, prompt, cached=cached))
+        return self.send_json(200, openai_response(body.get("model", "mock"), text, prompt))
+
+    def create_cached_content(self, body):
+        system = content_text([body.get("systemInstruction", {})]) + content_text(body.get("contents", []))
+        name = f"cachedContents/{hashlib.sha256(system.encode('utf-8')).hexdigest()[:16]}"
+        self.llm.cached_contents[name] = system
+        ttl = float(body.get("ttl", "3600s").rstrip("s"))
+        self.send_json(200, {
+            "name": name,
+            "displayName": body.get("displayName", ""),
+            "model": body.get("model", ""),
+            "createTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "expireTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + ttl)),
+            "usageMetadata": {"totalTokenCount": len(system.split())},
+        })
+
+    def stream_gemini(self, model, chunks, prompt, cached=""):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for k, chunk in enumerate(chunks):
+            if k:
+                time.sleep(self.llm.chunk_interval)
+            event = gemini_response(model, chunk, prompt, finished=k == len(chunks) - 1, cached=cached)
+            # Like Gemini, report the usage of the response so far
+            so_far = gemini_response(model, "".join(chunks[:k + 1]), prompt, cached=cached)
+            event["usageMetadata"] = so_far["usageMetadata"]
+            self.wfile.write(f"data: {json.dumps(event)}\r\n\r\n".encode("utf-8"))
+            self.wfile.flush()
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        log.debug("%s - %s", self.address_string(), format % args)
+
+
+def make_server(llm, host="127.0.0.1", port=8089):
+    handler = type("Handler", (MockLLMHandler,), {"llm": llm})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve canned Gemini and OpenAI answers for offline testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=parse_latency, default="fixed:0.5",
+                        help="Time to the first chunk: fixed:S, uniform:LOW,HIGH or lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failed with 503")
+    parser.add_argument("--chunk-words", type=int, default=8, help="Words per streamed chunk")
+    parser.add_argument("--chunk-interval", type=float, default=0.05, help="Seconds between streamed chunks")
+    parser.add_argument("--seed", type=int, help="Seed of the latency and error draws")
+    parser.add_argument("--templates", default=STORY_JSON_FILE, help="Story templates to fill in word problems from")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    llm = MockLLM(args.latency, args.error_rate, args.chunk_words, args.chunk_interval, args.seed,
+                  args.templates)
+    server = make_server(llm, args.host, args.port)
+    print(f"Mock LLM server on http://{args.host}:{args.port} "
+          f"(GEMINI_BASE_URL=http://{args.host}:{args.port} OPENAI_BASE_URL=http://{args.host}:{args.port}/v1)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
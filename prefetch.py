@@ -0,0 +1,92 @@
+"""
+Background-refilled pools of ready-to-serve problems.
+
+Each problem type has its own queue of fully built problems (tables, stories, charts, options). A
+daemon thread tops a queue up to the high watermark whenever it drops below the low watermark, so a
+request normally just pops a ready problem (a hit). If a queue is empty the problem is built inline
+(a miss). The thread is started on first use, i.e. after gunicorn has forked the worker.
+"""
+import atexit
+import logging
+import threading
+from collections import deque
+
+import tracing
+
+log = logging.getLogger(__name__)
+
+POOL_HITS = tracing.counter("ie201_prefetch_hits_total", "Problems served from a prefetch pool.", ("type",))
+POOL_MISSES = tracing.counter(
+    "ie201_prefetch_misses_total", "Problems built inline because a prefetch pool was empty.", ("type",)
+)
+
+
+class ProblemPool:
+    def __init__(self, producers, low_watermark=4, high_watermark=16, refill_interval=5.0):
+        """
+        :param producers: {problem type: callable returning one ready problem}
+        :param low_watermark: Refill a pool once it holds fewer than this many problems.
+        :param high_watermark: Refill a pool up to this many problems.
+        :param refill_interval: Seconds between background checks even when no pool ran low.
+        """
+        if not 0 <= low_watermark <= high_watermark:
+            raise ValueError("Expected 0 <= low_watermark <= high_watermark")
+        self.producers = dict(producers)
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.refill_interval = refill_interval
+        self._queues = {problem_type: deque() for problem_type in self.producers}
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        # Registered once: the refill thread may be restarted, e.g. after a fork
+        atexit.register(self.stop)
+        tracing.gauge(
+            "ie201_prefetch_pool_size", "Ready problems waiting in each prefetch pool.", self.sizes, ("type",)
+        )
+
+    def sizes(self):
+        return {problem_type: len(queue) for problem_type, queue in self._queues.items()}
+
+    def pop(self, problem_type):
+        """Return a ready problem of the given type, building one inline if the pool is empty."""
+        self._ensure_started()
+        queue = self._queues[problem_type]
+        try:
+            problem = queue.popleft()
+            POOL_HITS.inc(problem_type)
+        except IndexError:
+            POOL_MISSES.inc(problem_type)
+            problem = self.producers[problem_type]()
+        if len(queue) < self.low_watermark:
+            self._wakeup.set()
+        return problem
+
+    def stop(self, timeout=5.0):
+        """Stop the refill thread, waiting up to timeout seconds for the problem it is building."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._start_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="problem-prefetch", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            for problem_type, queue in self._queues.items():
+                if len(queue) >= self.low_watermark:
+                    continue
+                while len(queue) < self.high_watermark and not self._stopped.is_set():
+                    try:
+                        queue.append(self.producers[problem_type]())
+                    except Exception:
+                        log.exception("Error prefetching a %s problem", problem_type)
+                        break
+            self._wakeup.wait(self.refill_interval)
+            self._wakeup.clear()
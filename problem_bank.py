@@ -0,0 +1,233 @@
+"""
+Precomputed problem bank.
+
+build_bank() generates, validates and stores loan table problems (with their filled-in stories) and
+gen_q cash flow problems (with their pre-rendered charts) in a local SQLite file. At request time
+pick_loan_problem() / pick_cash_flow_problem() return a random entry with a single primary-key
+lookup, so no generation or chart rendering happens on the hot path.
+
+Usage:
+    python problem_bank.py --loans 5000 --cash-flows 3000
+"""
+import argparse
+import logging
+import math
+import os
+import random
+import sqlite3
+import threading
+
+log = logging.getLogger(__name__)
+
+BANK_PATH = os.environ.get(
+    "PROBLEM_BANK_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "problem_bank.db")
+)
+
+SCHEMA = """
+CREATE TABLE meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE loan_problems (
+    id INTEGER PRIMARY KEY,
+    problem_id TEXT NOT NULL,
+    difficulty INTEGER NOT NULL,
+    story TEXT NOT NULL
+);
+CREATE TABLE cash_flow_problems (
+    id INTEGER PRIMARY KEY,
+    problem_id TEXT NOT NULL,
+    problem_type TEXT NOT NULL,
+    difficulty INTEGER NOT NULL,
+    chart TEXT NOT NULL
+);
+"""
+
+
+def loan_difficulty(table):
+    """1 = blank cell falls in the deferment period, 2 = blank cell falls in the repayment period."""
+    return 1 if table.blank_year <= table.deferment_years else 2
+
+
+def cash_flow_difficulty(problem):
+    """1 = short horizon (n <= 6), 2 = long horizon."""
+    return 1 if problem.n <= 6 else 2
+
+
+class ProblemBank:
+    """Read-only view of a bank file. Entries of each (type, difficulty) group have contiguous ids."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self.meta = dict(self._connection().execute("SELECT key, value FROM meta"))
+        # (problem_type, difficulty) -> (first id, last id), per table
+        self.loan_groups = self._load_groups("SELECT NULL, difficulty, MIN(id), MAX(id) FROM loan_problems GROUP BY difficulty")
+        self.cash_flow_groups = self._load_groups(
+            "SELECT problem_type, difficulty, MIN(id), MAX(id) FROM cash_flow_problems GROUP BY problem_type, difficulty"
+        )
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.connection = connection
+        return connection
+
+    def _load_groups(self, query):
+        return {(problem_type, difficulty): (first, last)
+                for problem_type, difficulty, first, last in self._connection().execute(query)}
+
+    @staticmethod
+    def _pick_id(groups, problem_type=None, difficulty=None):
+        ranges = [id_range for (group_type, group_difficulty), id_range in groups.items()
+                  if (problem_type is None or group_type == problem_type)
+                  and (difficulty is None or group_difficulty == difficulty)]
+        if not ranges:
+            return None
+        first, last = random.choices(ranges, weights=[last - first + 1 for first, last in ranges], k=1)[0]
+        return random.randint(first, last)
+
+    def pick_loan_problem(self, difficulty=None):
+        """Return {"problem_id", "difficulty", "story"} for a random loan problem, or None."""
+        row_id = self._pick_id(self.loan_groups, difficulty=difficulty)
+        if row_id is None:
+            return None
+        problem_id, difficulty, story = self._connection().execute(
+            "SELECT problem_id, difficulty, story FROM loan_problems WHERE id = ?", (row_id,)
+        ).fetchone()
+        return {"problem_id": problem_id, "difficulty": difficulty, "story": story}
+
+    def pick_cash_flow_problem(self, problem_type=None, difficulty=None):
+        """Return {"problem_id", "type", "difficulty", "plot"} for a random cash flow problem, or None."""
+        row_id = self._pick_id(self.cash_flow_groups, problem_type, difficulty)
+        if row_id is None:
+            return None
+        problem_id, problem_type, difficulty, chart = self._connection().execute(
+            "SELECT problem_id, problem_type, difficulty, chart FROM cash_flow_problems WHERE id = ?", (row_id,)
+        ).fetchone()
+        return {"problem_id": problem_id, "type": problem_type, "difficulty": difficulty, "plot": chart}
+
+
+_bank = None
+_bank_checked = False
+_bank_lock = threading.Lock()
+
+
+def get_bank():
+    """Open the bank at BANK_PATH once per worker; returns None if no usable bank has been built."""
+    global _bank, _bank_checked
+    if not _bank_checked:
+        with _bank_lock:
+            if not _bank_checked:
+                _bank = _open_bank(BANK_PATH)
+                _bank_checked = True
+    return _bank
+
+
+def _open_bank(path):
+    if not os.path.exists(path):
+        return None
+    try:
+        bank = ProblemBank(path)
+    except sqlite3.Error as e:
+        log.error("Error opening problem bank %s: %s", path, e)
+        return None
+    # Problem IDs from other generator versions cannot be regenerated
+    if bank.meta != _generator_versions():
+        log.warning("Problem bank %s was built by other generator versions; rebuild it.", path)
+        return None
+    return bank
+
+
+def pick_loan_problem(difficulty=None):
+    bank = get_bank()
+    return bank.pick_loan_problem(difficulty) if bank else None
+
+
+def pick_cash_flow_problem(problem_type=None, difficulty=None):
+    bank = get_bank()
+    return bank.pick_cash_flow_problem(problem_type, difficulty) if bank else None
+
+
+# -------------------------
+# Offline builder
+# -------------------------
+def _generator_versions():
+    import gen_q
+    import table_generator
+
+    return {
+        "table_generator_version": str(table_generator.GENERATOR_VERSION),
+        "gen_q_version": str(gen_q.GENERATOR_VERSION),
+    }
+
+
+def _build_loan_problems(count):
+    from problem_id import load_loan_table, new_loan_problem_id
+    from story_templates import fetch_story_from_json, story_fields
+
+    rows = []
+    while len(rows) < count:
+        problem_id = new_loan_problem_id()
+        table = load_loan_table(problem_id)
+        story = fetch_story_from_json(**story_fields(table))
+
+        # Validate: the answer must be recoverable and the story fully filled in
+        correct_value = table.missing_cell["CorrectValue"]
+        if correct_value is None or not math.isfinite(correct_value):
+            continue
+        if story.startswith("Error fetching story") or "{" in story:
+            continue
+        rows.append((problem_id, loan_difficulty(table), story))
+    return rows
+
+
+def _build_cash_flow_problems(count):
+    from problem_id import CASH_FLOW_TYPES, new_cash_flow_problem
+    from charts import generate_cash_flow_chart
+
+    rows = []
+    problem_types = list(CASH_FLOW_TYPES.values())
+    while len(rows) < count:
+        # Degenerate problems (e.g. a uniform series of $0) are skipped, as when the app builds one itself
+        problem_id, problem = new_cash_flow_problem(problem_types[len(rows) % len(problem_types)])
+        chart = generate_cash_flow_chart(problem.cash_flows, problem.type, problem.i, problem.n, problem.sol)
+        rows.append((problem_id, problem.type, cash_flow_difficulty(problem), chart))
+        if len(rows) % 100 == 0:
+            print(f"Rendered {len(rows)}/{count} cash flow charts...")
+    return rows
+
+
+def build_bank(path=BANK_PATH, num_loans=5000, num_cash_flows=3000):
+    """Build a new bank file at path, replacing any existing one atomically."""
+    loan_rows = sorted(_build_loan_problems(num_loans), key=lambda row: row[1])
+    cash_flow_rows = sorted(_build_cash_flow_problems(num_cash_flows), key=lambda row: (row[1], row[2]))
+
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.executescript(SCHEMA)
+        connection.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", _generator_versions().items())
+        # Rows are inserted grouped by (type, difficulty) so each group is a contiguous id range
+        connection.executemany("INSERT INTO loan_problems (problem_id, difficulty, story) VALUES (?, ?, ?)", loan_rows)
+        connection.executemany(
+            "INSERT INTO cash_flow_problems (problem_id, problem_type, difficulty, chart) VALUES (?, ?, ?, ?)",
+            cash_flow_rows,
+        )
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(tmp_path, path)
+    print(f"Problem bank written to {path}: {len(loan_rows)} loan problems, {len(cash_flow_rows)} cash flow problems.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the precomputed problem bank.")
+    parser.add_argument("--loans", type=int, default=5000, help="Number of loan table problems")
+    parser.add_argument("--cash-flows", type=int, default=3000, help="Number of cash flow problems")
+    parser.add_argument("--output", default=BANK_PATH, help="Path of the bank file")
+    args = parser.parse_args()
+    build_bank(args.output, args.loans, args.cash_flows)
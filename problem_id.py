@@ -0,0 +1,111 @@
+"""
+Compact, seed-addressable problem IDs.
+
+A problem ID names everything needed to rebuild a problem on demand:
+
+    loan table:      L<generator version>-<seed hex>-<blank year><blank column index>   e.g. "L2-3f9c2a01-10"
+    cash flow:       C<generator version>-<seed hex>-<type letter>                      e.g. "C2-07b1e4d2-G"
+
+The version is table_generator.GENERATOR_VERSION or gen_q.GENERATOR_VERSION (both 2 at present), so IDs
+from an older generator are rejected instead of naming a different problem.
+
+Only the ID is kept in the session (and in forms); the table, cash flows and correct answer
+are regenerated from it whenever they are needed.
+"""
+import math
+import random
+
+import gen_q
+import table_generator
+from loan_table import LoanTable
+
+CASH_FLOW_TYPES = {"I": "Irregular", "U": "Uniform", "G": "Gradient"}
+
+
+def new_seed():
+    return random.getrandbits(32)
+
+
+def _split(problem_id, kind, version):
+    try:
+        prefix, seed, rest = problem_id.split("-")
+        if prefix[0] != kind or int(prefix[1:]) != version:
+            raise ValueError
+        return int(seed, 16), rest
+    except (AttributeError, IndexError, ValueError):
+        raise ValueError(f"Invalid or outdated problem ID: {problem_id!r}") from None
+
+
+# -------------------------
+# Loan tables
+# -------------------------
+def new_loan_problem_id(seed=None):
+    """Create the ID of a new loan table problem (the blank cell is the one drawn from the seed)."""
+    seed = new_seed() if seed is None else seed
+    _, missing_cell, _ = table_generator.generate_table(seed=seed)
+    return make_loan_problem_id(seed, missing_cell["Year"], missing_cell["Column"])
+
+
+def make_loan_problem_id(seed, blank_year, blank_column):
+    blank_index = table_generator.BLANKABLE_COLUMNS.index(blank_column)
+    return f"L{table_generator.GENERATOR_VERSION}-{seed:08x}-{blank_year}{blank_index}"
+
+
+def parse_loan_problem_id(problem_id):
+    """Return (seed, blank_year, blank_column) for a loan table problem ID."""
+    seed, blank = _split(problem_id, "L", table_generator.GENERATOR_VERSION)
+    if len(blank) != 2 or not blank.isdigit() or int(blank[1]) >= len(table_generator.BLANKABLE_COLUMNS):
+        raise ValueError(f"Invalid or outdated problem ID: {problem_id!r}")
+    return seed, int(blank[0]), table_generator.BLANKABLE_COLUMNS[int(blank[1])]
+
+
+def load_loan_table(problem_id):
+    """Regenerate the LoanTable (including its correct answer) named by a loan problem ID."""
+    seed, blank_year, blank_column = parse_loan_problem_id(problem_id)
+    table, missing_cell, deferment_years = table_generator.generate_table(seed=seed)
+    if not 1 <= blank_year <= len(table):
+        raise ValueError(f"Invalid or outdated problem ID: {problem_id!r}")
+
+    # Move the blank to the position named in the ID
+    table[missing_cell["Year"] - 1][missing_cell["Column"]] = missing_cell["CorrectValue"]
+    missing_cell = {
+        "Year": blank_year,
+        "Column": blank_column,
+        "CorrectValue": table[blank_year - 1][blank_column],
+    }
+    table[blank_year - 1][blank_column] = None
+    return LoanTable.from_rows(table, missing_cell, deferment_years)
+
+
+# -------------------------
+# Cash flow problems (gen_q.Problem)
+# -------------------------
+def make_cash_flow_problem_id(problem_type, seed=None):
+    seed = new_seed() if seed is None else seed
+    letter = next(letter for letter, name in CASH_FLOW_TYPES.items() if name == problem_type)
+    return f"C{gen_q.GENERATOR_VERSION}-{seed:08x}-{letter}"
+
+
+def load_cash_flow_problem(problem_id):
+    """Regenerate the gen_q.Problem (cash flows and solution) named by a cash flow problem ID."""
+    seed, letter = _split(problem_id, "C", gen_q.GENERATOR_VERSION)
+    if letter not in CASH_FLOW_TYPES:
+        raise ValueError(f"Invalid or outdated problem ID: {problem_id!r}")
+    problem = gen_q.Problem()
+    problem.type = CASH_FLOW_TYPES[letter]
+    problem.get_problem(seed=seed)
+    return problem
+
+
+def is_degenerate(problem):
+    """Whether a cash flow problem has no meaningful answer (e.g. a uniform series of $0), so is never served."""
+    return not math.isfinite(problem.sol) or problem.sol <= 0
+
+
+def new_cash_flow_problem(problem_type):
+    """Draw seeds until the problem is not degenerate; returns (problem ID, gen_q.Problem)."""
+    while True:
+        problem_id = make_cash_flow_problem_id(problem_type)
+        problem = load_cash_flow_problem(problem_id)
+        if not is_degenerate(problem):
+            return problem_id, problem
@@ -0,0 +1,229 @@
+"""
+The Gemini tutoring prompt, built in one place for the app (run.py) and the evaluation (gemini_evaluation.py).
+
+A prompt is split into a static system prefix (the tutoring rules, the table legend and a worked reference loan),
+which is byte-identical for every question so Gemini can cache it (see genai_story_generator.ContextCache; the
+reference loan also brings it over Gemini's minimum size for a cached content), and a compact suffix with the
+data of the problem at hand: the word problem, the loan details, the table, passages of the lecture materials
+(see materials_index.py), the question and the blank cell.
+"""
+from typing import NamedTuple
+
+import tracing
+from table_generator import COLUMN_FORMULAS, build_table
+
+PROMPT_TOKENS = tracing.histogram(
+    "ie201_prompt_tokens", "Estimated tokens per section of the tutoring prompts built.", ("section",),
+    buckets=(16, 32, 64, 128, 256, 512, 1024, 2048, 4096),
+)
+
+TABLE_ROWS = 5  # Rows of the loan table shown in the prompt
+COLUMNS = ("UB", "Int", "UIB", "AO", "Ad", "IPmt", "PPmt", "UIA", "UBA")
+
+TUTOR_INSTRUCTIONS = """\
+You are a chatbot embedded within an interactive educational tool designed to help undergraduate students in a \
+financial engineering course (Engineering Economy).
+
+**Scenario Context:**
+This tool is used to teach students about loan repayment, interest, including Unpaid Balance (UB), Interest Payment \
+(Int), Principal Payment (PPmt), and other finance-related topics. Always ensure the vocabulary and terminology in \
+your responses exactly match the wording used in the word problem of the question.
+
+**Rules for Answering Questions:**
+- Do not fully calculate the solution for any blank. Instead, guide the student by providing:
+    - The correct formula or equations.
+    - Definitions of variables as they relate to the table and word problem.
+    - General financial principles and reasoning.
+    - Example calculations from other rows in the table to demonstrate general methods applicable to their blank value.
+    - Hints to help the user figure out the problem for themselves.
+- Do NOT reveal the solution to any blank cell directly in your response.
+
+**Instructions for Answering**:
+- Your role is to guide students in understanding the concepts, not to provide full numerical answers to their \
+specific problem.
+- Try to provide concrete tips, insights, or partial steps to help the student learn how to solve the problem on \
+their own.
+- Avoid introducing new terminology or format conventions. Stick to the vocabulary and phrasing used in the word problem.
+- If applicable, use other rows from the table as examples to demonstrate principles or calculations.
+- Always write math descriptions and equations in plain text instead of using LaTeX. For example:
+    - Write `A = B * C` instead of `$A = B \\times C$`.
+    - Include simple plain English descriptions where necessary.
+
+**Loan Table Columns**:
+Each question comes with the first rows of its loan table, one row per year, in this column order. A missing value \
+is represented as `BLANK`.
+Year | UB (Unpaid Balance) | Int (Interest During Year) | UIB (Unpaid Interest Before Payment) | AO (Amount Owed) | \
+Ad (Loan Payment) | IPmt (Interest Payment) | PPmt (Principal Payment) | UIA (Unpaid Interest After Payment) | \
+UBA (Unpaid Balance After Payment)
+
+Always focus your response on being concise, helpful, and relevant to THIS specific problem."""
+
+# A loan the generator never produces (its balances are whole thousands up to $20,000 and its rates whole
+# percents), worked through in the system prefix
+REFERENCE_LOAN = {"num_years": 7, "deferment_years": 3, "interest_rate": 0.045, "initial_balance": 25000}
+
+
+def reference_section(loan=REFERENCE_LOAN):
+    """The column formulas and a loan table worked through, for the system prefix."""
+    table = build_table(**loan)
+    deferment_years = loan["deferment_years"]
+    deferred, first, later = table[deferment_years - 1], table[deferment_years], table[deferment_years + 1]
+    rate = loan["interest_rate"]
+    rows = "\n".join(" | ".join([str(row["Year"])] + [f"{row[column]:.2f}" for column in COLUMNS]) for row in table)
+    formulas = "\n".join(f"- {COLUMN_FORMULAS[column]}" for column in COLUMNS)
+    return f"""\
+**How Each Column Is Computed** (i is the annual interest rate; every value is rounded to the cent):
+{formulas}
+- A (the annual payment) = the UBA at the end of the deferment period * i * (1 + i)^n / ((1 + i)^n - 1), where n is \
+the number of repayment years. It is the same in every repayment year and repays the loan exactly in the last year.
+
+**Reference Loan** (an example for you only; the student's loan is a different one):
+A loan of {loan["initial_balance"]:.2f} USD at an annual interest rate of {rate * 100:.2f}% over {len(table)} years, \
+with payments deferred for the first {deferment_years} years and {len(table) - deferment_years} equal annual \
+payments of {first["Ad"]:.2f} USD after that. Its full table:
+{rows}
+
+How the reference loan's table is filled in:
+- Year 1: UB is the loan amount, {table[0]["UB"]:.2f}. Int = {rate} * {table[0]["UB"]:.2f} = {table[0]["Int"]:.2f}. \
+No payment is made during the deferment period (Ad = 0), so IPmt = PPmt = 0, the interest stays unpaid \
+(UIA = UIB = {table[0]["UIB"]:.2f}) and UBA = AO = {table[0]["AO"]:.2f}.
+- Year {deferred["Year"]} (the last deferment year): UB = {deferred["UB"]:.2f}, the previous year's UBA. \
+Int = {rate} * {deferred["UB"]:.2f} = {deferred["Int"]:.2f}. UIB = Int + the previous year's UIA = \
+{deferred["Int"]:.2f} + {table[deferment_years - 2]["UIA"]:.2f} = {deferred["UIB"]:.2f}. \
+AO = UB + Int = {deferred["AO"]:.2f}. With Ad = 0, UIA = UIB = {deferred["UIA"]:.2f} and UBA = AO = {deferred["UBA"]:.2f}.
+- Year {first["Year"]} (the first repayment year): A = {deferred["UBA"]:.2f} * {rate} * (1 + {rate})^\
+{len(table) - deferment_years} / ((1 + {rate})^{len(table) - deferment_years} - 1) = {first["Ad"]:.2f}. \
+UB = {first["UB"]:.2f}, Int = {first["Int"]:.2f}, UIB = {first["Int"]:.2f} + {deferred["UIA"]:.2f} = \
+{first["UIB"]:.2f}. The payment goes to the unpaid interest first: IPmt = the smaller of UIB and Ad = \
+{first["IPmt"]:.2f}, PPmt = Ad - IPmt = {first["Ad"]:.2f} - {first["IPmt"]:.2f} = {first["PPmt"]:.2f}, \
+UIA = UIB - IPmt = {first["UIA"]:.2f}, and UBA = AO - Ad = {first["AO"]:.2f} - {first["Ad"]:.2f} = {first["UBA"]:.2f}.
+- Year {later["Year"]} and after: the first payment paid off all the unpaid interest of this loan, so \
+UIB = Int, IPmt = Int and UIA = 0; \
+e.g. in year {later["Year"]}, IPmt = {later["IPmt"]:.2f} and PPmt = {later["Ad"]:.2f} - {later["IPmt"]:.2f} = \
+{later["PPmt"]:.2f}. In the last year UBA is 0.
+
+**Example of a Good Answer**:
+Student question (about the reference loan, with UIA in year {first["Year"]} blank): "How do I get the UIA?"
+Answer: "UIA (Unpaid Interest After Payment) is the interest still unpaid once this year's payment is made: \
+UIA = UIB - IPmt. Find UIB first: it is this year's Int plus the UIA carried over from year {deferred["Year"]}. \
+Then remember that the payment covers unpaid interest before any principal, so IPmt is the smaller of UIB and Ad. \
+Check your method on year {deferred["Year"]}, where Ad = 0, so IPmt = 0 and UIA = UIB = {deferred["UIB"]:.2f}.\""""
+
+
+TUTOR_SYSTEM = f"{TUTOR_INSTRUCTIONS}\n\n{reference_section()}"
+
+APPROVED_TERMINOLOGY = """
+
+**Approved Terminology:**
+The response must not include terminology or phrasing for describing financial engineering concepts outside the \
+provided set of approved examples. Be strict and harsh about this. An example of this would be using the term \
+'amortization', which does not appear in the approved examples. The approved examples are:
+"""
+
+
+class TutorPrompt(NamedTuple):
+    system: str  # Static prefix, identical for every question ("" for the prompt levels without one)
+    sections: dict  # Section name -> text of the per-question suffix, in order
+
+    @property
+    def suffix(self):
+        return "\n\n".join(self.sections.values())
+
+    @property
+    def text(self):
+        """The whole prompt as a single string."""
+        return f"{self.system}\n\n{self.suffix}" if self.system else self.suffix
+
+    def token_counts(self):
+        """Estimated tokens per section, the system prefix included."""
+        counts = {"system": estimate_tokens(self.system)} if self.system else {}
+        counts.update((name, estimate_tokens(text)) for name, text in self.sections.items())
+        return counts
+
+
+def estimate_tokens(text):
+    # About four characters per token for English text and numbers
+    return (len(text) + 3) // 4
+
+
+def tutor_system(approved_examples=()):
+    """The static system prefix, optionally with the approved terminology examples (see gemini_evaluation.py)."""
+    if not approved_examples:
+        return TUTOR_SYSTEM
+    examples = "\n".join(f"{k + 1}. {example}" for k, example in enumerate(approved_examples))
+    return TUTOR_SYSTEM + APPROVED_TERMINOLOGY + examples
+
+
+def table_markdown(table, rows=TABLE_ROWS):
+    """The first rows of a LoanTable as compact pipe-separated lines (columns as in TUTOR_INSTRUCTIONS)."""
+    return "\n".join(
+        " | ".join([str(row.Year)] + ["BLANK" if row[column] is None else f"{row[column]:.2f}" for column in COLUMNS])
+        for row in table[:rows]
+    )
+
+
+def materials_markdown(passages):
+    return "\n\n".join(f"[{source}] {passage}" for _, source, passage in passages)
+
+
+def tutor_prompt(table, story, question, prompt_level=1, approved_examples=(), passages=()):
+    """
+    Build the tutoring prompt for a student question about a LoanTable.
+
+    :param prompt_level: 1 = system prefix with the rules and all the problem data, 2 = the problem data only,
+                         0 = the question only.
+    :param approved_examples: Approved terminology examples to add to the system prefix.
+    :param passages: Lecture material passages relevant to the question, from materials_index.search().
+    :return: TutorPrompt
+    """
+    if prompt_level == 0:
+        sections = {"question": (
+            f"The student has asked the following question:\n\n{question}\n\n"
+            "Please provide a concise and clear explanation to help the student understand the concept."
+        )}
+        prompt = TutorPrompt("", sections)
+    else:
+        sections = {
+            "story": f"**Word Problem Context**:\n{story}",
+            "details": (
+                "**Relevant Loan Details:**\n"
+                f"- Principal Loan Amount: {table.initial_balance:.2f} USD\n"
+                f"- Annual Interest Rate: {table.interest_rate:.2f}%\n"
+                f"- Total Loan Period: {len(table)} years\n"
+                f"- Deferment Period: {table.deferment_years} years\n"
+                f"- Loan Repayment Amount Per Year (after deferment): {table.loan_payment or 'Unknown'} USD"
+            ),
+            "table": f"**Loan Table (first {min(len(table), TABLE_ROWS)} years)**:\n{table_markdown(table)}",
+        }
+        if passages:
+            sections["materials"] = (
+                "**Lecture Materials** (excerpts that may help answer the question):\n"
+                + materials_markdown(passages)
+            )
+        sections["question"] = f'**Student Question**:\n"{question}"'
+        if prompt_level == 1:
+            missing_cell = table.missing_cell
+            sections["blank"] = (
+                "**Specific Blank Context**:\nThe student is focused on calculating the value for the "
+                f"`{missing_cell.get('Column', 'Unknown')}` in year `{missing_cell.get('Year', 'Unknown')}`."
+            )
+        prompt = TutorPrompt(tutor_system(approved_examples) if prompt_level == 1 else "", sections)
+
+    for section, tokens in prompt.token_counts().items():
+        PROMPT_TOKENS.observe(tokens, section)
+    return prompt
+
+
+if __name__ == "__main__":
+    # Report the size of each section of a sample prompt
+    from problem_id import load_loan_table, new_loan_problem_id
+
+    sample_table = load_loan_table(new_loan_problem_id(seed=1))
+    sample = tutor_prompt(
+        sample_table,
+        "A local startup secures a business loan of $10,000.00 at an annual interest rate of 7.00%.",
+        f"How do I calculate the {sample_table.blank_column} for Year {sample_table.blank_year}?",
+    )
+    for name, count in sample.token_counts().items():
+        print(f"{name:>10}: ~{count} tokens")
+    print(f"{'suffix':>10}: ~{estimate_tokens(sample.suffix)} tokens of ~{estimate_tokens(sample.text)}")
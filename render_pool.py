@@ -0,0 +1,95 @@
+"""
+A process pool for chart rendering.
+
+matplotlib rendering is CPU-bound and holds the GIL for tens of milliseconds, which stalls every other thread of
+a threaded (or gevent) web worker. Charts are therefore rendered in a small pool of separate processes. The
+number of renders queued or running is bounded: when the pool is full, submit() raises RenderQueueFull and the
+caller renders in its own thread instead (the renderers in charts.py are thread-safe). The same happens when a
+rendering process dies.
+"""
+import atexit
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import tracing
+
+RENDER_REJECTED = tracing.counter(
+    "ie201_render_pool_rejected_total", "Renders not queued because the render pool was full."
+)
+
+
+class RenderQueueFull(Exception):
+    pass
+
+
+class RenderPool:
+    def __init__(self, processes=2, max_pending=32, timeout=10.0):
+        """
+        :param processes: Number of rendering processes.
+        :param max_pending: Maximum number of renders queued or running at once.
+        :param timeout: Seconds run() waits for a render before raising TimeoutError.
+        """
+        self.processes = processes
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = 0
+        self._executor = None
+        self._atexit_registered = False
+        self._lock = threading.Lock()
+        tracing.gauge("ie201_render_pool_pending", "Renders queued or running in the render pool.", lambda: self._pending)
+
+    def submit(self, fn, *args):
+        """Queue fn(*args) (a picklable, module-level function) and return its Future."""
+        if not self._slots.acquire(blocking=False):
+            RENDER_REJECTED.inc()
+            raise RenderQueueFull(f"{self.max_pending} renders already pending")
+        try:
+            try:
+                future = self._get_executor().submit(fn, *args)
+            except BrokenProcessPool:
+                # A rendering process died (e.g. killed for memory); start a fresh pool
+                self.shutdown()
+                future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending += 1
+        future.add_done_callback(self._release)
+        return future
+
+    def run(self, fn, *args):
+        """Render in the pool and wait for the result, or render in this thread if the pool is full."""
+        try:
+            future = self.submit(fn, *args)
+        except RenderQueueFull:
+            return fn(*args)
+        try:
+            return future.result(self.timeout)
+        except BrokenProcessPool:
+            return fn(*args)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def _get_executor(self):
+        # Started on first use, after gunicorn has forked the worker. The processes are spawned rather than
+        # forked, since forking a process that already runs threads is unsafe.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"))
+                if not self._atexit_registered:
+                    atexit.register(self.shutdown)
+                    self._atexit_registered = True
+            return self._executor
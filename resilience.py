@@ -0,0 +1,247 @@
+"""
+Deadlines, retries, hedging and a circuit breaker for calls to a slow, sometimes overloaded remote service.
+
+ResilientCaller.call(fn) runs fn in a thread pool and:
+- gives up with DeadlineExceeded once the call as a whole has taken deadline seconds,
+- retries retryable failures after a jittered exponential backoff ("full jitter": a random delay between 0 and
+  backoff_base * 2**attempt, at most backoff_max),
+- sends a duplicate (hedged) request when the first has not answered within the p95 of recent latencies, and
+  takes whichever answers first,
+- fails fast with CircuitOpen while the service is degraded: after failure_threshold calls in a row have
+  failed, calls are rejected for reset_timeout seconds, then a single trial call decides whether to close the
+  circuit again.
+
+Requests abandoned by a deadline or a winning hedge keep running in the pool until they finish, so fn should
+have its own (transport) timeout; the result of one that still succeeds is passed to the call's discard callback
+(e.g. to close a stream it opened).
+"""
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+
+import tracing
+
+log = logging.getLogger(__name__)
+
+CALLS = tracing.counter("ie201_remote_calls_total", "Remote calls by service and outcome.", ("service", "outcome"))
+ATTEMPTS = tracing.counter(
+    "ie201_remote_attempts_total", "Requests sent by service and kind (first, retry, hedge).", ("service", "kind")
+)
+CALL_DURATION = tracing.histogram("ie201_remote_call_seconds", "Duration of successful remote calls.", ("service",))
+
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class LatencyWindow:
+    """The latencies of the last size successful requests, for estimating a quantile."""
+
+    def __init__(self, size=200):
+        self._latencies = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def quantile(self, q, min_samples=20):
+        """The q quantile of the window, or None with fewer than min_samples latencies."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < min_samples:
+            return None
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        """
+        :param failure_threshold: Consecutive failed calls that open the circuit.
+        :param reset_timeout: Seconds the circuit stays open before a trial call is let through.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """:raises CircuitOpen: If calls are being rejected."""
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "closed":
+                return
+            if self.state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return
+        raise CircuitOpen("Circuit open: the service is failing, not calling it for now")
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                log.info("Circuit closed again")
+            self.state = "closed"
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    log.warning("Circuit opened after %d failed calls", self._failures)
+                self.state = "open"
+                self._opened = time.monotonic()
+
+
+class ResilientCaller:
+    def __init__(self, service, deadline=20.0, retries=2, backoff_base=0.5, backoff_max=4.0, hedge_quantile=0.95,
+                 hedge_delay=None, max_workers=16, breaker=None, retryable=lambda e: True):
+        """
+        :param service: Name of the service in the metrics.
+        :param deadline: Default seconds a call may take in total, over all its attempts.
+        :param retries: Retries after the first attempt fails.
+        :param hedge_quantile: Send a hedged request once the first has taken this quantile of recent latencies.
+        :param hedge_delay: Seconds to wait before hedging until there are enough latencies (None: no hedging then).
+        :param max_workers: Requests in flight at once (including abandoned ones still running).
+        :param retryable: Whether an exception is worth retrying; others fail the call straight away.
+        """
+        self.service = service
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_quantile = hedge_quantile
+        self.hedge_delay = hedge_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.retryable = retryable
+        self.latencies = LatencyWindow()
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix=f"{service}-call")
+        tracing.gauge(
+            "ie201_circuit_state", "Circuit breaker state by service (0 closed, 1 half open, 2 open).",
+            lambda: {(self.service,): CIRCUIT_STATES[self.breaker.state]}, ("service",),
+        )
+
+    def call(self, fn, *args, deadline=None, discard=None):
+        """
+        Call fn(*args) with the deadline, retries, hedging and circuit breaker, and return its result.
+
+        :param discard: Optional callable given the result of every abandoned request that succeeds anyway.
+
+        :raises CircuitOpen: Without calling fn, while the circuit is open.
+        :raises DeadlineExceeded: If no attempt succeeded within the deadline.
+        :raises Exception: The last attempt's exception, if it is not retryable or the retries ran out.
+        """
+        try:
+            self.breaker.allow()
+        except CircuitOpen:
+            CALLS.inc(self.service, "rejected")
+            raise
+        started = time.monotonic()
+        end = started + (deadline or self.deadline)
+        try:
+            result = self._attempts(fn, args, end, discard)
+        except Exception as e:
+            # Only failures of the service count against the circuit, not e.g. a bad request
+            if isinstance(e, DeadlineExceeded) or self.retryable(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            CALLS.inc(self.service, "timeout" if isinstance(e, DeadlineExceeded) else "error")
+            raise
+        self.breaker.record_success()
+        CALLS.inc(self.service, "ok")
+        CALL_DURATION.observe(time.monotonic() - started, self.service)
+        return result
+
+    def _attempts(self, fn, args, end, discard):
+        attempt = 0
+        while True:
+            try:
+                return self._hedged(fn, args, end, "first" if attempt == 0 else "retry", discard)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                if attempt >= self.retries or not self.retryable(e):
+                    raise
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                if time.monotonic() + delay >= end:
+                    raise
+                log.info("%s call failed (%s), retrying in %.2fs", self.service, e, delay)
+                time.sleep(delay)
+                attempt += 1
+
+    def _hedged(self, fn, args, end, kind, discard):
+        """One attempt: a request, plus a hedged duplicate if it is slow. Returns the first successful result."""
+        requests = [self._submit(fn, args, kind)]
+        winner = None
+        try:
+            winner = self._race(requests, fn, args, end)
+            return winner.result()
+        finally:
+            if discard is not None:
+                # The other requests lost the race (or all ran out of time): discard their results as they finish
+                for future in requests:
+                    if future is not winner:
+                        future.add_done_callback(partial(_discard_result, discard))
+
+    def _race(self, requests, fn, args, end):
+        """Wait for one of requests to succeed, adding a hedged request to them if it is slow. Returns its future."""
+        hedge_after = self.latencies.quantile(self.hedge_quantile)
+        if hedge_after is None:
+            hedge_after = self.hedge_delay
+        hedge_at = time.monotonic() + hedge_after if hedge_after is not None else None
+        pending = set(requests)
+        error = None
+        while pending:
+            now = time.monotonic()
+            if now >= end:
+                raise DeadlineExceeded(f"{self.service} call did not finish in time")
+            until = min(end, hedge_at) if hedge_at is not None else end
+            done, pending = wait(pending, max(until - now, 0), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future
+                error = future.exception()
+            if hedge_at is not None and time.monotonic() >= hedge_at and pending:
+                # The first request is slower than usual; race a duplicate against it
+                hedge = self._submit(fn, args, "hedge")
+                requests.append(hedge)
+                pending.add(hedge)
+                hedge_at = None
+        raise error
+
+    def _submit(self, fn, args, kind):
+        ATTEMPTS.inc(self.service, kind)
+
+        def timed():
+            started = time.monotonic()
+            result = fn(*args)
+            self.latencies.add(time.monotonic() - started)
+            return result
+
+        return self._executor.submit(timed)
+
+
+def _discard_result(discard, future):
+    if future.cancelled() or future.exception() is not None:
+        return
+    try:
+        discard(future.result())
+    except Exception:
+        log.warning("Could not discard the result of an abandoned request", exc_info=True)
@@ -1,20 +1,37 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, abort, make_response, jsonify, Response
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_login import LoginManager, UserMixin, login_user, logout_user, current_user, login_required
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SubmitField
 from wtforms.validators import InputRequired, Length, ValidationError
-import random
-import matplotlib
-import matplotlib.pyplot as plt
-matplotlib.use("Agg")  # Use the Agg backend for matplotlib
-from io import BytesIO
 import base64
-from gen_q import *
+import random
+import threading
+import time
+from chart_cache import ChartCache
+from concurrent.futures import TimeoutError as RenderTimeout
+from charts import get_backend, number_line_result
+from functools import partial
+from gen_q import Problem
+import logging
+import tracing
+from tracing import log_sampled, span
+from answer_cache import AnswerCache, answer_key, answer_template, fill_answer
+from cents import to_cents
+from jobs import JobQueue, JobQueueFull, JobStore
+from prefetch import ProblemPool
+from render_pool import RenderPool
+from materials_index import get_index as get_materials_index
+from prompt_builder import tutor_prompt
+from problem_bank import pick_cash_flow_problem, pick_loan_problem
+from story_templates import fetch_story_from_json, story_fields
+from problem_id import CASH_FLOW_TYPES, load_cash_flow_problem, load_loan_table, new_cash_flow_problem, new_loan_problem_id
 import os
 
-print("Current Working Directory:", os.getcwd())
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
+log = logging.getLogger(__name__)
+log.debug("Current Working Directory: %s", os.getcwd())
 
 # Initialize Flask app
 app = Flask(__name__, template_folder="app/templates")
@@ -28,11 +45,58 @@ else:
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Ready problems kept per type by the background prefetch pool (PREFETCH_HIGH_WATERMARK=0 disables it)
+app.config['PREFETCH_LOW_WATERMARK'] = int(os.environ.get("PREFETCH_LOW_WATERMARK", "4"))
+app.config['PREFETCH_HIGH_WATERMARK'] = int(os.environ.get("PREFETCH_HIGH_WATERMARK", "16"))
+# Rendered cash flow charts kept in memory for /chart/<key>.<format>
+app.config['CHART_CACHE_SIZE'] = int(os.environ.get("CHART_CACHE_SIZE", "512"))
+# "matplotlib" (PNG) or "svg" (written directly, no matplotlib in the worker)
+app.config['CHART_BACKEND'] = os.environ.get("CHART_BACKEND", "matplotlib")
+# matplotlib charts are rendered in a pool of processes (0 renders in the request thread), with at most
+# CHART_RENDER_QUEUE renders pending and CHART_RENDER_TIMEOUT seconds to wait for one
+app.config['CHART_RENDER_PROCESSES'] = int(os.environ.get("CHART_RENDER_PROCESSES", "2"))
+app.config['CHART_RENDER_QUEUE'] = int(os.environ.get("CHART_RENDER_QUEUE", "32"))
+app.config['CHART_RENDER_TIMEOUT'] = float(os.environ.get("CHART_RENDER_TIMEOUT", "10"))
+# Gemini questions are answered by background jobs: GEMINI_WORKERS at a time, at most GEMINI_MAX_QUEUED waiting
+app.config['GEMINI_WORKERS'] = int(os.environ.get("GEMINI_WORKERS", "4"))
+app.config['GEMINI_MAX_QUEUED'] = int(os.environ.get("GEMINI_MAX_QUEUED", "32"))
+# An answer stream is given up (the page falls back to polling) after this many seconds without a new chunk
+app.config['GEMINI_STREAM_IDLE_TIMEOUT'] = float(os.environ.get("GEMINI_STREAM_IDLE_TIMEOUT", "30"))
+# Each open answer stream holds a request thread (the Procfile runs 4 per worker) for the whole answer, so at
+# most GEMINI_MAX_STREAMS are served at once per worker; past that the page polls instead
+app.config['GEMINI_MAX_STREAMS'] = int(os.environ.get("GEMINI_MAX_STREAMS", "2"))
+# Tutoring answers are cached for ANSWER_CACHE_TTL seconds, ANSWER_CACHE_SIZE at most
+app.config['ANSWER_CACHE_SIZE'] = int(os.environ.get("ANSWER_CACHE_SIZE", "1000"))
+app.config['ANSWER_CACHE_TTL'] = float(os.environ.get("ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+# Lecture material passages (materials_index.py) added to each tutoring prompt; 0 turns retrieval off
+app.config['MATERIALS_TOP_K'] = int(os.environ.get("MATERIALS_TOP_K", "3"))
+
 # Initialize extensions
 db = SQLAlchemy(app)
 bcrypt = Bcrypt(app)
 login_manager = LoginManager(app)
 login_manager.login_view = "login"  # Redirect unauthenticated users to the login page
+tracing.init_app(app)  # Per-request timing and the /metrics endpoint
+render_cash_flow, render_number_line, chart_format = get_backend(app.config['CHART_BACKEND'])
+render_pool = None
+if app.config['CHART_BACKEND'] == "matplotlib" and app.config['CHART_RENDER_PROCESSES'] > 0:
+    render_pool = RenderPool(
+        app.config['CHART_RENDER_PROCESSES'], app.config['CHART_RENDER_QUEUE'], app.config['CHART_RENDER_TIMEOUT']
+    )
+chart_cache = ChartCache(render_cash_flow, app.config['CHART_CACHE_SIZE'], chart_format, render_pool)
+CHART_MIME_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+# Job status and answers are shared with the other gunicorn workers through a SQLite file (jobs.py)
+answer_jobs = JobQueue(app.config['GEMINI_WORKERS'], app.config['GEMINI_MAX_QUEUED'], store=JobStore())
+FIRST_CHUNK_LATENCY = tracing.histogram(
+    "ie201_gemini_first_chunk_seconds", "Time from starting a Gemini answer to its first streamed chunk."
+)
+answer_cache = AnswerCache(max_entries=app.config['ANSWER_CACHE_SIZE'], ttl=app.config['ANSWER_CACHE_TTL'])
+open_streams = 0
+open_streams_lock = threading.Lock()
+tracing.gauge("ie201_gemini_streams_open", "Answer streams being served by this worker.", lambda: open_streams)
+STREAMS_REFUSED = tracing.counter(
+    "ie201_gemini_streams_refused_total", "Answer streams refused at GEMINI_MAX_STREAMS (the page polls instead)."
+)
 
 
 # Models
@@ -113,10 +177,15 @@ def practice():
 
     # Handle submission (POST request)
     if request.method == "POST":
-        # Retrieve submitted answer and problem details
-        user_answer = float(request.form.get("answer"))
-        correct_answer = float(request.form.get("correct_answer"))
-        problem_type = request.form.get("problem_type")
+        # Retrieve submitted answer and regenerate the problem from its ID
+        user_answer = to_cents(request.form.get("answer"))
+        try:
+            problem = load_cash_flow_problem(request.form.get("problem_id"))
+        except ValueError:
+            flash("This problem has expired. Here is a new one.", "warning")
+            return redirect(url_for("practice"))
+        correct_answer = round(problem.sol, 2)
+        problem_type = problem.type
 
         # Record user progress in the database
         progress_entry = Progress.query.filter_by(user_id=current_user.id, problem_type=problem_type).first()
@@ -126,28 +195,74 @@ def practice():
 
         # Update progress counts
         progress_entry.attempt_count += 1
-        if user_answer == correct_answer:
+        if user_answer == to_cents(correct_answer):
             progress_entry.correct_count += 1
             flash("Correct! Well done!", "success")
         else:
             flash(f"Incorrect! The correct answer was ${correct_answer:.2f}.", "danger")
 
         # Commit changes to progress and reload for the next question
-        db.session.commit()
+        with span("db_commit"):
+            db.session.commit()
         return redirect(url_for("practice"))  # Redirect to a new question
 
     # Handle fresh question generation (GET request)
     else:
-        problem = generate_problem()  # Ensure a new problem is always generated
+        with span("generate_problem"):
+            problem = generate_problem()  # Ensure a new problem is always generated
 
         if problem["type"] in ["Irregular", "Uniform", "Gradient"]:
-            # Render cash flow problems
+            # Render cash flow problems; /chart only serves the charts of problems this session was given
+            served = session.get("chart_problem_ids", [])[-(MAX_SESSION_CHARTS - 1):]
+            session["chart_problem_ids"] = served + [problem["problem_id"]]
             return render_template("question.html", problem=problem)
         else:
             # Generate plot for arithmetic problems
-            plot = generate_number_line(problem["num1"], problem["num2"], problem["operation"])
+            with span("chart_render"):
+                result = number_line_result(problem["num1"], problem["num2"], problem["operation"])
+                args = (problem["num1"], problem["num2"], result)
+                image = render_pool.run(render_number_line, *args) if render_pool else render_number_line(*args)
+                plot = base64.b64encode(image).decode("utf-8")
             return render_template("question.html", problem=problem, plot=plot)
 
+# Charts of the most recent problems a session was served (e.g. in other tabs) that /chart still renders
+MAX_SESSION_CHARTS = 4
+
+
+def register_chart(problem):
+    """Register the chart of a gen_q.Problem with the chart cache and return its key."""
+    return chart_cache.register(problem.cash_flows, problem.type, problem.i, problem.n)
+
+
+@app.route("/chart/<problem_id>.<image_format>")
+@login_required
+def chart(problem_id, image_format):
+    if image_format != chart_cache.image_format or problem_id not in session.get("chart_problem_ids", []):
+        abort(404)
+    # The URL names the seed-addressable problem, so any worker (or a restarted one) can rebuild its chart
+    try:
+        key = register_chart(load_cash_flow_problem(problem_id))
+    except ValueError:
+        abort(404)
+    # The key is a hash of what the chart draws, so a cached copy never goes stale
+    if key in request.if_none_match:
+        response = make_response("", 304)
+    else:
+        try:
+            with span("chart_render"):
+                image = chart_cache.get(key)
+        except RenderTimeout:
+            log.warning("Timed out rendering chart %s", key)
+            abort(503)
+        if image is None:
+            abort(404)
+        response = make_response(image)
+        response.content_type = CHART_MIME_TYPES[image_format]
+    response.set_etag(key)
+    response.headers["Cache-Control"] = "private, max-age=31536000, immutable"
+    return response
+
+
 @app.route("/progress")
 @login_required
 def progress():
@@ -170,10 +285,11 @@ from flask import session
 import random
 import json
 
+VALIDATION_TOLERANCE_CENTS = 1
+
 @app.route("/interactive_table", methods=["GET", "POST"])
 @login_required
 def interactive_table():
-    from table_generator import generate_table
     from genai_story_generator import generate_story
 
     # Hints and Story Logic – Already Working, No Changes Required
@@ -186,38 +302,37 @@ def interactive_table():
         "UIA": "Unpaid Interest After Payment = Unpaid Interest Before Payment - Interest Payment",
     }
     AI_gen = False  # Flag for dynamic story generation
-    import os
-    JSON_FILE = os.path.join(os.path.dirname(__file__), "formatted_scenario_strings.json")
-
-    def fetch_story_from_json(**kwargs):
-        try:
-            with open(JSON_FILE, "r") as f:
-                stories = json.load(f)
-                story_template = random.choice(stories)
-                return story_template.format(**kwargs)
-        except Exception as e:
-            print(f"Error reading story from JSON: {e}")
-            return "Error fetching story. Please ensure the JSON file is formatted correctly."
 
     if request.method == "POST":
         action = request.form.get("action")
-        print(f"Action received: {action}")
+        log.debug("Action received: %s", action)
 
         if action == "new_table":
+            # Serve a ready problem (table and story) from the prefetch pool
+            if not AI_gen:
+                with span("prefetch_pool"):
+                    ready = problem_pool.pop("Loan")
+                session["problem_id"] = ready["problem_id"]
+                session["story"] = ready["story"]
+                session["show_hint"] = False
+                flash("New table and word problem generated!", "info")
+                return redirect(url_for("interactive_table"))
+
             # Generate a new table and missing cell
-            table, missing_cell, deferment_years = generate_table()
+            with span("generate_table"):
+                problem_id = new_loan_problem_id()
+                table = load_loan_table(problem_id)
+            deferment_years = table.deferment_years
 
-            session["table"] = table
-            session["missing_cell"] = missing_cell
+            session["problem_id"] = problem_id
             session["story"] = None
             session["show_hint"] = False
-            session["missing_column"] = missing_cell["Column"]
 
             # Generate or fetch a story
             try:
-                initial_balance = table[0].get("UB", 0)
-                interest_rate = (table[0]["Int"] / initial_balance * 100) if initial_balance else 0
-                loan_payment = next((row.get("Ad", 0) for row in table if row.get("Ad", 0) > 0), 0)
+                initial_balance = table.initial_balance
+                interest_rate = table.interest_rate
+                loan_payment = table.loan_payment
                 num_years = len(table)
 
                 if AI_gen:
@@ -245,19 +360,21 @@ def interactive_table():
                         "\n- Your response will be evaluated for compliance with these rules."
                     )
 
-                    print(f"Generated Story Prompt: {story_prompt}")
-                    story = generate_story(story_prompt)
+                    log_sampled(log, "Generated Story Prompt: %s", story_prompt)
+                    try:
+                        with span("generate_story"):
+                            story = generate_story(story_prompt)
+                    except Exception as e:
+                        # Gemini is failing or too slow (or the circuit is open): use a story template instead
+                        log.warning("Falling back to a story template: %s", e)
+                        with span("story_json"):
+                            story = fetch_story_from_json(**story_fields(table))
                 else:
-                    story = fetch_story_from_json(
-                        initial_balance=f"{initial_balance:,.2f}",
-                        interest_rate=f"{interest_rate:.2f}",
-                        deferment_years=str(deferment_years),
-                        loan_payment=f"{loan_payment:,.2f}",
-                        repayment_years=str(num_years - deferment_years),
-                    )
+                    with span("story_json"):
+                        story = fetch_story_from_json(**story_fields(table))
                 session["story"] = story
             except Exception as e:
-                print(f"Error generating or fetching story: {e}")
+                log.exception("Error generating or fetching story: %s", e)
                 flash("Unable to generate story. Please try again.", "danger")
 
             flash("New table and word problem generated!", "info")
@@ -275,131 +392,64 @@ def interactive_table():
                 PromptLevel = 1  # Default is detailed prompt, update this dynamically as needed (or user-configurable)
 
                 # Retrieve context from session
-                table = session.get("table", [])
-                missing_cell = session.get("missing_cell", {})
+                table = load_session_table()
+                if table is None:
+                    flash("Error: Missing session data. Please generate a new table.", "danger")
+                    return redirect(url_for("interactive_table"))
                 story = session.get("story", "No story available.")
-                principal_amount = table[0].get("UB", "Unknown") if table else "Unknown"
-                interest_rate = (
-                    (table[0].get("Int", 0) / principal_amount * 100) if principal_amount else "Unknown"
-                )
-                total_loan_period = len(table)
-                deferment_period = session.get("deferment_period", "Unknown")
-                annual_payment = next((row.get("Ad", 0) for row in table if row.get("Ad", 0) > 0), "Unknown")
-
-                # Build the table as part of the prompt
-                table_prompt = ""
-                for row in table[:5]:  # Limit rows for simplicity
-                    table_prompt += (
-                        f"| {row['Year']} | "
-                        f"{'BLANK' if row['UB'] is None else row['UB']} | "
-                        f"{'BLANK' if row['Int'] is None else row['Int']} | "
-                        f"{'BLANK' if row['UIB'] is None else row['UIB']} | "
-                        f"{row['AO']} | {row['Ad']} | "
-                        f"{'BLANK' if row['IPmt'] is None else row['IPmt']} | "
-                        f"{'BLANK' if row['PPmt'] is None else row['PPmt']} | "
-                        f"{row['UIA']} | {row['UBA']} |\n"
-                    )
-
-                # Generate detailed or simple prompts based on PromptLevel
-                if PromptLevel == 1:
-                    # Detailed prompt (PromptLevel = 1)
-                    prompt = f"""
-                    You are a chatbot embedded within an interactive educational tool designed to help undergraduate students in a financial engineering course (Engineering Economy). 
-
-                    **Scenario Context:**
-                    This tool is used to teach students about loan repayment, interest, including Unpaid Balance (UB), Interest Payment (Int), Principal Payment (PPmt), and other finance-related topics. 
-                    Always ensure the vocabulary and terminology in your responses exactly match the wording used in the provided story question below.
-
-                    **Rules for Answering Questions:**
-                    - Do not fully calculate the solution for any blank. Instead, guide the student by providing:
-                        - The correct formula or equations.
-                        - Definitions of variables as they relate to the table and story prompt.
-                        - General financial principles and reasoning.
-                        - Example calculations from other rows in the table to demonstrate general methods applicable to their blank value.
-                        - Hints to help the user figure out the problem for themselves.
-                    - Do NOT reveal the solution to any blank cell directly in your response.
-
-                    **Word Problem Context**:
-                    {story}
-
-                    **Relevant Loan Details:**
-                    - Principal Loan Amount: {principal_amount} USD
-                    - Annual Interest Rate: {interest_rate}%
-                    - Total Loan Period: {total_loan_period} years
-                    - Deferment Period: {deferment_period} years
-                    - Loan Repayment Amount Per Year (after deferment): {annual_payment} USD
-
-                    **Loan Table (Partial View)**:
-                    Below is the loan table generated for this question. Use this table to provide context for your answer. If a value is missing, it is represented as `BLANK`.
-
-                    | Year | UB (Unpaid Balance) | Int (Interest Payment) | UIB (Unpaid Interest Before Payment) | AO (Amount Owed) | Ad (Loan Payment) | IPmt (Interest Payment) | PPmt (Principal Payment) | UIA (Unpaid Interest After Payment) | UBA (Unpaid Balance After Payment) |
-                    |------|---------------------|------------------------|---------------------------------------|------------------|-------------------|--------------------------|---------------------------|--------------------------------------|------------------------------------|
-                    {table_prompt}
-
-                    **Student Question**:
-                    "{user_question}"
-
-                    **Specific Blank Context**:
-                    The student is focused on calculating the value for the `{missing_cell.get('Column', 'Unknown')}` in year `{missing_cell.get('Year', 'Unknown')}`.
-
-                    **Instructions for Answering**:
-                    - Your role is to guide students in understanding the concepts, not to provide full numerical answers to their specific problem.
-                    - Try to provide concrete tips, insights, or partial steps to help the student learn how to solve the problem on their own.
-                    - Avoid introducing new terminology or format conventions. Stick to the vocabulary and phrasing used in the word problem.
-                    - If applicable, use other rows from the table as examples to demonstrate principles or calculations.
-            - Always write math descriptions and equations in plain text instead of using LaTeX. For example:
-              - Write `A = B * C` instead of `$A = B \\times C$`.
-              - Include simple plain English descriptions where necessary.
-            
-
-                    Always focus your response on being concise, helpful, and relevant to THIS specific problem.
-                    """
-                else:
-                    # Simple prompt (PromptLevel = 0)
-                    prompt = f"The student has asked the following question:\n\n{user_question}\n\nPlease provide a concise and clear explanation to help the student understand the concept."
+                passages = search_materials(user_question)
+                prompt = tutor_prompt(table, story, user_question, PromptLevel, passages=passages)
 
                 # Logging the prompt (for debugging purposes)
-                print(f"Generated Gemini Prompt:\n{prompt}")
-
-                # Send prompt to Gemini and capture the response (mocked here)
-                gemini_response = generate_story(prompt)  # Replace with actual Gemini API call
-
-                # Convert Markdown response into HTML for frontend rendering
-                from markdown import markdown
-                gemini_response_html = markdown(gemini_response)
+                log_sampled(log, "Generated Gemini Prompt:\n%s\nEstimated tokens: %s", prompt.text, prompt.token_counts())
+
+                # Reuse the answer to the same question about a table of the same structure when there is one,
+                # with this table's numbers put in
+                cache_key = answer_key(user_question, table, story, passages, PromptLevel)
+                cached = answer_cache.get(cache_key)
+                answer = fill_answer(cached, table) if cached is not None else None
+                if answer is not None:
+                    from markdown import markdown
+                    with span("markdown"):
+                        session["gemini_answer"] = markdown(answer)
+                    session.pop("gemini_job", None)
+                    flash("Gemini has answered your question!", "success")
+                    return redirect(url_for("interactive_table"))
 
-                # Store the rendered response into the session
-                session["gemini_answer"] = gemini_response_html
-                flash("Gemini has answered your question!", "success")
+                # Answer in a background job; the page streams the answer from /gemini_stream/<job_id> (or polls
+                # /gemini_answer/<job_id> for the finished answer)
+                session["gemini_job"] = answer_jobs.submit(answer_question, prompt, cache_key, table, streaming=True)
+                session["gemini_job_asked"] = time.time()
+                session.pop("gemini_answer", None)
+                flash("Gemini is working on your question...", "info")
+            except JobQueueFull:
+                flash("Gemini is answering a lot of questions right now. Please try again in a moment.", "warning")
             except Exception as e:
-                print(f"Error while submitting question to Gemini: {e}")
+                log.exception("Error while submitting question to Gemini: %s", e)
                 flash("An error occurred while processing your question. Please try again.", "danger")
 
             return redirect(url_for("interactive_table"))
 
         elif action == "validate":
             try:
-                user_input = float(request.form.get("user_input"))
+                user_input = to_cents(request.form.get("user_input"))
                 missing_year = int(request.form.get("missing_year"))
                 missing_column = request.form.get("missing_column")
 
-                table = session.get("table")
-                missing_cell = session.get("missing_cell")
-                if not table or not missing_cell:
+                table = load_session_table()
+                if table is None:
                     flash("Error: Missing session data. Please generate a new table.", "danger")
                     return redirect(url_for("interactive_table"))
 
-                if missing_cell["Year"] == missing_year and missing_cell["Column"] == missing_column:
-                    correct_value = missing_cell["CorrectValue"]
-                    tolerance = 10
-                    if abs(user_input - correct_value) <= tolerance:
+                if table.blank_year == missing_year and table.blank_column == missing_column:
+                    # Values are exact integer cents, so only allow a one-cent slip
+                    correct_value = table.value_cents(table.blank_year, table.blank_column)
+                    if abs(user_input - correct_value) <= VALIDATION_TOLERANCE_CENTS:
                         flash("Correct! Great job!", "success")
                         session["show_hint"] = False
 
                         # Generate new table for next question
-                        table, missing_cell, deferment_years = generate_table()
-                        session["table"] = table
-                        session["missing_cell"] = missing_cell
+                        session["problem_id"] = new_loan_problem_id()
                         session["story"] = None
                         return redirect(url_for("interactive_table"))
                     else:
@@ -409,15 +459,16 @@ def interactive_table():
                 return redirect(url_for("interactive_table"))
 
             except Exception as e:
-                print(f"Error during validation: {e}")
+                log.warning("Error during validation: %s", e)
                 flash("Validation failed. Please try again.", "danger")
                 return redirect(url_for("interactive_table"))
 
-    table = session.get("table")
-    missing_cell = session.get("missing_cell")
+    collect_gemini_answer()
+    table = load_session_table()
+    missing_cell = table.missing_cell if table else None
     story = session.get("story")
     show_hint = session.get("show_hint", False)
-    missing_column = session.get("missing_column", None)
+    missing_column = table.blank_column if table else None
     hint = column_hints.get(missing_column, None) if show_hint and missing_column else None
 
     return render_template(
@@ -427,8 +478,159 @@ def interactive_table():
         story=story,
         show_hint=show_hint,
         hint=hint,
-        gemini_answer=session.get("gemini_answer")  # Pass Gemini answer if available
+        gemini_answer=session.get("gemini_answer"),  # Pass Gemini answer if available
+        gemini_job=session.get("gemini_job"),  # Or the job still working on it
+    )
+
+
+@app.route("/gemini_answer/<job_id>")
+@login_required
+def gemini_answer(job_id):
+    # Only the session that asked the question can collect its answer
+    if job_id != session.get("gemini_job"):
+        abort(404)
+    return jsonify(collect_gemini_answer())
+
+
+@app.route("/gemini_stream/<job_id>")
+@login_required
+def gemini_stream(job_id):
+    # Server-Sent Events: a "chunk" event with the answer so far rendered as HTML each time Gemini sends more,
+    # then "done" with the final answer (or "failed")
+    # The job may be running in another worker, whose output is read from the job store
+    chunks = answer_jobs.follow(job_id, app.config['GEMINI_STREAM_IDLE_TIMEOUT']) \
+        if job_id == session.get("gemini_job") else None
+    if chunks is None:
+        abort(404)
+    # Past the cap, refuse the stream: the page falls back to polling /gemini_answer/<job_id>
+    slot = open_stream()
+    if slot is None:
+        STREAMS_REFUSED.inc()
+        return Response("Too many answer streams, poll instead", 503, {"Retry-After": "1"})
+
+    def events():
+        from markdown import markdown
+        try:
+            text = ""
+            for chunk in chunks:
+                text += chunk
+                yield sse_event("chunk", {"html": markdown(text)})
+            job = answer_jobs.status(job_id, timeout=1.0)
+            if job["status"] == "done":
+                yield sse_event("done", {"html": job["result"]})
+            else:
+                yield sse_event("failed", {"status": job["status"]})
+        finally:
+            close_stream(slot)
+
+    response = Response(
+        events(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
+    # Also frees the slot if the client disconnects before the stream starts
+    response.call_on_close(partial(close_stream, slot))
+    return response
+
+
+def open_stream():
+    """Take one of the GEMINI_MAX_STREAMS stream slots of this worker; returns the slot, or None if none is free."""
+    global open_streams
+    with open_streams_lock:
+        if open_streams >= app.config['GEMINI_MAX_STREAMS']:
+            return None
+        open_streams += 1
+        return [True]
+
+
+def close_stream(slot):
+    """Give back a slot taken by open_stream(), once however often it is called."""
+    global open_streams
+    with open_streams_lock:
+        if slot:
+            slot.clear()
+            open_streams -= 1
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def answer_question(prompt, cache_key=None, table=None, output=None):
+    """
+    Ask Gemini a tutoring question (run as a background job) and return the answer rendered as HTML.
+
+    :param prompt: prompt_builder.TutorPrompt; its system prefix is sent from Gemini's context cache.
+    :param cache_key: Optional answer cache key to cache the answer under (see answer_cache.answer_template()).
+    :param table: The LoanTable asked about, whose numbers are replaced by placeholders in the cached answer.
+    :param output: Optional JobOutput to stream the answer to as Gemini generates it.
+
+    Gemini failures are raised, which fails the job; the page then shows an error instead of an answer.
+    """
+    from genai_story_generator import generate_story, generate_story_stream
+    from markdown import markdown
+
+    # Send prompt to Gemini and capture the response
+    started = time.perf_counter()
+    with span("generate_story"):
+        if output is None:
+            gemini_response = generate_story(prompt.suffix, system=prompt.system)
+        else:
+            for chunk in generate_story_stream(prompt.suffix, system=prompt.system):
+                if not output.chunks:
+                    FIRST_CHUNK_LATENCY.observe(time.perf_counter() - started)
+                output.append(chunk)
+            gemini_response = "".join(output.chunks).strip()
+    template = answer_template(gemini_response, table) if cache_key and table is not None else None
+    if template is not None:
+        answer_cache.put(cache_key, template, time.perf_counter() - started)
+
+    # Convert Markdown response into HTML for frontend rendering
+    with span("markdown"):
+        return markdown(gemini_response)
+
+
+def collect_gemini_answer():
+    """
+    Move the answer of the session's Gemini job, once it is finished, into the session.
+
+    :return: {"status": "pending"}, {"status": "done", "html": ...}, {"status": "error"} or {"status": "none"}
+    """
+    job_id = session.get("gemini_job")
+    if not job_id:
+        return {"status": "none"}
+    job = answer_jobs.status(job_id)
+    if job["status"] == "pending":
+        return job
+    if job["status"] == "unknown" and time.time() - session.get("gemini_job_asked", 0) < answer_jobs.stale_seconds:
+        # Not in the job store (yet, or the store is briefly unavailable): keep polling rather than give up
+        return {"status": "pending"}
+    session.pop("gemini_job")
+    session.pop("gemini_job_asked", None)
+    if job["status"] == "done":
+        session["gemini_answer"] = job["result"]
+        return {"status": "done", "html": job["result"]}
+    return {"status": "error"}
+
+def search_materials(query):
+    """The lecture material passages that best match a question (none if there are no materials or no index yet)."""
+    if not app.config['MATERIALS_TOP_K']:
+        return []
+    try:
+        with span("materials_search"):
+            index = get_materials_index()
+            return index.search(query, app.config['MATERIALS_TOP_K']) if index is not None else []
+    except Exception as e:
+        log.exception("Error searching the lecture materials: %s", e)
+        return []
+
+def load_session_table():
+    """Regenerate the LoanTable named by the session's problem ID, or None if there is none (or it is outdated)."""
+    problem_id = session.get("problem_id")
+    if not isinstance(problem_id, str):
+        return None
+    try:
+        return load_loan_table(problem_id)
+    except ValueError:
+        return None
 
 def generate_problem():
     # Get user progress to calculate correctness percentages
@@ -442,13 +644,45 @@ def generate_problem():
         else:
             response_percentages[entry.problem_type] = 0.0
 
-    # Generate a random problem
+    # Pick a type adaptively, then take a ready problem of that type from the prefetch pool
     problem = Problem()
     problem.get_type(response_percentages)  # Adjusting type selection adaptively
-    problem.get_problem()
+    with span("prefetch_pool"):
+        return problem_pool.pop(problem.type)
 
-    # Chart cash flows using matplotlib
-    plot = generate_cash_flow_chart(problem.cash_flows, problem.type, problem.i, problem.n, problem.sol)
+
+def build_loan_problem():
+    """Build a ready-to-serve loan problem: {"problem_id", "story"}."""
+    # Use a prebuilt problem from the problem bank when available
+    banked = pick_loan_problem()
+    if banked:
+        return {"problem_id": banked["problem_id"], "story": banked["story"]}
+
+    problem_id = new_loan_problem_id()
+    table = load_loan_table(problem_id)
+    return {"problem_id": problem_id, "story": fetch_story_from_json(**story_fields(table))}
+
+
+def build_cash_flow_problem(problem_type):
+    """Build a ready-to-serve cash flow problem of the given type, with its chart and answer options."""
+    # Use a prebuilt problem (with its pre-rendered chart) from the problem bank when available
+    banked = pick_cash_flow_problem(problem_type=problem_type)
+    if banked:
+        problem_id = banked["problem_id"]
+        problem = load_cash_flow_problem(problem_id)
+    else:
+        problem_id, problem = new_cash_flow_problem(problem_type)
+
+    # The page links to /chart/<problem_id>.<format>; start rendering the chart now (in the render pool, when
+    # there is one) so it is ready, or nearly, when the browser asks for it
+    chart = register_chart(problem)
+    if banked and chart_cache.image_format == "png":
+        chart_cache.put(chart, base64.b64decode(banked["plot"]))
+    elif render_pool:
+        chart_cache.prefetch(chart)
+    else:
+        with span("chart_render"):
+            chart_cache.get(chart)
 
     # Multiple-choice options
     correct_answer = round(problem.sol, 2)  # Round to 2 decimal places
@@ -459,80 +693,26 @@ def generate_problem():
     random.shuffle(options)
 
     return {
+        "problem_id": problem_id,
         "type": problem.type,
         "i": problem.i,
+        "P": problem.P,
         "n": problem.n,
         "cash_flows": problem.cash_flows,
         "correct_answer": correct_answer,
         "options": options,
-        "plot": plot,
+        "chart_format": chart_cache.image_format,
     }
 
-def generate_cash_flow_chart(cash_flows, problem_type, interest_rate, periods, solution):
-    fig, ax = plt.subplots(figsize=(10, 4))
-
-    # Plot cash flows as vertical bars
-    periods = list(cash_flows.keys())
-    flows = list(cash_flows.values())
-    ax.bar(periods, flows, width=0.3, color="blue", zorder=3)
-
-    # Dynamically set the Y-axis limit based on the highest cash flow
-    max_flow = max(flows) if flows else 0  # Safeguard against empty cash flows
-    ax.set_ylim(0, max_flow * 1.4)  # Add a buffer of 40% above the highest bar
-
-    # Add labels for each cash flow
-    for i, flow in enumerate(flows):
-        ax.text(
-            i,  # X position (center of each bar)
-            flow + (max_flow * 0.05),  # Slightly above each cash flow bar
-            f"${flow:,}",  # Format with comma separator
-            ha="center", va="bottom", fontsize=9  # Text styling
-        )
-
-    # Chart details
-    ax.set_title(f"Cash Flow Diagram (i={interest_rate * 100:.2f}%)", fontsize=14, pad=20)
-    ax.set_xlabel("Periods (n)", fontsize=12)
-    ax.set_ylabel("Cash Flow Amount", fontsize=12)
-    ax.axhline(0, color="black", linewidth=1.3)
-    ax.grid(True, linestyle="--", alpha=0.7)
-
-    # Convert plot to PNG for use in the template
-    buf = BytesIO()
-    plt.savefig(buf, format="png", bbox_inches="tight")
-    buf.seek(0)
-    encoded_image = base64.b64encode(buf.read()).decode("utf-8")
-    buf.close()
-    plt.close(fig)
-    return encoded_image
-
-def generate_number_line(num1, num2, operation):
-    result = None
-    if operation == "+":
-        result = num1 + num2
-    elif operation == "-":
-        result = num1 - num2
-    elif operation == "*":
-        result = num1 * num2
-    elif operation == "/":
-        result = round(num1 / num2, 2)
-
-    fig, ax = plt.subplots(figsize=(6, 2))
-    ax.hlines(0, -10, max(num1, num2, result) + 5, color='black')
-    ax.scatter([num1, num2, result], [0, 0, 0], color=['blue', 'orange', 'green'], zorder=3)
-    ax.text(num1, 0.2, f"{num1}", fontsize=10, ha='center')
-    ax.text(num2, 0.2, f"{num2}", fontsize=10, ha='center')
-    ax.text(result, 0.2, f"{result}", fontsize=10, ha='center')
-    ax.set_ylim(-1, 1)
-    ax.get_yaxis().set_visible(False)
-    ax.get_xaxis().tick_bottom()
-
-    buf = BytesIO()
-    plt.savefig(buf, format="png")
-    buf.seek(0)
-    encoded_plot = base64.b64encode(buf.read()).decode("utf-8")
-    buf.close()
-    return encoded_plot
 
+problem_pool = ProblemPool(
+    {
+        "Loan": build_loan_problem,
+        **{problem_type: partial(build_cash_flow_problem, problem_type) for problem_type in CASH_FLOW_TYPES.values()},
+    },
+    low_watermark=min(app.config['PREFETCH_LOW_WATERMARK'], app.config['PREFETCH_HIGH_WATERMARK']),
+    high_watermark=app.config['PREFETCH_HIGH_WATERMARK'],
+)
 
 # Run the application
 if __name__ == "__main__":
@@ -0,0 +1,283 @@
+"""
+Build a bank of word problem templates (scenarios) with Gemini.
+
+Scenarios are generated concurrently under a rate limit, and only kept when they are valid story templates
+(exactly the five placeholders, see story_templates.py) and not near-duplicates of a scenario already kept.
+Kept scenarios are appended to a JSONL store one line at a time, so a crash loses at most the scenario being
+written and an interrupted run resumes where it stopped. --export merges the store into the templates file
+the app serves stories from.
+
+Usage:
+    python scenario_builder.py --count 2000 --concurrency 8 --rate 120
+    python scenario_builder.py --export formatted_scenario_strings.json
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+
+from story_templates import STORY_JSON_FILE, compile_template
+
+log = logging.getLogger(__name__)
+
+STORE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenarios.jsonl")
+
+# Define the shared prompt to generate stories
+STORY_PROMPT = (
+    "Write a short word problem about a business or person who borrows ${initial_balance} at an annual interest "
+    "rate of {interest_rate}%. Payments are deferred for {deferment_years} years before entering repayment. "
+    "The repayment plan involves annual payments of ${loan_payment} over {repayment_years} years. "
+    "Describe the loan, deferral period, deferment years, and repayment terms without including explanations or solutions."
+)
+# Rotated through the prompts so the scenarios do not all describe the same borrower
+BORROWERS = [
+    "a small bakery", "a family farm", "a software startup", "a university student", "a dental practice",
+    "a food truck owner", "a manufacturing company", "a community hospital", "a landscaping business",
+    "a young couple buying equipment for their shop", "a city bus operator", "a craft brewery", "a bookstore",
+    "a solar installation company", "a veterinary clinic", "a trucking company", "a fitness studio",
+    "a biotech research lab", "a vineyard", "a freelance photographer",
+]
+
+SHINGLE_SIZE = 3
+
+
+def scenario_prompt(k):
+    return STORY_PROMPT + f" The borrower is {BORROWERS[k % len(BORROWERS)]}. Keep the placeholders in braces as written."
+
+
+def shingles(text):
+    """The set of SHINGLE_SIZE-word sequences of a scenario (lower case, punctuation dropped)."""
+    words = re.sub(r"[^\w{}\s]", " ", text.lower()).split()
+    return {" ".join(words[k:k + SHINGLE_SIZE]) for k in range(max(len(words) - SHINGLE_SIZE + 1, 1))}
+
+
+class NearDuplicateIndex:
+    """Finds scenarios whose word shingles overlap an earlier one's by at least the given Jaccard similarity."""
+
+    def __init__(self, threshold=0.6):
+        self.threshold = threshold
+        self._sizes = []
+        self._postings = {}  # shingle -> ids of the scenarios containing it
+
+    def __len__(self):
+        return len(self._sizes)
+
+    def is_duplicate(self, text):
+        own = shingles(text)
+        shared = Counter(k for shingle in own for k in self._postings.get(shingle, ()))
+        return any(
+            count / (len(own) + self._sizes[k] - count) >= self.threshold for k, count in shared.items()
+        )
+
+    def add(self, text):
+        own = shingles(text)
+        k = len(self._sizes)
+        self._sizes.append(len(own))
+        for shingle in own:
+            self._postings.setdefault(shingle, []).append(k)
+
+
+class RateLimiter:
+    """Allows at most rate calls per minute, evenly spaced, across threads."""
+
+    def __init__(self, rate):
+        self.interval = 60.0 / rate if rate else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class ScenarioStore:
+    """Append-only JSONL file of kept scenarios, one {"text", "borrower", "created"} record per line."""
+
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Return the stored records, dropping a torn last line left by a crash mid-write."""
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            log.warning("Dropping an incomplete last record from %s", self.path)
+            with open(self.path, "r+b") as f:
+                f.truncate(end)
+        records = []
+        for line in data[:end].splitlines():
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                log.warning("Skipping an unreadable record in %s", self.path)
+        return records
+
+    def append(self, record):
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            # One write of the whole line to an O_APPEND file, flushed to disk before the next one
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+
+def clean_scenario(text):
+    """The scenario text if it is a valid story template, else None."""
+    text = (text or "").strip().strip('"').strip()
+    try:
+        compile_template(text)
+    except ValueError:
+        return None
+    return text
+
+
+def load_templates(path=STORY_JSON_FILE):
+    """The valid templates in a templates JSON file (none if it does not exist)."""
+    try:
+        with open(path, "r") as f:
+            return [text for text in json.load(f) if clean_scenario(text)]
+    except FileNotFoundError:
+        return []
+
+
+def build_scenarios(count, store, concurrency=4, rate=60, threshold=0.6, max_attempts=None, known=()):
+    """
+    Generate scenarios until the store holds count of them.
+
+    :param rate: Maximum Gemini calls per minute.
+    :param threshold: Jaccard similarity of word shingles above which a scenario counts as a near-duplicate.
+    :param max_attempts: Give up after this many Gemini calls (default 3 * the number still needed).
+    :param known: Templates already in use; scenarios too similar to them are dropped too.
+    :return: {"kept", "invalid", "duplicate", "total"}
+    """
+    from genai_story_generator import generate_story
+
+    index = NearDuplicateIndex(threshold)
+    for text in known:
+        index.add(text)
+    stored = store.load()
+    for record in stored:
+        index.add(record["text"])
+    needed = count - len(stored)
+    stats = {"kept": 0, "invalid": 0, "duplicate": 0, "total": len(stored)}
+    if needed <= 0:
+        return stats
+    attempts_left = max_attempts if max_attempts is not None else 3 * needed
+    limiter = RateLimiter(rate)
+
+    def generate(k):
+        limiter.acquire()
+        return k, generate_story(scenario_prompt(k))
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        pending = set()
+        k = len(stored)
+        while stats["kept"] < needed and (pending or attempts_left > 0):
+            while attempts_left > 0 and len(pending) < 2 * concurrency and stats["kept"] + len(pending) < needed:
+                pending.add(executor.submit(generate, k))
+                k += 1
+                attempts_left -= 1
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    k_done, text = future.result()
+                except Exception as e:
+                    log.warning("Scenario generation failed: %s", e)
+                    stats["invalid"] += 1
+                    continue
+                scenario = clean_scenario(text)
+                if scenario is None:
+                    stats["invalid"] += 1
+                elif index.is_duplicate(scenario):
+                    stats["duplicate"] += 1
+                elif stats["kept"] < needed:
+                    index.add(scenario)
+                    store.append({
+                        "text": scenario,
+                        "borrower": BORROWERS[k_done % len(BORROWERS)],
+                        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    })
+                    stats["kept"] += 1
+                    if stats["kept"] % 50 == 0:
+                        print(f"Kept {stats['kept']}/{needed} new scenarios...")
+        for future in pending:
+            future.cancel()
+    stats["total"] = len(stored) + stats["kept"]
+    return stats
+
+
+def export_scenarios(store, path=STORY_JSON_FILE, threshold=0.6):
+    """
+    Merge the stored scenarios into a templates JSON file (existing templates first, near-duplicates dropped),
+    replacing it atomically. Returns the number of templates written.
+    """
+    templates = load_templates(path)
+    index = NearDuplicateIndex(threshold)
+    for text in templates:
+        index.add(text)
+    for record in store.load():
+        if not index.is_duplicate(record["text"]):
+            index.add(record["text"])
+            templates.append(record["text"])
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".scenarios-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(templates, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(templates)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate word problem templates with Gemini.")
+    parser.add_argument("--count", type=int, default=0, help="Generate until the store holds this many scenarios")
+    parser.add_argument("--concurrency", type=int, default=4, help="Gemini calls in flight at once")
+    parser.add_argument("--rate", type=float, default=60, help="Maximum Gemini calls per minute")
+    parser.add_argument("--similarity", type=float, default=0.6,
+                        help="Word-shingle Jaccard similarity above which a scenario is a near-duplicate")
+    parser.add_argument("--store", default=STORE_PATH, help="JSONL file the scenarios are appended to")
+    parser.add_argument("--templates", default=STORY_JSON_FILE,
+                        help="Templates already in use, which new scenarios must not duplicate")
+    parser.add_argument("--export", metavar="PATH", help="Merge the store into this templates JSON file")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    store = ScenarioStore(args.store)
+    if args.count:
+        stats = build_scenarios(
+            args.count, store, args.concurrency, args.rate, args.similarity, known=load_templates(args.templates)
+        )
+        print(f"Kept {stats['kept']} new scenarios ({stats['invalid']} invalid, {stats['duplicate']} near-duplicates "
+              f"dropped); {args.store} now holds {stats['total']}.")
+    if args.export:
+        total = export_scenarios(store, args.export, args.similarity)
+        print(f"Wrote {total} templates to {args.export}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+The word problem templates (formatted_scenario_strings.json), loaded once per worker.
+
+Each template must use exactly the five placeholders in PLACEHOLDERS. Templates are validated and split into
+literal text and placeholder parts when the file is loaded, so choosing and filling in a story is a pure
+in-memory operation. The file's modification time is checked (at most every check_interval seconds) and the
+templates are reloaded when it changes; invalid templates are logged and skipped. fetch_story_from_json() fills in
+a template for the app and the problem bank builder.
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+from string import Formatter
+
+log = logging.getLogger(__name__)
+
+STORY_JSON_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "formatted_scenario_strings.json")
+PLACEHOLDERS = frozenset({"initial_balance", "interest_rate", "deferment_years", "loan_payment", "repayment_years"})
+
+
+def compile_template(text):
+    """
+    Split a template into (literal text, placeholder name or None) parts.
+
+    :raises ValueError: If the template does not use exactly the five placeholders, or uses format specs,
+                        conversions or anything other than plain {name} fields.
+    """
+    parts = []
+    for literal, name, spec, conversion in Formatter().parse(text):
+        if name is not None and (spec or conversion or name not in PLACEHOLDERS):
+            raise ValueError(f"Unsupported placeholder {{{name}}}")
+        parts.append((literal, name))
+    missing = PLACEHOLDERS - {name for _, name in parts}
+    if missing:
+        raise ValueError(f"Missing placeholders: {', '.join(sorted(missing))}")
+    return tuple(parts)
+
+
+def render_template(parts, fields):
+    return "".join(literal + (fields[name] if name is not None else "") for literal, name in parts)
+
+
+class StoryTemplates:
+    def __init__(self, path=STORY_JSON_FILE, check_interval=2.0):
+        """
+        :param path: JSON file holding a list of template strings.
+        :param check_interval: Minimum seconds between checks of the file's modification time.
+        """
+        self.path = path
+        self.check_interval = check_interval
+        self._templates = ()
+        self._mtime = None
+        self._checked = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        self._reload_if_changed()
+        return len(self._templates)
+
+    def render(self, fields, rng=random):
+        """
+        Fill in a randomly chosen template.
+
+        :param fields: {placeholder: value} for the five placeholders (see run.story_fields).
+        :raises LookupError: If there are no valid templates.
+        """
+        self._reload_if_changed()
+        templates = self._templates
+        if not templates:
+            raise LookupError(f"No valid story templates in {self.path}")
+        return render_template(rng.choice(templates), fields)
+
+    def _reload_if_changed(self):
+        now = time.monotonic()
+        if self._checked is not None and now - self._checked < self.check_interval:
+            return
+        with self._lock:
+            if self._checked is not None and now - self._checked < self.check_interval:
+                return
+            self._reload()
+            # Only set once the templates are loaded, so no caller skips the check and finds none yet
+            self._checked = now
+
+    def _reload(self):
+        """Load the templates if the file changed (called with the lock held)."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime == self._mtime:
+                return
+            with open(self.path, "r") as f:
+                texts = json.load(f)
+        except (OSError, ValueError) as e:
+            log.error("Error reading story templates from %s: %s", self.path, e)
+            return
+
+        templates = []
+        for k, text in enumerate(texts):
+            try:
+                templates.append(compile_template(text))
+            except (ValueError, TypeError, AttributeError) as e:
+                log.warning("Skipping story template %d in %s: %s", k, self.path, e)
+        self._templates = tuple(templates)
+        self._mtime = mtime
+        log.info("Loaded %d story templates from %s", len(templates), self.path)
+
+
+# The app's templates, loaded once per worker and reloaded when formatted_scenario_strings.json changes
+story_templates = StoryTemplates(STORY_JSON_FILE)
+
+
+def fetch_story_from_json(**kwargs):
+    """A word problem from a randomly chosen template, filled in with kwargs (see story_fields)."""
+    try:
+        return story_templates.render(kwargs)
+    except Exception as e:
+        log.error("Error reading story from JSON: %s", e)
+        return "Error fetching story. Please ensure the JSON file is formatted correctly."
+
+
+def story_fields(table):
+    """Placeholder values for the story templates, taken from a LoanTable."""
+    return {
+        "initial_balance": f"{table.initial_balance:,.2f}",
+        "interest_rate": f"{table.interest_rate:.2f}",
+        "deferment_years": str(table.deferment_years),
+        "loan_payment": f"{table.loan_payment:,.2f}",
+        "repayment_years": str(len(table) - table.deferment_years),
+    }
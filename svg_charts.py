@@ -0,0 +1,134 @@
+"""
+SVG chart backend.
+
+Draws the same cash flow diagram and number line as the matplotlib backend in charts.py (title, axis labels,
+bars, value labels, zero line and dashed grid), but writes the SVG markup directly from string templates, so
+no figure, rasterization or matplotlib import is needed. Select it with CHART_BACKEND=svg.
+"""
+import math
+from xml.sax.saxutils import escape
+
+# Drawing area of the cash flow diagram, in SVG user units (pixels at 100 dpi, like the 10x4 inch figure)
+CASH_FLOW_WIDTH, CASH_FLOW_HEIGHT = 1000, 400
+CASH_FLOW_MARGINS = {"left": 90, "right": 20, "top": 55, "bottom": 55}
+NUMBER_LINE_WIDTH, NUMBER_LINE_HEIGHT = 600, 200
+NUMBER_LINE_MARGINS = {"left": 30, "right": 30, "top": 20, "bottom": 40}
+FONT = "DejaVu Sans, Arial, sans-serif"
+
+SVG_TEMPLATE = (
+    '<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" viewBox="0 0 {width} {height}" '
+    'font-family="{font}">\n'
+    '<rect width="{width}" height="{height}" fill="white"/>\n'
+    "{body}"
+    "</svg>\n"
+)
+LINE_TEMPLATE = '<line x1="{x1:.1f}" y1="{y1:.1f}" x2="{x2:.1f}" y2="{y2:.1f}" stroke="{color}" stroke-width="{width}"{extra}/>\n'
+RECT_TEMPLATE = '<rect x="{x:.1f}" y="{y:.1f}" width="{width:.1f}" height="{height:.1f}" fill="{color}"/>\n'
+CIRCLE_TEMPLATE = '<circle cx="{x:.1f}" cy="{y:.1f}" r="{r}" fill="{color}"/>\n'
+TEXT_TEMPLATE = '<text x="{x:.1f}" y="{y:.1f}" font-size="{size}" text-anchor="{anchor}"{extra}>{text}</text>\n'
+
+
+def _line(x1, y1, x2, y2, color="black", width=1, extra=""):
+    return LINE_TEMPLATE.format(x1=x1, y1=y1, x2=x2, y2=y2, color=color, width=width, extra=extra)
+
+
+def _text(x, y, text, size=10, anchor="middle", extra=""):
+    return TEXT_TEMPLATE.format(x=x, y=y, size=size, anchor=anchor, extra=extra, text=escape(str(text)))
+
+
+def _nice_ticks(low, high, max_ticks=7):
+    """Evenly spaced round tick values (steps of 1, 2, 2.5 or 5 times a power of ten) covering [low, high]."""
+    if high <= low:
+        return [low]
+    raw_step = (high - low) / max_ticks
+    magnitude = 10 ** math.floor(math.log10(raw_step))
+    step = next(m * magnitude for m in (1, 2, 2.5, 5, 10) if m * magnitude >= raw_step)
+    first = math.ceil(low / step - 1e-9)
+    last = math.floor(high / step + 1e-9)
+    return [k * step for k in range(first, last + 1)]
+
+
+def _format_tick(value):
+    return f"{value:,.0f}" if float(value).is_integer() else f"{value:,.1f}"
+
+
+def render_cash_flow_svg(cash_flows, problem_type, interest_rate, periods):
+    """The cash flow diagram as SVG bytes."""
+    margins = CASH_FLOW_MARGINS
+    left, top = margins["left"], margins["top"]
+    plot_width = CASH_FLOW_WIDTH - margins["left"] - margins["right"]
+    plot_height = CASH_FLOW_HEIGHT - margins["top"] - margins["bottom"]
+
+    periods = list(cash_flows.keys())
+    flows = list(cash_flows.values())
+    max_flow = max(flows) if flows else 0  # Safeguard against empty cash flows
+    y_max = max_flow * 1.4 or 1  # Add a buffer of 40% above the highest bar
+    x_min, x_max = (min(periods) - 0.5, max(periods) + 0.5) if periods else (-0.5, 0.5)
+
+    def x_pos(x):
+        return left + (x - x_min) / (x_max - x_min) * plot_width
+
+    def y_pos(y):
+        return top + plot_height - y / y_max * plot_height
+
+    body = []
+    # Dashed grid with tick labels
+    for tick in _nice_ticks(0, y_max):
+        body.append(_line(left, y_pos(tick), left + plot_width, y_pos(tick), "#b0b0b0", 0.8, ' stroke-dasharray="4,3"'))
+        body.append(_text(left - 6, y_pos(tick) + 4, _format_tick(tick), anchor="end"))
+    for period in periods:
+        body.append(_line(x_pos(period), top, x_pos(period), top + plot_height, "#b0b0b0", 0.8, ' stroke-dasharray="4,3"'))
+        body.append(_text(x_pos(period), top + plot_height + 16, period))
+
+    # Cash flows as vertical bars, labelled just above each bar
+    bar_width = 0.3 / (x_max - x_min) * plot_width
+    for period, flow in zip(periods, flows):
+        body.append(RECT_TEMPLATE.format(
+            x=x_pos(period) - bar_width / 2, y=y_pos(flow), width=bar_width, height=y_pos(0) - y_pos(flow), color="blue"
+        ))
+        body.append(_text(x_pos(period), y_pos(flow + max_flow * 0.05), f"${flow:,}", size=9))
+
+    # Axes, zero line and chart details
+    body.append(f'<rect x="{left}" y="{top}" width="{plot_width}" height="{plot_height}" fill="none" stroke="black"/>\n')
+    body.append(_line(left, y_pos(0), left + plot_width, y_pos(0), "black", 1.3))
+    body.append(_text(left + plot_width / 2, top - 20, f"Cash Flow Diagram (i={interest_rate * 100:.2f}%)", size=14))
+    body.append(_text(left + plot_width / 2, CASH_FLOW_HEIGHT - 12, "Periods (n)", size=12))
+    body.append(_text(
+        20, top + plot_height / 2, "Cash Flow Amount", size=12, extra=f' transform="rotate(-90 20 {top + plot_height / 2:.1f})"'
+    ))
+
+    return SVG_TEMPLATE.format(width=CASH_FLOW_WIDTH, height=CASH_FLOW_HEIGHT, font=FONT, body="".join(body)).encode("utf-8")
+
+
+def render_number_line_svg(num1, num2, result):
+    """A number line marking num1, num2 and the result, as SVG bytes."""
+    margins = NUMBER_LINE_MARGINS
+    left, top = margins["left"], margins["top"]
+    plot_width = NUMBER_LINE_WIDTH - margins["left"] - margins["right"]
+    plot_height = NUMBER_LINE_HEIGHT - margins["top"] - margins["bottom"]
+
+    line_end = max(num1, num2, result) + 5
+    x_min = min(-10, num1, num2, result)
+    padding = (max(line_end, num1, num2, result) - x_min) * 0.05  # Same 5% margins as matplotlib
+    x_min, x_max = x_min - padding, max(line_end, num1, num2, result) + padding
+
+    def x_pos(x):
+        return left + (x - x_min) / (x_max - x_min) * plot_width
+
+    def y_pos(y):
+        return top + (1 - y) / 2 * plot_height  # The y axis spans -1 to 1
+
+    body = [_line(x_pos(-10), y_pos(0), x_pos(line_end), y_pos(0))]
+    for value, color in zip((num1, num2, result), ("blue", "orange", "green")):
+        body.append(CIRCLE_TEMPLATE.format(x=x_pos(value), y=y_pos(0), r=4, color=color))
+        body.append(_text(x_pos(value), y_pos(0.2), value))
+
+    # Only the bottom (x) axis is shown
+    body.append(_line(left, top + plot_height, left + plot_width, top + plot_height))
+    for tick in _nice_ticks(x_min, x_max, max_ticks=8):
+        body.append(_line(x_pos(tick), top + plot_height, x_pos(tick), top + plot_height + 4))
+        body.append(_text(x_pos(tick), top + plot_height + 18, _format_tick(tick)))
+
+    return SVG_TEMPLATE.format(
+        width=NUMBER_LINE_WIDTH, height=NUMBER_LINE_HEIGHT, font=FONT, body="".join(body)
+    ).encode("utf-8")
@@ -0,0 +1,235 @@
+"""
+Sync the lecture materials in ie201_materials/ to a Gemini file search store, for hosted retrieval (gemini2.py
+--hosted; local retrieval is materials_index.py).
+
+The store is found by its display name and reused across runs. A manifest (materials_manifest.json) records the
+SHA-256 of every uploaded file and the store document it became, so only new or changed files are uploaded, and
+documents of changed or deleted files are removed. Uploads run concurrently (at most --concurrency at a time) and
+all pending indexing operations are polled together. The manifest is saved after every finished upload, so an
+interrupted sync resumes where it stopped. Each document also carries its file's hash as custom metadata, which
+lets a lost manifest be recovered from the store.
+
+Usage:
+    python sync_materials.py --concurrency 4
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from materials_index import BASE_DIR, MATERIALS_DIR, material_files
+
+log = logging.getLogger(__name__)
+
+STORE_DISPLAY_NAME = "ie201-lecture-materials"
+MANIFEST_PATH = os.path.join(BASE_DIR, "materials_manifest.json")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """{"store": store name, "files": {file name: {"sha256", "document"}}}, saved atomically."""
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.store = None
+        self.files = {}
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            self.store, self.files = data["store"], data["files"]
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError) as e:
+            log.warning("Ignoring unreadable manifest %s: %s", path, e)
+
+    def set(self, name, entry):
+        with self._lock:
+            if entry is None:
+                self.files.pop(name, None)
+            else:
+                self.files[name] = entry
+            self._save()
+
+    def reset(self, store, files):
+        with self._lock:
+            self.store, self.files = store, files
+            self._save()
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".manifest-", suffix=".json")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"store": self.store, "files": self.files}, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def find_or_create_store(client, display_name=STORE_DISPLAY_NAME, known=None):
+    """
+    The file search store with the display name, created if there is none.
+
+    :param known: Store name from the manifest, checked first (one call instead of listing every store).
+    """
+    if known:
+        try:
+            store = client.file_search_stores.get(name=known)
+            if store.display_name == display_name:
+                return store
+        except Exception as e:
+            log.info("Store %s from the manifest is gone: %s", known, e)
+    for store in client.file_search_stores.list(config={"page_size": 20}):
+        if store.display_name == display_name:
+            return store
+    store = client.file_search_stores.create(config={"display_name": display_name})
+    log.info("Created store %s", store.name)
+    return store
+
+
+def documents_in_store(client, store_name):
+    """{file name: {"sha256", "document"}} for the documents uploaded by this script, read back from the store."""
+    files = {}
+    for document in client.file_search_stores.documents.list(parent=store_name):
+        digest = next((m.string_value for m in document.custom_metadata or () if m.key == "sha256"), None)
+        if digest:
+            files[document.display_name] = {"sha256": digest, "document": document.name}
+    return files
+
+
+def sync(client, materials_dir=MATERIALS_DIR, display_name=STORE_DISPLAY_NAME, manifest_path=MANIFEST_PATH,
+         concurrency=4, poll_interval=2.0, dry_run=False):
+    """
+    Bring the store in line with the materials directory.
+
+    :param concurrency: Uploads in flight at once.
+    :param poll_interval: Seconds between polls of the pending indexing operations.
+    :return: (store name, {"uploaded", "unchanged", "deleted", "failed"})
+    """
+    manifest = Manifest(manifest_path)
+    store = find_or_create_store(client, display_name, manifest.store)
+    if manifest.store != store.name:
+        # New store, or no manifest yet: start from what the store already holds
+        manifest.reset(store.name, documents_in_store(client, store.name))
+
+    local = {path.name: (path, file_sha256(path)) for path in material_files(materials_dir)}
+    changed = [(path, digest) for name, (path, digest) in sorted(local.items())
+               if manifest.files.get(name, {}).get("sha256") != digest]
+    removed = [name for name in manifest.files if name not in local]
+    stats = {"uploaded": 0, "unchanged": len(local) - len(changed), "deleted": 0, "failed": 0}
+    if dry_run:
+        for path, _ in changed:
+            print("Would upload:", path.name)
+        for name in removed:
+            print("Would delete:", name)
+        return store.name, stats
+
+    for name in removed:
+        _delete_document(client, manifest.files[name].get("document"))
+        manifest.set(name, None)
+        stats["deleted"] += 1
+
+    def upload(path, digest):
+        return client.file_search_stores.upload_to_file_search_store(
+            file=str(path),
+            file_search_store_name=store.name,
+            config={
+                # This name shows up in citations
+                "display_name": path.name,
+                "custom_metadata": [{"key": "sha256", "string_value": digest}],
+            },
+        )
+
+    with ThreadPoolExecutor(max(concurrency, 1), thread_name_prefix="upload") as executor, \
+            ThreadPoolExecutor(max(concurrency, 1), thread_name_prefix="poll") as poller:
+        uploads = {executor.submit(upload, path, digest): (path, digest) for path, digest in changed}
+        operations = {}  # operation name -> (operation, path, digest)
+        while uploads or operations:
+            # Uploads that finished start their indexing operation
+            for future in [future for future in uploads if future.done()]:
+                path, digest = uploads.pop(future)
+                try:
+                    operation = future.result()
+                except Exception as e:
+                    log.error("Uploading %s failed: %s", path.name, e)
+                    stats["failed"] += 1
+                    continue
+                print("Uploaded:", path.name)
+                operations[operation.name] = (operation, path, digest)
+
+            # One round of polls of every pending operation, in parallel with the remaining uploads
+            polled = {name: poller.submit(client.operations.get, operation)
+                      for name, (operation, _, _) in operations.items()}
+            for name, future in polled.items():
+                _, path, digest = operations[name]
+                try:
+                    operation = future.result()
+                except Exception as e:
+                    log.warning("Polling the indexing of %s failed: %s", path.name, e)
+                    continue
+                if not operation.done:
+                    operations[name] = (operation, path, digest)
+                    continue
+                del operations[name]
+                if operation.error:
+                    log.error("Indexing %s failed: %s", path.name, operation.error)
+                    stats["failed"] += 1
+                    continue
+                old = manifest.files.get(path.name, {}).get("document")
+                document = operation.response.document_name if operation.response else None
+                manifest.set(path.name, {"sha256": digest, "document": document})
+                if old and old != document:
+                    _delete_document(client, old)
+                stats["uploaded"] += 1
+                print("Indexed:", path.name)
+            if uploads or operations:
+                time.sleep(poll_interval)
+    return store.name, stats
+
+
+def _delete_document(client, document):
+    if not document:
+        return
+    try:
+        client.file_search_stores.documents.delete(name=document, config={"force": True})
+    except Exception as e:
+        log.warning("Could not delete %s: %s", document, e)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sync the lecture materials to a Gemini file search store.")
+    parser.add_argument("--materials", default=MATERIALS_DIR, help="Directory of PDFs/TXTs/MDs")
+    parser.add_argument("--store-name", default=STORE_DISPLAY_NAME, help="Display name of the store to reuse")
+    parser.add_argument("--manifest", default=MANIFEST_PATH, help="Manifest of the uploaded files")
+    parser.add_argument("--concurrency", type=int, default=4, help="Uploads in flight at once")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds between polls of pending indexing")
+    parser.add_argument("--dry-run", action="store_true", help="Only print what would be uploaded and deleted")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    from genai_story_generator import get_client
+
+    started = time.perf_counter()
+    store_name, stats = sync(get_client(), args.materials, args.store_name, args.manifest, args.concurrency,
+                             args.poll_interval, args.dry_run)
+    print(f"{store_name}: {stats['uploaded']} uploaded, {stats['unchanged']} unchanged, {stats['deleted']} deleted, "
+          f"{stats['failed']} failed in {time.perf_counter() - started:.1f}s")
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
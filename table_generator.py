@@ -1,62 +1,94 @@
 import random
 
+import numpy as np
 
-def generate_table():
-    """Generate a realistic interactive table with deferred payments and precise loan payment calculations."""
-    num_years = random.randint(4, 8)  # Number of years (total period of the loan)
-    deferment_years = random.randint(1, num_years - 2)  # Deferment period (0 means immediate payments)
-    interest_rate = random.randint(5, 15) / 100  # Annual interest rate (5% to 15%)
-    initial_balance = random.randint(1, 20) * 1000  # Initial loan balance ($1,000 to $20,000)
-
-    # Calculate the annuity factor (A|P, i%, n)
-    def annuity_factor(i, n):
-        if i == 0:  # If 0% interest, avoid division by zero
-            return n
-        return (i * (1 + i) ** n) / ((1 + i) ** n - 1)
-
-    # Determine loan payment size (A)
-    repayment_years = num_years - deferment_years
-    capitalized_balance = initial_balance * (1 + interest_rate) ** deferment_years
-    if repayment_years > 0:
-        loan_payment = capitalized_balance * annuity_factor(interest_rate, repayment_years)
-    else:
-        loan_payment = 0  # If no repayment period is left, set payment to 0
+from cents import BP_PER_UNIT, from_cents, interest_cents, payment_cents, payment_cents_array, rate_to_bp, to_cents
 
-    table = []
-    missing_cell = None
-    ub_previous = initial_balance
-    uia_previous = 0
+# Columns of the loan table, in display order
+COLUMNS = ["UB", "Int", "UIB", "AO", "Ad", "IPmt", "PPmt", "UIA", "UBA"]
+# How each column is computed, in the words of the table (see schedule_row_cents(); i is the interest rate)
+COLUMN_FORMULAS = {
+    "UB": "UB (Unpaid Balance) = the previous year's UBA (the loan amount in year 1)",
+    "Int": "Int (Interest During Year) = i * UB",
+    "UIB": "UIB (Unpaid Interest Before Payment) = Int + the previous year's UIA",
+    "AO": "AO (Amount Owed) = UB + Int",
+    "Ad": "Ad (Loan Payment) = the annual payment A after the deferment period, 0 during it",
+    "IPmt": "IPmt (Interest Payment) = the smaller of UIB and Ad (payments go to unpaid interest first)",
+    "PPmt": "PPmt (Principal Payment) = Ad - IPmt",
+    "UIA": "UIA (Unpaid Interest After Payment) = UIB - IPmt",
+    "UBA": "UBA (Unpaid Balance After Payment) = AO - Ad",
+}
+# Columns that may be blanked out (UB, Int and Ad are never blanked)
+BLANKABLE_COLUMNS = ["UIB", "AO", "IPmt", "PPmt", "UIA", "UBA"]
+MAX_YEARS = 8
+# Bump whenever a change alters the table produced for a given seed (see problem_id.py)
+GENERATOR_VERSION = 2
 
-    for year in range(1, num_years + 1):
-        row = {}
-        row["Year"] = year
-        row["UB"] = round(ub_previous, 2) if ub_previous else 0  # Unpaid Balance
 
-        row["Int"] = round(interest_rate * ub_previous, 2) if ub_previous else 0  # Interest During Year
-        row["UIB"] = round(row["Int"] + uia_previous, 2)  # Unpaid Interest Before Payment
-        row["AO"] = round(row["UB"] + row["Int"], 2)  # Amount Owed
+def schedule_row_cents(ub, uia_previous, rate_bp, ad):
+    """
+    One row of the schedule in integer cents, from the balance (UB) and unpaid interest carried into the
+    year and the year's payment (Ad). The next year's UB and UIA are this row's UBA and UIA.
+    :return: A tuple of cents in COLUMNS order.
+    """
+    interest = interest_cents(ub, rate_bp)  # Interest During Year
+    uib = interest + uia_previous  # Unpaid Interest Before Payment
+    ao = ub + interest  # Amount Owed
+    ipmt = min(uib, ad)  # Interest payment
+    ppmt = ad - ipmt  # Principal payment
+    uia = uib - ipmt  # Unpaid Interest After Payment
+    uba = ao - ad  # Unpaid Balance After Payment
+    return ub, interest, uib, ao, ad, ipmt, ppmt, uia, uba
 
-        # Loan payment logic: no payment during deferment years
-        row["Ad"] = 0 if year <= deferment_years else round(loan_payment, 2)
 
-        # Interest payment logic
-        row["IPmt"] = round(min(row["UIB"], row["Ad"]), 2)
-        row["PPmt"] = round(row["Ad"] - row["IPmt"], 2)  # Principal payment
-        row["UIA"] = round(row["UIB"] - row["IPmt"], 2)  # Unpaid Interest After Payment
-        row["UBA"] = round(row["AO"] - row["Ad"], 2)  # Unpaid Balance After Payment
+def schedule_cents(num_years, deferment_years, rate_bp, principal_cents):
+    """
+    Compute the loan schedule in integer cents (see cents.py for the rounding rule).
+    :return: A list of rows, each a tuple of cents in COLUMNS order.
+    """
+    payment = payment_cents(principal_cents, rate_bp, deferment_years, num_years - deferment_years)
+
+    rows = []
+    ub = principal_cents
+    uia = 0
+    for year in range(1, num_years + 1):
+        ad = 0 if year <= deferment_years else payment  # No payment during deferment years
+        row = schedule_row_cents(ub, uia, rate_bp, ad)
+        rows.append(row)
+        # Carry UBA and UIA into the next year
+        ub, uia = row[-1], row[-2]
+    return rows
 
-        # Update tracking variables for subsequent rows
-        ub_previous = row["UBA"]
-        uia_previous = row["UIA"]
 
+def build_table(num_years, deferment_years, interest_rate, initial_balance):
+    """Build the full loan table (no blank cell) for the given loan parameters."""
+    rows = schedule_cents(num_years, deferment_years, rate_to_bp(interest_rate), to_cents(initial_balance))
+    table = []
+    for year, cells in enumerate(rows, start=1):
+        row = {"Year": year}
+        for column, value in zip(COLUMNS, cells):
+            row[column] = from_cents(value)
         table.append(row)
+    return table
+
+
+def generate_table(seed=None):
+    """
+    Generate a realistic interactive table with deferred payments and precise loan payment calculations.
+    :param seed: Optional seed; the same seed always regenerates the same table and blank cell.
+    """
+    rng = random.Random(seed) if seed is not None else random
+    num_years = rng.randint(4, 8)  # Number of years (total period of the loan)
+    deferment_years = rng.randint(1, num_years - 2)  # Deferment period (0 means immediate payments)
+    interest_rate = rng.randint(5, 15) / 100  # Annual interest rate (5% to 15%)
+    initial_balance = rng.randint(1, 20) * 1000  # Initial loan balance ($1,000 to $20,000)
+
+    table = build_table(num_years, deferment_years, interest_rate, initial_balance)
+    missing_cell = None
 
     # Randomly blank out one cell in the table
-    columns = ["UB", "Int", "UIB", "AO", "Ad", "IPmt", "PPmt", "UIA", "UBA"]
-    # Exclude critical columns (UB, Int, Ad) from being blanked
-    columns = ["UIB", "AO", "IPmt", "PPmt", "UIA", "UBA"]
-    random_row = random.choice(table) if table else {}
-    blank_column = random.choice(columns) if random_row else None
+    random_row = rng.choice(table) if table else {}
+    blank_column = rng.choice(BLANKABLE_COLUMNS) if random_row else None
 
     if random_row and blank_column:
         missing_cell = {
@@ -66,6 +98,69 @@ def generate_table():
         }
         random_row[blank_column] = None
 
-    print("DF", deferment_years)
+    return table, missing_cell, deferment_years
+
+
+def generate_tables(n, seed=None):
+    """
+    Generate n loan tables at once as NumPy arrays.
+    :param n: Number of loans to generate.
+    :param seed: Optional seed for numpy's random generator (reproducible batches).
+    :return: A dict of per-loan parameter arrays of shape (n,), a "cents" dict holding one
+             (n, MAX_YEARS) int64 array per table column, and a "columns" dict with the same
+             values in dollars. Years past a loan's num_years are 0 in "cents" and NaN in
+             "columns". The blank cell of loan k is (blank_year[k], BLANKABLE_COLUMNS[blank_column[k]]).
+    """
+    rng = np.random.default_rng(seed)
+    num_years = rng.integers(4, MAX_YEARS + 1, size=n)
+    deferment_years = rng.integers(1, num_years - 1)  # 1 .. num_years - 2
+    rate_bp = rng.integers(5, 16, size=n) * 100
+    principal_cents = rng.integers(1, 21, size=n) * 100000
+
+    payment = payment_cents_array(principal_cents, rate_bp, deferment_years, num_years - deferment_years)
+
+    years = {column: [] for column in COLUMNS}
+    ub_previous = principal_cents
+    uia_previous = np.zeros(n, dtype=np.int64)
+
+    # Same row recurrence as schedule_cents(), vectorized across loans
+    for index in range(MAX_YEARS):
+        year = index + 1
+        ub = ub_previous
+        interest = interest_cents(ub_previous, rate_bp)
+        uib = interest + uia_previous
+        ao = ub + interest
+        ad = np.where(year <= deferment_years, 0, payment)
+        ipmt = np.minimum(uib, ad)
+        ppmt = ad - ipmt
+        uia = uib - ipmt
+        uba = ao - ad
+
+        for column, values in zip(COLUMNS, (ub, interest, uib, ao, ad, ipmt, ppmt, uia, uba)):
+            years[column].append(values)
+
+        ub_previous = uba
+        uia_previous = uia
+
+    # One (n, MAX_YEARS) array per column, with the years past each loan's term cleared
+    active = np.arange(1, MAX_YEARS + 1) <= num_years[:, None]
+    cents, columns = {}, {}
+    for column, values in years.items():
+        cents[column] = np.where(active, np.stack(values, axis=1), 0)
+        columns[column] = np.where(active, from_cents(cents[column]), np.nan)
+
+    # Randomly choose one blank cell per loan
+    blank_year = rng.integers(1, num_years + 1)
+    blank_column = rng.integers(0, len(BLANKABLE_COLUMNS), size=n)
 
-    return table, missing_cell, deferment_years
\ No newline at end of file
+    return {
+        "num_years": num_years,
+        "deferment_years": deferment_years,
+        "interest_rate": rate_bp / BP_PER_UNIT,
+        "initial_balance": from_cents(principal_cents),
+        "loan_payment": from_cents(payment),
+        "cents": cents,
+        "columns": columns,
+        "blank_year": blank_year,
+        "blank_column": blank_column,
+    }
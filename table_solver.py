@@ -0,0 +1,113 @@
+"""
+Per-cell solver for single cells of a loan table.
+
+generate_table() builds a whole schedule as a list of dicts. The functions here compute any (year, column)
+cell from the loan parameters alone, in integer cents with exactly the rounding of the generator and of
+run.py's answer validation (see cents.py):
+
+    A      = payment_cents(principal, i, deferment_years, num_years - deferment_years)   (exact, closed form)
+    row(y) = schedule_row_cents(UBA(y - 1), UIA(y - 1), i, 0 if y <= deferment_years else A)
+
+Interest is rounded to the cent every year and the rounded balance is carried into the next year, so the
+balance depends on every earlier rounding and has no exact closed form. The solver therefore carries the
+balance and unpaid interest forward from year 1 (at most MAX_YEARS integer steps) and stops at the
+requested year, without building the table.
+
+cents.py is the single source of truth for table values, and check_batch() (run by this module's CLI)
+asserts that its three users agree cell for cell and to the cent: the vectorized generate_tables(), the
+row-by-row build_table() behind generate_table(), and this solver.
+"""
+import argparse
+
+from cents import from_cents, payment_cents, rate_to_bp, to_cents
+from table_generator import COLUMNS, build_table, generate_tables, schedule_row_cents
+
+
+def loan_payment(num_years, deferment_years, interest_rate, initial_balance):
+    """Annual payment (A) in dollars, as used in every repayment year."""
+    return from_cents(payment_cents(to_cents(initial_balance), rate_to_bp(interest_rate), deferment_years,
+                                    num_years - deferment_years))
+
+
+def solve_row_cents(num_years, deferment_years, rate_bp, principal_cents, year):
+    """Return the row for one year as a tuple of integer cents in COLUMNS order."""
+    if not 1 <= year <= num_years:
+        raise ValueError(f"Year must be between 1 and {num_years}, got {year}")
+
+    payment = payment_cents(principal_cents, rate_bp, deferment_years, num_years - deferment_years)
+    ub, uia = principal_cents, 0
+    for y in range(1, year + 1):
+        row = schedule_row_cents(ub, uia, rate_bp, 0 if y <= deferment_years else payment)
+        ub, uia = row[-1], row[-2]
+    return row
+
+
+def solve_row(num_years, deferment_years, interest_rate, initial_balance, year):
+    """Return the full row for one year (same keys as a generate_table() row) without building the table."""
+    cells = solve_row_cents(num_years, deferment_years, rate_to_bp(interest_rate), to_cents(initial_balance), year)
+    row = {"Year": year}
+    for column, value in zip(COLUMNS, cells):
+        row[column] = from_cents(value)
+    return row
+
+
+def solve_cell(num_years, deferment_years, interest_rate, initial_balance, year, column):
+    """Compute one cell of the loan table (e.g. year 3, "PPmt")."""
+    if column not in COLUMNS:
+        raise ValueError(f"Unknown column: {column}")
+    return solve_row(num_years, deferment_years, interest_rate, initial_balance, year)[column]
+
+
+def check_consistency(num_years, deferment_years, interest_rate, initial_balance, tolerance_cents=0,
+                      batch_cents=None):
+    """
+    Compare the solver with build_table() for one loan.
+    :param batch_cents: Optional {column: cents by year} of the same loan from generate_tables(), compared too.
+    :return: (max absolute difference in cents, True if every cell is within tolerance_cents)
+    """
+    table = build_table(num_years, deferment_years, interest_rate, initial_balance)
+    rate_bp, principal_cents = rate_to_bp(interest_rate), to_cents(initial_balance)
+    max_difference = 0
+    for row in table:
+        year = row["Year"]
+        solved = solve_row_cents(num_years, deferment_years, rate_bp, principal_cents, year)
+        for column, value in zip(COLUMNS, solved):
+            max_difference = max(max_difference, abs(value - to_cents(row[column])))
+            if batch_cents is not None:
+                max_difference = max(max_difference, abs(value - int(batch_cents[column][year - 1])))
+    return max_difference, max_difference <= tolerance_cents
+
+
+def check_batch(batch, tolerance_cents=0):
+    """
+    Check that the three paths computing table values agree for every loan of a generate_tables() batch:
+    the vectorized batch itself, build_table() row by row, and the solver.
+    :return: (max absolute difference in cents, number of loans with a cell outside tolerance_cents)
+    """
+    worst, failures = 0, 0
+    for k in range(len(batch["num_years"])):
+        difference, ok = check_consistency(
+            int(batch["num_years"][k]),
+            int(batch["deferment_years"][k]),
+            float(batch["interest_rate"][k]),
+            float(batch["initial_balance"][k]),
+            tolerance_cents,
+            {column: values[k] for column, values in batch["cents"].items()},
+        )
+        worst = max(worst, difference)
+        failures += not ok
+    return worst, failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check that generate_tables(), build_table() and the per-cell solver produce the same tables."
+    )
+    parser.add_argument("--loans", type=int, default=10000, help="Number of random loans to check")
+    parser.add_argument("--tolerance", type=int, default=0, help="Allowed difference per cell (cents)")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    worst, failures = check_batch(generate_tables(args.loans, seed=args.seed), args.tolerance)
+    print(f"Checked {args.loans} loans: max difference {worst} cents, {failures} outside {args.tolerance} cents.")
+    raise SystemExit(1 if failures else 0)
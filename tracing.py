@@ -0,0 +1,198 @@
+"""
+Lightweight request tracing and Prometheus metrics.
+
+- span("name") times a stage of a request; durations go into a histogram labelled by route and stage.
+- init_app(app) times every request (histogram + counter by route, method and status) and serves all
+  metrics in the Prometheus text format at /metrics.
+- log_sampled() emits verbose debug output (prompts, model responses) for only a sample of calls,
+  and costs nothing when debug logging is off.
+
+Metrics are kept per process; with several gunicorn workers each worker reports its own values.
+"""
+import bisect
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds (upper bounds; +Inf is implicit)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "0.01"))
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                    cumulative += count
+                    labels = _format_labels(self.label_names, label_values, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.label_names, label_values)
+                lines.append(f"{self.name}_sum{labels} {series[-1]}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """A gauge whose value is read from a callback at scrape time (a number, or {label values: number})."""
+
+    def __init__(self, name, help_text, callback, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+        self.label_names = tuple(label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        value = self.callback()
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        for label_values, number in sorted(items):
+            if not isinstance(label_values, tuple):
+                label_values = (label_values,)
+            lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {number}")
+        return lines
+
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def _register(metric):
+    with _metrics_lock:
+        return _metrics.setdefault(metric.name, metric)
+
+
+def counter(name, help_text, label_names=()):
+    return _register(Counter(name, help_text, label_names))
+
+
+def histogram(name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram(name, help_text, label_names, buckets))
+
+
+def gauge(name, help_text, callback, label_names=()):
+    return _register(Gauge(name, help_text, callback, label_names))
+
+
+def render_metrics():
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    with _metrics_lock:
+        metrics = list(_metrics.values())
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+REQUEST_DURATION = histogram(
+    "ie201_request_duration_seconds", "Time spent handling a request.", ("route", "method", "status")
+)
+REQUESTS = counter("ie201_requests_total", "Requests handled.", ("route", "method", "status"))
+STAGE_DURATION = histogram(
+    "ie201_stage_duration_seconds", "Time spent in a named stage of a request.", ("route", "stage")
+)
+
+
+def _current_route():
+    try:
+        from flask import has_request_context, request
+    except ImportError:
+        return "none"
+    if not has_request_context():
+        return "none"
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+
+@contextmanager
+def span(stage):
+    """Time a named stage (e.g. "generate_table", "db_commit") of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_DURATION.observe(time.perf_counter() - start, _current_route(), stage)
+
+
+def log_sampled(logger, message, *args, rate=None):
+    """Log a verbose debug message for only a sample (LOG_SAMPLE_RATE) of calls."""
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < (LOG_SAMPLE_RATE if rate is None else rate):
+        logger.debug(message, *args)
+
+
+def init_app(app):
+    """Time every request and expose the metrics at /metrics."""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_timer():
+        g._request_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop("_request_start", None)
+        if start is not None:
+            labels = (_current_route(), request.method, str(response.status_code))
+            REQUEST_DURATION.observe(time.perf_counter() - start, *labels)
+            REQUESTS.inc(*labels)
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,99 @@
+"""
+Vectorized cash flow valuation.
+
+Interest factors follow the standard Engineering Economy notation; every function accepts scalars
+or NumPy arrays (broadcast together), so thousands of problems can be valued in one call.
+
+    (P/F, i, n) = (1 + i) ** -n
+    (F/P, i, n) = (1 + i) ** n
+    (P/A, i, n) = ((1 + i) ** n - 1) / (i * (1 + i) ** n)
+    (F/A, i, n) = ((1 + i) ** n - 1) / i
+    (P/G, i, n) = ((1 + i) ** n - i * n - 1) / (i ** 2 * (1 + i) ** n)
+    (P/A1, g, i, n) = (1 - ((1 + g) / (1 + i)) ** n) / (i - g)       (geometric gradient)
+"""
+import numpy as np
+
+
+def _zero_safe(i):
+    """Replace zero rates by 1 so closed forms can be evaluated; callers patch the zero-rate limit in."""
+    return np.where(i == 0, 1.0, i)
+
+
+def pf(i, n):
+    return (1 + np.asarray(i, dtype=float)) ** -np.asarray(n, dtype=float)
+
+
+def fp(i, n):
+    return (1 + np.asarray(i, dtype=float)) ** np.asarray(n, dtype=float)
+
+
+def pa(i, n):
+    i, n = np.asarray(i, dtype=float), np.asarray(n, dtype=float)
+    safe = _zero_safe(i)
+    return np.where(i == 0, n, ((1 + safe) ** n - 1) / (safe * (1 + safe) ** n))
+
+
+def fa(i, n):
+    i, n = np.asarray(i, dtype=float), np.asarray(n, dtype=float)
+    safe = _zero_safe(i)
+    return np.where(i == 0, n, ((1 + safe) ** n - 1) / safe)
+
+
+def pg(i, n):
+    i, n = np.asarray(i, dtype=float), np.asarray(n, dtype=float)
+    safe = _zero_safe(i)
+    return np.where(i == 0, n * (n - 1) / 2, ((1 + safe) ** n - safe * n - 1) / (safe ** 2 * (1 + safe) ** n))
+
+
+def pa1_geometric(g, i, n):
+    g, i, n = np.asarray(g, dtype=float), np.asarray(i, dtype=float), np.asarray(n, dtype=float)
+    same = i == g
+    difference = np.where(same, 1.0, i - g)
+    return np.where(same, n / (1 + i), (1 - ((1 + g) / (1 + i)) ** n) / difference)
+
+
+# -------------------------
+# Series values (P at period 0, or F at period n)
+# -------------------------
+def uniform_value(A, i, n, future=False):
+    """Value of A at the end of each of periods 1..n."""
+    present = A * pa(i, n)
+    return present * fp(i, n) if future else present
+
+
+def gradient_value(G, i, n, future=False):
+    """Value of the arithmetic gradient 0, G, 2G, ..., (n - 1)G at the end of periods 1..n."""
+    present = G * pg(i, n)
+    return present * fp(i, n) if future else present
+
+
+def geometric_value(A1, g, i, n, future=False):
+    """Value of A1, A1(1 + g), ..., A1(1 + g) ** (n - 1) at the end of periods 1..n."""
+    present = A1 * pa1_geometric(g, i, n)
+    return present * fp(i, n) if future else present
+
+
+def irregular_value(cash_flows, i, n=None, future=False):
+    """
+    Value of an arbitrary series by discounting each cash flow.
+    :param cash_flows: Array of shape (periods,) or (problems, periods); column t is the flow at period t.
+    :param i: Interest rate, scalar or shape (problems,).
+    :param n: Period at which F is taken (defaults to the last column), scalar or shape (problems,).
+    """
+    cash_flows = np.asarray(cash_flows, dtype=float)
+    i = np.asarray(i, dtype=float)
+    periods = np.arange(cash_flows.shape[-1])
+    discount = (1 + i[..., None]) ** -periods  # (problems, periods) discount vectors
+    present = np.sum(cash_flows * discount, axis=-1)
+    if not future:
+        return present
+    horizon = cash_flows.shape[-1] - 1 if n is None else n
+    return present * fp(i, horizon)
+
+
+def cash_flows_to_array(cash_flows):
+    """Convert a {period: amount} dict (as on gen_q.Problem) to an array indexed by period."""
+    values = np.zeros(max(cash_flows) + 1 if cash_flows else 1)
+    for period, amount in cash_flows.items():
+        values[period] = amount
+    return values